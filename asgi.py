@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+from a2wsgi import WSGIMiddleware
+
+
+class LazyWsgiApp:
+    """Application ASGI servant l'application Flask de `server` avec a2wsgi.
+
+    `server` (file de tâches, pool de processus, proxies, métriques) n'est importé qu'au démarrage
+    de chaque worker uvicorn, jamais par le processus superviseur de `python asgi.py` : la file de
+    tâches et les métriques vivent ainsi dans un processus qui sert aussi les requêtes.
+
+    Le corps des requêtes est lu au fil de sa réception par la vue (un doublon signalé par 208 n'est
+    pas mis de côté), et les vues s'exécutent dans un pool de `ASGI_THREADS` threads.
+    """
+
+    def __init__(self):
+        self._app = None
+
+    def _load(self) -> WSGIMiddleware:
+        if self._app is None:
+            import server
+            self._app = WSGIMiddleware(server.app, workers=server.ASGI_THREADS)
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await asyncio.get_running_loop().run_in_executor(None, self._load)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        await self._load()(scope, receive, send)
+
+
+app = LazyWsgiApp()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    from dotenv import load_dotenv
+
+    # Configuration lue sans importer `server` (voir LazyWsgiApp) ; chaque worker importe `asgi:app`
+    # et un seul d'entre eux exécute la file de tâches : les jetons des téléchargements demandés à
+    # un autre worker lui parviennent par la base des tâches (voir JobQueue)
+    load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+    uvicorn.run("asgi:app", host=os.environ.get("HOST", "127.0.0.1"), port=int(os.environ.get("PORT", 5000)),
+                workers=int(os.environ.get("WEB_WORKERS", 1)))
@@ -0,0 +1,202 @@
+import hashlib
+import io
+import json
+import os
+import textwrap
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from fetch_ledger import conditional_headers
+
+
+def convert_to_png(data: bytes) -> bytes:
+    # Pillow est importé à la première conversion (le plus souvent dans un processus du pool)
+    from PIL import Image
+
+    # Convert to PNG as not all EPUB readers support other formats like WEBP even though EPUB standard allows it
+    im = Image.open(io.BytesIO(data))
+    png_im = io.BytesIO()
+    im.convert("RGB").save(png_im, format="PNG")
+    return png_im.getvalue()
+
+
+def convert_keeping_format(data: bytes) -> bytes:
+    """Garde les PNG/JPEG/GIF tels quels, convertit les autres formats (WEBP...) en JPEG."""
+    from PIL import Image
+
+    im = Image.open(io.BytesIO(data))
+    if im.format in ("PNG", "JPEG", "GIF"):
+        return data
+    jpeg_im = io.BytesIO()
+    im.convert("RGB").save(jpeg_im, format="JPEG", quality=90)
+    return jpeg_im.getvalue()
+
+
+def _ascii(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def generate_cover(title: str, subtitle: str = "", font: str = "DejaVuSans.ttf") -> bytes:
+    """Couverture PNG générée (titre et sous-titre sur un fond dérivé du titre), faute de couverture fournie.
+
+    `font` est une police TrueType (nom ou chemin) ; à défaut, la police intégrée à Pillow est utilisée.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    digest = hashlib.sha256(title.encode("utf-8")).digest()
+    im = Image.new("RGB", (600, 900), tuple(40 + value % 100 for value in digest[:3]))
+    draw = ImageDraw.Draw(im)
+    try:
+        (title_font, subtitle_font) = (ImageFont.truetype(font, 56), ImageFont.truetype(font, 36))
+    except OSError:
+        # Police intégrée à Pillow, sans accents : texte ramené à l'ASCII
+        (title, subtitle) = (_ascii(title), _ascii(subtitle))
+        try:
+            (title_font, subtitle_font) = (ImageFont.load_default(56), ImageFont.load_default(36))
+        except TypeError:  # Pillow < 10.1 : police bitmap de taille fixe
+            title_font = subtitle_font = ImageFont.load_default()
+    draw.multiline_text((300, 380), "\n".join(textwrap.wrap(title, 18)) or " ", font=title_font,
+                        fill="white", anchor="mm", align="center", spacing=12)
+    if subtitle:
+        draw.multiline_text((300, 720), "\n".join(textwrap.wrap(subtitle, 26)), font=subtitle_font,
+                            fill="white", anchor="mm", align="center", spacing=8)
+    cover = io.BytesIO()
+    im.save(cover, format="PNG")
+    return cover.getvalue()
+
+
+def image_extension(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    if data.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if data.startswith(b"GIF8"):
+        return "gif"
+    raise ValueError("Format d'image non supporté")
+
+
+class AssetCache:
+    """Cache disque adressé par contenu des images déjà converties (couvertures, illustrations).
+
+    - `objects/` contient les images converties, nommées d'après le SHA-256 des octets source
+      et la variante de conversion ;
+    - `urls/` associe le SHA-256 d'une URL source au SHA-256 de ses octets et à ses validateurs
+      HTTP (ETag, Last-Modified), pour éviter de retélécharger une image déjà connue ou la
+      revérifier par requête conditionnelle.
+
+    Les fichiers les moins récemment utilisés sont supprimés au-delà de `max_bytes`.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        (self.root / "urls").mkdir(parents=True, exist_ok=True)
+        # Taille des objets, calculée au premier ajout (et non au démarrage, quelle que soit la taille du cache)
+        self._size: Optional[int] = None
+
+    def _object_path(self, source_sha256: str, variant: str) -> Path:
+        return self.root / "objects" / source_sha256[:2] / f"{source_sha256}.{variant}"
+
+    def _url_path(self, url: str) -> Path:
+        url_sha256 = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / "urls" / url_sha256[:2] / url_sha256
+
+    def _url_entry(self, url: str) -> Optional[dict]:
+        content = self._read(self._url_path(url))
+        if content is None:
+            return None
+        try:
+            entry = json.loads(content)
+        except ValueError:
+            entry = None
+        # Ancien format : SHA-256 seul, sans validateurs
+        return entry if isinstance(entry, dict) else {"sha256": content.decode()}
+
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def get(self, variant: str, convert: Callable[[bytes], bytes], data: Optional[bytes] = None,
+            url: Optional[str] = None, fetch: Optional[Callable[[str, dict], Tuple[Optional[bytes], dict]]] = None,
+            revalidate: bool = False) -> bytes:
+        """Renvoie l'image convertie par `convert`, depuis le cache si possible.
+
+        L'image source est donnée soit directement (`data`), soit par son `url`, téléchargée avec
+        `fetch(url, en-têtes)` (qui renvoie le contenu, ou None si inchangé (304), et les
+        validateurs HTTP) si l'URL n'a encore jamais été vue. Avec `revalidate`, une URL connue
+        est revérifiée par requête conditionnelle.
+        """
+        validators = {}
+        if data is None and url is not None:
+            entry = self._url_entry(url)
+            converted = self._read(self._object_path(entry["sha256"], variant)) if entry is not None else None
+            if converted is not None and not revalidate:
+                return converted
+            (data, validators) = fetch(url, conditional_headers(entry) if converted is not None else {})
+            if data is None:
+                return converted
+
+        source_sha256 = hashlib.sha256(data).hexdigest()
+        if url is not None:
+            self._write(self._url_path(url), json.dumps({"sha256": source_sha256, **validators}).encode())
+
+        object_path = self._object_path(source_sha256, variant)
+        converted = self._read(object_path)
+        if converted is not None:
+            return converted
+
+        converted = convert(data)
+        self._write(object_path, converted)
+        with self._lock:
+            self._size = self._size + len(converted) if self._size is not None else self._disk_size()
+            if self._size > self.max_bytes:
+                self._evict()
+        return converted
+
+    def _disk_size(self) -> int:
+        size = 0
+        for file in (self.root / "objects").glob("*/*"):
+            try:
+                size += file.stat().st_size
+            except OSError:
+                pass
+        return size
+
+    def _evict(self):
+        """Supprime les objets les plus anciens jusqu'à repasser sous 90% de `max_bytes`."""
+        objects = []
+        for file in (self.root / "objects").glob("*/*"):
+            try:
+                stat = file.stat()
+            except OSError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, file))
+        objects.sort()
+
+        self._size = sum(size for (_, size, _) in objects)
+        for (_, size, file) in objects:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                file.unlink()
+                self._size -= size
+            except OSError:
+                pass
@@ -0,0 +1,101 @@
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cdn import sample_png  # noqa: E402
+from chapter_index import record_chapter  # noqa: E402
+from css_cache import parse_obfuscating_classes  # noqa: E402
+from deobfuscation import deobfuscate_chapter  # noqa: E402
+from epub_merge import manifest_path, merge_volume, merged_volume_stats  # noqa: E402
+from epub_writer import CompressionPolicy  # noqa: E402
+from fixtures import chapter_html, class_names, obfuscation_css  # noqa: E402
+from uploads import ChapterUpload  # noqa: E402
+
+
+def build_volume(volume_folder: Path, chapters: int, images: int, compression: CompressionPolicy):
+    """Volume synthétique : chapitres désobfusqués avec `images` images PNG distinctes chacun."""
+    obfuscating = class_names(400, seed=1)
+    decoys = class_names(40, seed=2)
+    classes = parse_obfuscating_classes(obfuscation_css(obfuscating))
+    cover = sample_png(64)
+    for number in range(1, chapters + 1):
+        image_names = [f"{number}-{index}.png" for index in range(images)]
+        (html, _) = deobfuscate_chapter(chapter_html(number, obfuscating, decoys, image_urls=[
+            f"images/{name}" for name in image_names]), classes)
+        metadata = {
+            "title": f"Chapitre {number}",
+            "collections": [{"name": "Bench compression", "number": f"1.{str(number).zfill(len(str(chapters)))}", "type": "series"}],
+            "creators": [{"name": "Auteur", "role": "aut"}],
+            "lang": "fr",
+        }
+        file_path = volume_folder / f"Chapitre {number}.epub"
+        upload = ChapterUpload(file_path, compression)
+        for name in image_names:
+            upload.add_image(name, sample_png())
+        upload.commit(metadata, html, cover)
+        record_chapter(file_path, metadata)
+
+
+def run(volume_folder: Path, compression: CompressionPolicy, threads: int) -> dict:
+    """Fusion complète puis incrémentale (un chapitre ajouté) du volume avec une politique donnée."""
+    for path in [manifest_path(volume_folder), volume_folder.parent / f"{volume_folder.name}.epub"]:
+        if path.exists():
+            path.unlink()
+
+    start = time.perf_counter()
+    output_path = merge_volume(volume_folder, compression=compression, compression_threads=threads)
+    full = time.perf_counter() - start
+    full_stats = merged_volume_stats(volume_folder)
+    size = output_path.stat().st_size
+
+    added = volume_folder / "Chapitre 0.epub"
+    shutil.copyfile(volume_folder / "Chapitre 1.epub", added)
+    try:
+        start = time.perf_counter()
+        merge_volume(volume_folder, compression=compression, compression_threads=threads)
+        incremental = time.perf_counter() - start
+    finally:
+        added.unlink()
+    return {"full": full, "incremental": incremental, "size": size, "stats": full_stats,
+            "incremental_stats": merged_volume_stats(volume_folder)}
+
+
+def entries_summary(stats: dict) -> str:
+    return "  ".join(f"{kind} {entries['copied']}/{entries['entries']} copied {entries['seconds']:.2f}s"
+                     for (kind, entries) in stats["entries"].items() if entries["entries"] > 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare les politiques de compression et le nombre de threads pour la fusion d'un volume.")
+    parser.add_argument("-c", "--chapters", type=int, default=200)
+    parser.add_argument("-i", "--images", type=int, default=1,
+                        help="images (PNG distinctes) par chapitre")
+    parser.add_argument("-p", "--policies", default="images=stored;images=deflate;text=deflate:1;text=deflate:9",
+                        help="politiques comparées, séparées par des points-virgules (voir epub_writer.CompressionPolicy)")
+    parser.add_argument("-t", "--threads", default="0,2,4",
+                        help="nombres de threads de compression, séparés par des virgules")
+    parser.add_argument("--chapter-compression", type=CompressionPolicy, default=CompressionPolicy(),
+                        help="politique des EPUB de chapitres (celle des chapitres existants, par exemple 'images=deflate')")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="epub-compression-") as root:
+        volume_folder = Path(root) / "Bench compression" / "Volume 1"
+        volume_folder.mkdir(parents=True)
+        start = time.perf_counter()
+        build_volume(volume_folder, args.chapters, args.images, args.chapter_compression)
+        print(f"{args.chapters} chapters ({args.chapter_compression}) built in {time.perf_counter() - start:.2f}s")
+
+        for spec in args.policies.split(";"):
+            compression = CompressionPolicy(spec)
+            for threads in map(int, args.threads.split(",")):
+                result = run(volume_folder, compression, threads)
+                print(f"{str(compression):>50} {threads:2} threads: full {result['full']:7.2f}s  "
+                      f"incremental {result['incremental']:7.2f}s  {result['size'] / 2 ** 20:8.2f} MB")
+                print(f"{'':>50}   full: {entries_summary(result['stats'])}")
+                print(f"{'':>50}   incremental: {entries_summary(result['incremental_stats'])}")
@@ -0,0 +1,87 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from css_cache import ObfuscationCss, parse_obfuscating_classes  # noqa: E402
+from deobfuscation import deobfuscate_chapter, deobfuscate_chapter_soup  # noqa: E402
+from fixtures import chapter_html, class_names, obfuscation_css  # noqa: E402
+
+
+def load_samples(folder: Path):
+    """Chapitres réels : `<nom>.html` avec `<nom>.css`, ou un unique `.css` commun au dossier."""
+    css_files = sorted(folder.glob("*.css"))
+    samples = []
+    for html_file in sorted(folder.glob("*.html")):
+        css_file = html_file.with_suffix(".css")
+        if not css_file.exists():
+            if len(css_files) != 1:
+                raise SystemExit(f"no stylesheet for {html_file}")
+            css_file = css_files[0]
+        samples.append((html_file.name, html_file.read_text(encoding="utf-8"),
+                        parse_obfuscating_classes(css_file.read_text(encoding="utf-8"))))
+    return samples
+
+
+def synthetic_samples(count: int):
+    obfuscating = class_names(400, seed=1)
+    decoys = class_names(40, seed=2)
+    classes = parse_obfuscating_classes(obfuscation_css(obfuscating))
+    return [(f"synthetic-{index}", chapter_html(index, obfuscating, decoys, image_urls=[f"https://images.example/{index}.webp"]), classes)
+            for index in range(count)]
+
+
+def measure(function, samples, argument, rounds: int):
+    durations = []
+    results = []
+    for _ in range(rounds):
+        for (_, html, classes) in samples:
+            start = time.perf_counter()
+            results.append(function(html, argument(classes)))
+            durations.append(time.perf_counter() - start)
+    return durations, results[:len(samples)]
+
+
+def report(name: str, durations, total_bytes: int):
+    ordered = sorted(durations)
+    total = sum(durations)
+    print(f"{name:>8}: {len(durations) / total:8.1f} chapters/s  {total_bytes / total / 1e6:6.2f} MB/s  "
+          f"p50 {statistics.median(ordered) * 1000:6.2f}ms  p99 {ordered[int(len(ordered) * 0.99) - 1] * 1000:6.2f}ms")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare le désobfuscateur en flux à l'implémentation BeautifulSoup.")
+    parser.add_argument("-s", "--samples", type=Path,
+                        help="dossier de chapitres réels (.html + .css) ; synthétiques sinon")
+    parser.add_argument("-c", "--count", type=int, default=50,
+                        help="nombre de chapitres synthétiques")
+    parser.add_argument("-r", "--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples) if args.samples else synthetic_samples(args.count)
+    total_bytes = sum(len(html.encode("utf-8")) for (_, html, _) in samples) * args.rounds
+    selectors = {}
+
+    def soup_selector(classes):
+        if classes not in selectors:
+            selectors[classes] = ObfuscationCss(classes).selector
+        return selectors[classes]
+
+    (soup_durations, soup_results) = measure(deobfuscate_chapter_soup, samples, soup_selector, args.rounds)
+    (stream_durations, stream_results) = measure(deobfuscate_chapter, samples, lambda classes: classes, args.rounds)
+
+    print(f"{len(samples)} chapters x {args.rounds} rounds")
+    soup_total = report("soup", soup_durations, total_bytes)
+    stream_total = report("stream", stream_durations, total_bytes)
+    print(f"speedup: x{soup_total / stream_total:.2f}")
+
+    mismatches = [name for ((name, _, _), soup_result, stream_result)
+                  in zip(samples, soup_results, stream_results) if soup_result != stream_result]
+    for name in mismatches:
+        print(f"output differs: {name}")
+    raise SystemExit(1 if len(mismatches) > 0 else 0)
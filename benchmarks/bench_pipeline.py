@@ -0,0 +1,261 @@
+import argparse
+import base64
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cdn import StandInCdn, sample_png  # noqa: E402
+
+STAGES = ["build", "dump", "merge", "merge-incremental", "listing", "listing-cached"]
+# Métriques comparées à la référence : (nom, une hausse est une régression)
+COMPARED_METRICS = [("throughput", False), ("p50", True), ("p99", True), ("peak_rss", True), ("bytes_written", True)]
+
+
+class PeakRssSampler:
+    """Échantillonne le RSS du processus (Linux : /proc/self/statm) pour en garder le maximum."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+
+def folder_size(folder: Path) -> int:
+    return sum(file.stat().st_size for file in folder.rglob("*") if file.is_file())
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def measure_stage(root: Path, run) -> dict:
+    """Exécute `run()` (qui renvoie la liste des latences, en secondes) et mesure l'étape."""
+    size_before = folder_size(root)
+    with PeakRssSampler() as sampler:
+        start = time.perf_counter()
+        latencies = run()
+        duration = time.perf_counter() - start
+    return {
+        "items": len(latencies),
+        "duration": duration,
+        "throughput": len(latencies) / duration if duration > 0 else 0,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 0.99),
+        "peak_rss": sampler.peak,
+        "bytes_written": max(0, folder_size(root) - size_before),
+    }
+
+
+def run_scenario(chapters: int, images: int, root: Path) -> dict:
+    """Exécute toutes les étapes pour un volume de `chapters` chapitres (processus dédié)."""
+    cdn = StandInCdn(images_per_chapter=images).start()
+    os.environ.update({
+        "EPUB_ROOT_FOLDER": str(root),
+        "DATA_FOLDER": str(root / ".data"),
+        "CHAPTER_CDN_URL": cdn.chapter_url,
+        "JOB_WORKERS": "0",
+        "CSS_CACHE_FILE": "",
+    })
+    os.environ.pop("PROXY_API_URL", None)
+    import server
+
+    cover = "data:image/png;base64," + base64.b64encode(sample_png(64)).decode("ascii")
+    png = sample_png()
+    client = server.app.test_client()
+    results = {}
+
+    def build():
+        latencies = []
+        for number in range(1, chapters + 1):
+            metadata = {
+                "title": f"Chapitre {number}",
+                "collections": [{"name": "Bench build", "number": "1", "type": "series"}],
+                "creators": [{"name": "Auteur", "role": "aut"}],
+                "description": "Benchmark",
+                "lang": "fr",
+                "subjects": ["benchmark"],
+                "volumeName": "Volume 1",
+                "cover": cover,
+            }
+            files = {
+                "chapter": (io.BytesIO(cdn.chapter(number).encode("utf-8")), "chapter.html", "text/html"),
+                "metadata": (io.BytesIO(json.dumps(metadata).encode("utf-8")), "metadata.json", "application/json"),
+            }
+            for index in range(images):
+                files[f"image{index}"] = (io.BytesIO(png), f"{index}.png", "image/png")
+            start = time.perf_counter()
+            response = client.post("/", data=files, content_type="multipart/form-data")
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 202:
+                raise Exception(f"buildEpub returned {response.status_code}")
+        return latencies
+
+    volume_folder = root / "Bench dump" / "Volume 1"
+    volume_folder.mkdir(parents=True, exist_ok=True)
+
+    def dump():
+        metadata = {
+            "collections": [{"name": "Bench dump", "number": "1", "type": "series"}],
+            "creators": [{"name": "Auteur", "role": "aut"}],
+            "description": "Benchmark",
+            "lang": "fr",
+            "subjects": ["benchmark"],
+            "cover": f"{cdn.url}/images/cover.png",
+            "chapters": [f"bench/volume-1/{quote(f'Chapitre {number}')}" for number in range(1, chapters + 1)],
+        }
+        # Latence d'un chapitre : intervalle entre deux chapitres écrits
+        marks = [time.perf_counter()]
+        server.dumpEpubFromVolumeMetadata("Bench dump", "Volume 1", metadata, volume_folder, chapter_count=chapters,
+                                          progress=lambda done, total: marks.append(time.perf_counter()))
+        return [end - start for (start, end) in zip(marks, marks[1:])]
+
+    def merge():
+        start = time.perf_counter()
+        server._run_book_merging(volume_folder)
+        return [time.perf_counter() - start]
+
+    def merge_incremental():
+        shutil.copyfile(volume_folder / "Chapitre 1.epub", volume_folder / f"Chapitre {chapters + 1}.epub")
+        return merge()
+
+    def listing(cached: bool):
+        latencies = []
+        for _ in range(50):
+            if not cached:
+                server.listing_cache.invalidate(volume_folder)
+            start = time.perf_counter()
+            response = client.get("/Bench dump/Volume 1/")
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise Exception(f"dir_listing returned {response.status_code}")
+        return latencies
+
+    stages = {
+        "build": build,
+        "dump": dump,
+        "merge": merge,
+        "merge-incremental": merge_incremental,
+        "listing": lambda: listing(False),
+        "listing-cached": lambda: listing(True),
+    }
+    try:
+        for stage in STAGES:
+            results[stage] = measure_stage(root, stages[stage])
+        results["cdn"] = {"requests": cdn.requests, "bytes_sent": cdn.bytes_sent}
+    finally:
+        cdn.stop()
+        server.process_pool.shutdown()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    """Affiche l'écart à la référence ; renvoie le nombre de régressions au-delà de `threshold`."""
+    regressions = 0
+    for (scenario, stages) in results.items():
+        for stage in STAGES:
+            if stage not in stages or stage not in baseline.get(scenario, {}):
+                continue
+            changes = []
+            for (metric, higher_is_worse) in COMPARED_METRICS:
+                (before, after) = (baseline[scenario][stage][metric], stages[stage][metric])
+                if before == 0:
+                    continue
+                change = (after - before) / before
+                worse = change > threshold if higher_is_worse else change < -threshold
+                if worse:
+                    regressions += 1
+                changes.append(f"{metric} {change:+.1%}{' !' if worse else ''}")
+            print(f"{scenario:>16} {stage:>18}: {'  '.join(changes)}")
+    return regressions
+
+
+def print_results(results: dict):
+    for (scenario, stages) in results.items():
+        print(f"{scenario}: {stages['cdn']['requests']} CDN requests, {stages['cdn']['bytes_sent'] / 1e6:.1f} MB served")
+        for stage in STAGES:
+            result = stages[stage]
+            print(f"  {stage:>18}: {result['items']:6} items in {result['duration']:8.2f}s  "
+                  f"{result['throughput']:9.1f}/s  p50 {result['p50'] * 1000:8.2f}ms  p99 {result['p99'] * 1000:8.2f}ms  "
+                  f"peak RSS {result['peak_rss'] / 2 ** 20:7.1f} MB  written {result['bytes_written'] / 2 ** 20:8.2f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark hors ligne de la chaîne chapitres -> volume (buildEpub, dump, fusion, listing).")
+    parser.add_argument("-s", "--sizes", default="10,500,5000",
+                        help="nombres de chapitres des volumes synthétiques, séparés par des virgules")
+    parser.add_argument("-i", "--images", default="0,1",
+                        help="nombres d'images par chapitre à tester, séparés par des virgules")
+    parser.add_argument("-o", "--output", type=Path, help="enregistre les résultats (JSON), par exemple comme référence")
+    parser.add_argument("-b", "--baseline", type=Path, help="compare les résultats à une référence enregistrée")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="écart relatif toléré avant de signaler une régression")
+    parser.add_argument("--workers", default="0",
+                        help="PROCESS_POOL_WORKERS du serveur (0 : tout dans le processus mesuré)")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        # Processus fils : un scénario, résultats JSON sur la sortie standard (dernière ligne)
+        (chapters, images) = map(int, args.scenario.split(":"))
+        with tempfile.TemporaryDirectory(prefix="epub-bench-") as root:
+            print(json.dumps(run_scenario(chapters, images, Path(root))))
+        raise SystemExit(0)
+
+    results = {}
+    for chapters in map(int, args.sizes.split(",")):
+        for images in map(int, args.images.split(",")):
+            scenario = f"{chapters}ch-{images}img"
+            print(f"running {scenario}...", flush=True)
+            # Un processus par scénario : mémoire et caches du serveur repartent de zéro
+            child = subprocess.run([sys.executable, __file__, "--scenario", f"{chapters}:{images}"], capture_output=True, text=True,
+                                   env={**os.environ, "PROCESS_POOL_WORKERS": args.workers})
+            if child.returncode != 0:
+                print(child.stdout, child.stderr)
+                raise SystemExit(f"scenario {scenario} failed")
+            results[scenario] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print_results(results)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.baseline is not None:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        raise SystemExit(1 if regressions > 0 else 0)
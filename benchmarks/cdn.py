@@ -0,0 +1,111 @@
+import hashlib
+import io
+import re
+import threading
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from PIL import Image
+
+from fixtures import chapter_html, class_names, obfuscation_css
+
+_chapter_number_regexp = re.compile(r"(\d+)\s*$")
+
+
+def sample_png(size: int = 256) -> bytes:
+    """Image PNG déterministe, assez bruitée pour ne pas se compresser à rien."""
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class StandInCdn:
+    """Remplace localement le CDN des chapitres, la feuille de style d'obfuscation et les images.
+
+    - `/chapitres/?path=<chemin>` : chapitre obfusqué synthétique (numéro lu à la fin du chemin) ;
+    - `/css/style.css` : CSS d'obfuscation, servi avec un ETag ;
+    - `/images/<nom>.png` : image PNG (identique pour tous les noms, `png`), servie avec un ETag.
+    """
+
+    def __init__(self, images_per_chapter: int = 0, paragraphs: int = 60):
+        self.images_per_chapter = images_per_chapter
+        self.paragraphs = paragraphs
+        self.obfuscating = class_names(400, seed=1)
+        self.decoys = class_names(40, seed=2)
+        self.css = obfuscation_css(self.obfuscating).encode("utf-8")
+        self.png = sample_png()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stand-in-cdn", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def chapter_url(self) -> str:
+        return f"{self.url}/chapitres/?userId=benchmark"
+
+    def start(self) -> "StandInCdn":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def chapter(self, number: int) -> str:
+        images = [f"{self.url}/images/{number}-{index}.png" for index in range(self.images_per_chapter)]
+        return chapter_html(number, self.obfuscating, self.decoys, self.paragraphs, images, f"{self.url}/css/style.css")
+
+    def _handler(self):
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                headers = {}
+                if url.path.startswith("/chapitres/"):
+                    path = unquote(parse_qs(url.query).get("path", [""])[0])
+                    match = _chapter_number_regexp.search(path)
+                    body = cdn.chapter(int(match.group(1)) if match else 0).encode("utf-8")
+                    content_type = "text/html; charset=utf-8"
+                elif url.path == "/css/style.css":
+                    if self.headers.get("If-None-Match") == '"obfuscation"':
+                        self._send(304, b"", "text/css", {"ETag": '"obfuscation"'})
+                        return
+                    (body, content_type, headers) = (cdn.css, "text/css", {"ETag": '"obfuscation"'})
+                elif url.path.startswith("/images/"):
+                    etag = f'"{hashlib.sha256(cdn.png).hexdigest()[:16]}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self._send(304, b"", "image/png", {"ETag": etag})
+                        return
+                    (body, content_type, headers) = (cdn.png, "image/png", {"ETag": etag})
+                else:
+                    self._send(404, b"", "text/plain")
+                    return
+                self._send(200, body, content_type, headers)
+
+            def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for (name, value) in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with cdn._lock:
+                    cdn.requests += 1
+                    cdn.bytes_sent += len(body)
+
+        return Handler
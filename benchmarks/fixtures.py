@@ -0,0 +1,51 @@
+import random
+import string
+from typing import List
+
+_words = ("le la les un une des de du et à en pour que qui dans sur avec ne pas plus par "
+          "son sa ses il elle ils on nous vous mais ou donc épée magie royaume ciel nuit").split()
+
+
+def class_names(count: int, seed: int = 0) -> List[str]:
+    generator = random.Random(seed)
+    return ["".join(generator.choices(string.ascii_letters, k=8)) for _ in range(count)]
+
+
+def obfuscation_css(classes: List[str]) -> str:
+    """Feuille de style au format du CDN : une règle masquée par classe d'obfuscation."""
+    return "\n".join(f".{name}{{display:none;font-size:0;}}" for name in classes)
+
+
+def chapter_html(index: int, obfuscating: List[str], decoys: List[str], paragraphs: int = 60,
+                 image_urls: List[str] = (), css_url: str = "https://cdn.world-novel.fr/css/style.css") -> str:
+    """Chapitre obfusqué synthétique, déterministe pour un `index` donné.
+
+    Chaque paragraphe contient des spans d'obfuscation (à supprimer), des spans à classe de
+    8 caractères hors CSS (à dérouler), de la mise en forme et des entités.
+    """
+    generator = random.Random(index)
+    body = []
+    for paragraph in range(paragraphs):
+        parts = []
+        for _ in range(generator.randint(8, 20)):
+            word = generator.choice(_words)
+            roll = generator.random()
+            if roll < 0.2:
+                parts.append(f'<span class="{generator.choice(obfuscating)}">{generator.choice(_words)}</span>')
+            elif roll < 0.3:
+                parts.append(f'<span class="{generator.choice(decoys)}">{word}</span>')
+            elif roll < 0.35:
+                parts.append(f"<em>{word}</em>")
+            elif roll < 0.38:
+                parts.append(f"{word}&nbsp;&amp;")
+            else:
+                parts.append(word)
+        body.append(f"<p>{' '.join(parts)}</p>")
+        if paragraph % 20 == 10:
+            body.append("<br/>")
+
+    for url in image_urls:
+        body.insert(generator.randint(0, len(body)), f'<p><img src="{url}" alt="illustration"/></p>')
+
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"/><link rel="stylesheet" href="{css_url}"/>'
+            f'<title>Chapitre {index}</title></head><body><div class="chapter">{"".join(body)}</div></body></html>')
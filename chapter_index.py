@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+INDEX_NAME = ".index.json"
+INDEX_VERSION = 1
+CHAPTER_METADATA_KEYS = ["title", "collections", "creators",
+                         "contributors", "description", "lang", "rights", "subjects"]
+
+_index_lock = threading.Lock()
+
+
+def _index_path(folder: Path) -> Path:
+    return Path(folder) / INDEX_NAME
+
+
+def load_index(folder: Path) -> Dict[str, dict]:
+    """Entrées de l'index du dossier, par nom de fichier de chapitre."""
+    try:
+        with open(_index_path(folder), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index["chapters"]
+    except Exception:
+        pass
+    return {}
+
+
+def record_chapter(file_path: Path, metadata: dict):
+    """Enregistre les métadonnées d'un chapitre qui vient d'être sauvegardé (la fusion en
+    déduit l'ordre des chapitres, voir `epub_merge.order_key`).
+
+    L'entrée garde la taille et la date du fichier : elle est ignorée si le chapitre est
+    modifié par ailleurs, et la fusion relit alors les métadonnées depuis l'archive.
+    """
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "metadata": {key: metadata[key] for key in CHAPTER_METADATA_KEYS if key in metadata},
+    }
+
+    with _index_lock:
+        chapters = load_index(file_path.parent)
+        chapters[file_path.name] = entry
+        index_path = _index_path(file_path.parent)
+        tmp_path = index_path.with_name(
+            f"{INDEX_NAME}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "chapters": chapters}, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+
+def indexed_metadata(chapters: Dict[str, dict], file_path: Path, stat: os.stat_result) -> Optional[dict]:
+    """Métadonnées indexées de `file_path`, si l'entrée correspond toujours au fichier."""
+    entry = chapters.get(Path(file_path).name)
+    if entry is None or (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return entry["metadata"]
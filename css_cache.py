@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Optional
+
+import requests
+
+obfuscating_class_regexp = re.compile(r'(?<=\.).{8}(?={.+;})')
+
+
+def parse_obfuscating_classes(css_content: str) -> FrozenSet[str]:
+    return frozenset(obfuscating_class_regexp.findall(css_content))
+
+
+class ObfuscationCss:
+    """Classes d'obfuscation d'une feuille de style et sélecteur soupsieve (compilé au premier usage)."""
+
+    def __init__(self, classes: FrozenSet[str], etag: Optional[str] = None, fetched_at: Optional[float] = None):
+        self.classes = classes
+        self.etag = etag
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+    @cached_property
+    def selector(self):
+        # Seul le moteur "soup" s'en sert : soupsieve n'est importé qu'à ce moment
+        import soupsieve
+        return soupsieve.compile(",".join(
+            map(lambda c: f"span[class='{c}']", sorted(self.classes)))) if len(self.classes) > 0 else None
+
+
+class ObfuscationCssCache:
+    """Cache LRU (taille bornée, TTL) des CSS d'obfuscation, indexé par URL.
+
+    Une entrée expirée possédant un ETag est revalidée par une requête conditionnelle
+    (`If-None-Match`) plutôt que retéléchargée. Si `persist_path` est fourni, le cache est
+    rechargé au démarrage et sauvegardé à chaque nouvelle entrée.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, persist_path: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, ObfuscationCss]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._load()
+
+    def get(self, url: str, fetch: Callable[[dict], requests.Response]) -> ObfuscationCss:
+        """Renvoie les classes d'obfuscation de `url`, en appelant `fetch(headers)` si nécessaire."""
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        # Un seul téléchargement par URL, même si plusieurs chapitres la demandent en même temps
+        with url_lock:
+            with self._lock:
+                entry = self._entries.get(url)
+                if entry is not None:
+                    self._entries.move_to_end(url)
+            if entry is not None and time.time() - entry.fetched_at < self.ttl:
+                return entry
+
+            headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else {}
+            response = fetch(headers)
+            if entry is not None and response.status_code == 304:
+                entry.fetched_at = time.time()
+            else:
+                entry = ObfuscationCss(parse_obfuscating_classes(
+                    response.content.decode()), response.headers.get("ETag"))
+                if len(entry.classes) == 0:
+                    return entry
+
+            self._put(url, entry)
+            return entry
+
+    def _put(self, url: str, entry: ObfuscationCss):
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                (evicted, _) = self._entries.popitem(last=False)
+                self._url_locks.pop(evicted, None)
+            snapshot = {url: {"classes": sorted(e.classes), "etag": e.etag, "fetched_at": e.fetched_at}
+                        for (url, e) in self._entries.items()}
+        self._save(snapshot)
+
+    def _load(self):
+        if self.persist_path is None:
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception:
+            return
+        for (url, entry) in list(entries.items())[-self.max_entries:]:
+            self._entries[url] = ObfuscationCss(frozenset(
+                entry["classes"]), entry.get("etag"), entry.get("fetched_at"))
+
+    def _save(self, snapshot: dict):
+        if self.persist_path is None:
+            return
+        try:
+            tmp_path = Path(f"{self.persist_path}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"Could not persist CSS cache: {e}")
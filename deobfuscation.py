@@ -0,0 +1,172 @@
+import html as html_module
+import re
+from html.parser import HTMLParser
+from typing import TYPE_CHECKING, FrozenSet, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from soupsieve import SoupSieve
+
+_link_tag_regexp = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+_attribute_regexp = re.compile(
+    r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+
+
+def find_stylesheet_href(html: str) -> Optional[str]:
+    """Renvoie le `href` du premier `<link rel="stylesheet">`, sans construire d'arbre HTML."""
+    for tag in _link_tag_regexp.findall(html):
+        attributes = {name.lower(): next(v for v in values if v is not None)
+                      for (name, *values) in _attribute_regexp.findall(tag)}
+        if "stylesheet" in attributes.get("rel", "").lower().split() and "href" in attributes:
+            return html_module.unescape(attributes["href"])
+    return None
+
+
+# Éléments vides, sérialisés `<br/>` comme le fait BeautifulSoup
+_void_elements = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+                            "menuitem", "meta", "param", "source", "track", "wbr", "basefont", "bgsound",
+                            "command", "frame", "image", "isindex", "nextid", "spacer"])
+_escape_table = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
+def _quote_attribute(value: str) -> str:
+    value = value.translate(_escape_table)
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return '"' + value.replace('"', "&quot;") + '"'
+
+
+class _DeobfuscationParser(HTMLParser):
+    """Filtre en un seul passage sur les événements du tokenizer, sans arbre.
+
+    Les spans dont la classe est une classe d'obfuscation sont supprimés avec leur contenu,
+    les autres spans à classe de 8 caractères sont remplacés par leur contenu, et seul le
+    contenu du premier `div` est émis. Les balises non fermées ou orphelines sont réparées
+    comme le ferait BeautifulSoup (fermeture implicite, balise de fin ignorée).
+    """
+
+    def __init__(self, classes: FrozenSet[str]):
+        super().__init__(convert_charrefs=True)
+        self.classes = classes
+        self.output: List[str] = []
+        self.image_sources: List[str] = []
+        # Pile des éléments ouverts : (tag, émettre la balise de fin)
+        self._stack: List[Tuple[str, bool]] = []
+        self._drop_depth: Optional[int] = None
+        self._capture_depth: Optional[int] = None
+        self._captured = False
+
+    def _emitting(self) -> bool:
+        return self._capture_depth is not None and self._drop_depth is None
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs)
+        if tag in _void_elements:
+            self._end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs)
+        self._end(tag)
+
+    def _start(self, tag, attrs):
+        if self._drop_depth is not None:
+            if tag not in _void_elements:
+                self._stack.append((tag, False))
+            return
+
+        if tag == "img":
+            src = next((value for (name, value) in attrs if name == "src"), None)
+            if src:
+                self.image_sources.append(src)
+
+        emit_tag = True
+        if tag == "span":
+            # Supprimé quels que soient ses autres attributs (comme le sélecteur `span[class='...']`),
+            # mais seul un span sans autre attribut est déroulé
+            class_name = dict(attrs).get("class") or ""
+            if class_name in self.classes:
+                self._stack.append((tag, False))
+                self._drop_depth = len(self._stack)
+                return
+            emit_tag = len(attrs) != 1 or attrs[0][0] != "class" or len(class_name) != 8
+
+        if tag == "div" and self._capture_depth is None and not self._captured:
+            self._stack.append((tag, False))
+            self._capture_depth = len(self._stack)
+            return
+
+        if self._emitting() and emit_tag:
+            # Attributs triés par nom, comme le formatter par défaut de BeautifulSoup
+            attributes = "".join(f" {name}={_quote_attribute(value or '')}" for (name, value) in sorted(dict(attrs).items()))
+            self.output.append(f"<{tag}{attributes}{'/' if tag in _void_elements else ''}>")
+        if tag not in _void_elements:
+            self._stack.append((tag, emit_tag))
+
+    def handle_endtag(self, tag):
+        if tag not in _void_elements:
+            self._end(tag)
+
+    def _end(self, tag):
+        if tag in _void_elements:
+            return
+        if not any(open_tag == tag for (open_tag, _) in self._stack):
+            return
+        while len(self._stack) > 0:
+            depth = len(self._stack)
+            (open_tag, emit_tag) = self._stack.pop()
+            if self._drop_depth == depth:
+                self._drop_depth = None
+            elif self._capture_depth == depth:
+                self._capture_depth = None
+                self._captured = True
+            elif self._emitting() and emit_tag:
+                self.output.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._emitting():
+            # Le contenu des <script> et <style> n'est pas échappé
+            self.output.append(data if self.cdata_elem is not None else data.translate(_escape_table))
+
+    def handle_comment(self, data):
+        if self._emitting():
+            self.output.append(f"<!--{data}-->")
+
+
+def deobfuscate_chapter(html: str, classes: FrozenSet[str]) -> Tuple[str, List[str]]:
+    """Supprime les spans d'obfuscation et renvoie le contenu du premier `div` et les `src` des images.
+
+    Fonction pure (exécutable dans un processus du pool) : les images sont remplacées ensuite
+    par `replace_image_src` sur le HTML renvoyé.
+    """
+    parser = _DeobfuscationParser(classes)
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.output), parser.image_sources
+
+
+def deobfuscate_chapter_soup(html: str, selector: "SoupSieve") -> Tuple[str, List[str]]:
+    """Équivalent de `deobfuscate_chapter` construit sur un arbre BeautifulSoup (plus lent)."""
+    # Import local : BeautifulSoup n'est chargé que si ce moteur est utilisé
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for s in selector.select(soup):
+        s.decompose()
+
+    image_sources = [img.get("src") for img in soup.find_all("img") if img.get("src")]
+
+    # Spans restants à classe de 8 caractères déroulés sur l'arbre : vides, imbriqués ou sur
+    # plusieurs lignes compris (ce qu'une expression régulière sur le HTML ne gère pas)
+    content = soup.select_one("div")
+    for span in content.find_all("span"):
+        if list(span.attrs) == ["class"] and len(" ".join(span["class"])) == 8:
+            span.unwrap()
+    return content.decode_contents(), image_sources
+
+
+def replace_image_src(html: str, src: str, new_src: str) -> str:
+    # Même échappement que le formatter "minimal" de BeautifulSoup pour les attributs (& < >)
+    return html.replace(f'src="{src.translate(_escape_table)}"', f'src="{new_src.translate(_escape_table)}"')
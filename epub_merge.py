@@ -0,0 +1,441 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+from urllib.parse import unquote
+
+if TYPE_CHECKING:
+    from mkepub import BookMetadata
+
+from chapter_index import CHAPTER_METADATA_KEYS, indexed_metadata, load_index
+from epub_writer import CompressionPolicy, EpubWriter
+
+MANIFEST_VERSION = 2
+MERGED_FOLDER_NAMES = ["Chapitres", "Volumes"]
+
+_reference_regexp = re.compile(rb"""((?:src|href)\s*=\s*)(["'])(.*?)\2""")
+
+_NAMESPACES = {
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+}
+
+
+class MergeCancelled(Exception):
+    """La fusion a été abandonnée : le dossier de chapitres a changé pendant son écriture."""
+
+
+def manifest_path(volume_folder: Path) -> Path:
+    """Chemin du manifeste de fusion d'un dossier de volume, stocké (caché) à côté du fichier fusionné."""
+    return volume_folder.parent / f".{volume_folder.name}.merge.json"
+
+
+def resolve_title(title_folder: Path, first_metadata: Optional[dict]) -> str:
+    if title_folder.name not in MERGED_FOLDER_NAMES:
+        return title_folder.name
+    if first_metadata is not None and len(first_metadata.get("collections") or []) > 0:
+        return first_metadata["collections"][0]["name"]
+    return title_folder.parent.name
+
+
+def order_key(metadata: dict):
+    collections = metadata.get("collections") or []
+    if len(collections) > 0 and "number" in collections[0]:
+        return collections[0]["number"]
+    return 0
+
+
+def merge_metadata(title: str, metadatas: List[dict]) -> BookMetadata:
+    """Agrège les métadonnées des chapitres (déjà triés) en métadonnées de volume."""
+    first = metadatas[0] if len(metadatas) > 0 else {}
+    merged_metadata: BookMetadata = {
+        "title": title,
+        "collections": [dict(c) for c in first.get("collections") or []],
+        "creators": [dict(t) for t in list({tuple(sorted(creator.items())) for metadata in metadatas for creator in metadata.get("creators") or []})],
+        "contributors": [dict(t) for t in list({tuple(sorted(contributor.items())) for metadata in metadatas for contributor in metadata.get("contributors") or []})],
+        "description": "\n\n".join(set([metadata["description"] for metadata in metadatas if metadata.get("description") is not None])),
+        "lang": first.get("lang") or "en",
+        "rights": first.get("rights") or "",
+        "subjects": list(set([subject for metadata in metadatas for subject in metadata.get("subjects") or []]))
+    }
+
+    if len(merged_metadata["collections"]) > 0 and "number" in merged_metadata["collections"][0]:
+        merged_metadata["collections"][0]["number"] = int(
+            float(merged_metadata["collections"][0]["number"]))
+
+    return merged_metadata
+
+
+def read_chapter_structure(archive: zipfile.ZipFile) -> dict:
+    """Lit le container et l'OPF d'un EPUB de chapitre pour en extraire pages, ressources et couverture.
+
+    Les chemins renvoyés (`src`) sont ceux des entrées de l'archive du chapitre,
+    `href` est le chemin relatif au dossier de l'OPF.
+    """
+    container = ET.fromstring(archive.read("META-INF/container.xml"))
+    rootfile = container.find(".//container:rootfile", _NAMESPACES)
+    if rootfile is None:
+        raise ValueError("EPUB sans rootfile dans META-INF/container.xml")
+    opf_path = rootfile.attrib["full-path"]
+    opf_dir = posixpath.dirname(opf_path)
+
+    package = ET.fromstring(archive.read(opf_path))
+    cover_id = None
+    for meta in package.iterfind("opf:metadata/opf:meta", _NAMESPACES):
+        if meta.attrib.get("name") == "cover":
+            cover_id = meta.attrib.get("content")
+
+    items = {}
+    cover = None
+    for item in package.iterfind("opf:manifest/opf:item", _NAMESPACES):
+        href = unquote(item.attrib["href"])
+        entry = {
+            "src": posixpath.normpath(posixpath.join(opf_dir, href)),
+            "href": href,
+            "media_type": item.attrib.get("media-type", "application/octet-stream"),
+        }
+        properties = item.attrib.get("properties", "").split()
+        if "nav" in properties or entry["media_type"] == "application/x-dtbncx+xml":
+            continue
+        if "cover-image" in properties or item.attrib.get("id") == cover_id:
+            cover = entry
+            continue
+        items[item.attrib["id"]] = entry
+
+    spine_ids = [itemref.attrib["idref"] for itemref in package.iterfind(
+        "opf:spine/opf:itemref", _NAMESPACES) if itemref.attrib.get("idref") in items]
+    # La page de couverture d'un chapitre n'a pas sa place dans le volume fusionné
+    pages = [items[idref] for idref in spine_ids if posixpath.basename(
+        items[idref]["href"]) != "cover.xhtml"]
+    assets = [item for (item_id, item) in items.items()
+              if item_id not in spine_ids]
+
+    return {"pages": pages, "assets": assets, "cover": cover}
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(path: Path) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except Exception:
+        pass
+    return {"version": MANIFEST_VERSION, "output": None, "chapters": {}}
+
+
+def _save_manifest(path: Path, manifest: dict):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _output_stat(path: Path) -> Optional[dict]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _ingest_chapter(file: Path, stat: os.stat_result, sha256: str, index: dict) -> dict:
+    """Analyse un chapitre nouveau ou modifié : métadonnées via l'index du dossier (ou mkepub
+    pour les chapitres absents de l'index), structure via l'OPF."""
+    metadata = indexed_metadata(index, file, stat)
+    if metadata is None:
+        # mkepub n'est chargé que pour les chapitres absents de l'index
+        from mkepub import Book
+        book = Book.read(file)
+        metadata = {key: book.metadata[key]
+                    for key in CHAPTER_METADATA_KEYS if key in book.metadata}
+    metadata = {**metadata}
+    metadata.setdefault("title", file.stem)
+
+    key = "c" + hashlib.sha1(file.name.encode("utf-8")).hexdigest()[:12]
+    with zipfile.ZipFile(file) as archive:
+        structure = read_chapter_structure(archive)
+        for item in structure["pages"] + structure["assets"]:
+            item["original_href"] = item["href"]
+            item["href"] = f"chapters/{key}/{item['href']}"
+
+        # Les images sont adressées par leur contenu : une même image (couverture comprise)
+        # n'est stockée qu'une fois dans le volume fusionné
+        for item in structure["assets"] + ([structure["cover"]] if structure["cover"] is not None else []):
+            if item["media_type"].startswith("image/"):
+                image_sha256 = hashlib.sha256(archive.read(item["src"])).hexdigest()
+                item["href"] = f"images/{image_sha256[:32]}{posixpath.splitext(item['src'])[1].lower()}"
+
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256,
+        "key": key,
+        "metadata": metadata,
+        **structure,
+    }
+
+
+def _scan_chapters(volume_folder: Path, previous: dict, full: bool):
+    """Renvoie les entrées du manifeste pour chaque chapitre et l'ensemble des chapitres (re)lus."""
+    chapters = {}
+    ingested = set()
+    index = load_index(volume_folder)
+    try:
+        nodes = os.listdir(volume_folder)
+    except Exception:
+        nodes = []
+
+    for node in nodes:
+        file = volume_folder / node
+        if not node.lower().endswith(".epub") or not file.is_file():
+            continue
+        stat = file.stat()
+        entry = None if full else previous.get(node)
+        if entry is not None and (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            sha256 = _file_sha256(file)
+            if sha256 == entry["sha256"]:
+                entry = {**entry, "size": stat.st_size,
+                         "mtime_ns": stat.st_mtime_ns}
+            else:
+                entry = _ingest_chapter(file, stat, sha256, index)
+                ingested.add(node)
+        elif entry is None:
+            entry = _ingest_chapter(file, stat, _file_sha256(file), index)
+            ingested.add(node)
+        chapters[node] = entry
+
+    return chapters, ingested
+
+
+def _compression_changed(manifest: dict, compression: CompressionPolicy) -> bool:
+    """La dernière fusion a-t-elle été écrite avec une autre politique de compression ?"""
+    return (manifest.get("compression") or {}).get("policy") != str(compression)
+
+
+def is_up_to_date(volume_folder: Path, title_folder: Optional[Path] = None,
+                  compression: Optional[CompressionPolicy] = None) -> bool:
+    """Indique, sans ouvrir aucune archive, si le fichier fusionné de `volume_folder` est à jour.
+
+    Le manifeste fait foi s'il existe ; sinon le fichier fusionné doit être plus récent que
+    tous les chapitres (possible seulement si son titre se déduit du nom de dossier). Avec
+    `compression`, un volume fusionné avec une autre politique n'est pas à jour.
+    """
+    volume_folder = Path(volume_folder)
+    title_folder = Path(title_folder) if title_folder is not None else volume_folder
+    try:
+        chapters = {entry.name: entry.stat() for entry in os.scandir(volume_folder)
+                    if entry.name.lower().endswith(".epub") and entry.is_file()}
+    except OSError:
+        return False
+    if len(chapters) == 0:
+        return True
+
+    manifest = _load_manifest(manifest_path(volume_folder))
+    if manifest["output"] is None:
+        if title_folder.name in MERGED_FOLDER_NAMES:
+            return False
+        output_stat = _output_stat(volume_folder.parent / f"{title_folder.name}.epub")
+        return output_stat is not None and all(stat.st_mtime_ns <= output_stat["mtime_ns"] for stat in chapters.values())
+
+    if set(chapters.keys()) != set(manifest["chapters"].keys()):
+        return False
+    if compression is not None and _compression_changed(manifest, compression):
+        return False
+    for (node, stat) in chapters.items():
+        entry = manifest["chapters"][node]
+        if (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns) and _file_sha256(volume_folder / node) != entry["sha256"]:
+            return False
+
+    first_metadata = min(manifest["chapters"].values(), key=lambda entry: order_key(entry["metadata"]))["metadata"]
+    output_path = volume_folder.parent / f"{resolve_title(title_folder, first_metadata)}.epub"
+    return {"name": output_path.name, **(_output_stat(output_path) or {})} == manifest["output"]
+
+
+def merged_volume_metadata(volume_folder: Path) -> Optional[Tuple[str, BookMetadata]]:
+    """Nom du fichier fusionné et métadonnées du volume, d'après le manifeste de la dernière fusion."""
+    manifest = _load_manifest(manifest_path(Path(volume_folder)))
+    if manifest["output"] is None:
+        return None
+    name = manifest["output"]["name"]
+    return name, merge_metadata(posixpath.splitext(name)[0], [entry["metadata"] for entry in manifest["chapters"].values()])
+
+
+def merged_volume_stats(volume_folder: Path) -> Optional[dict]:
+    """Compression de la dernière fusion (politique, threads, durée d'écriture, statistiques par
+    type d'entrée), d'après son manifeste."""
+    return _load_manifest(manifest_path(Path(volume_folder))).get("compression")
+
+
+def merge_volume(volume_folder: Path, title_folder: Optional[Path] = None, full: bool = False,
+                 cancel_on_change: bool = False, compression: Optional[CompressionPolicy] = None,
+                 compression_threads: int = 0) -> Optional[Path]:
+    """Fusionne les EPUB de chapitres de `volume_folder` en un seul EPUB placé dans le dossier parent.
+
+    Un manifeste (hash, clé de tri, entrées de spine et ressources de chaque chapitre) est conservé
+    à côté du fichier fusionné : seuls les chapitres nouveaux ou modifiés sont relus, les autres
+    sont recopiés depuis l'archive fusionnée précédente. `full` force la relecture de tous les chapitres.
+
+    Avec `cancel_on_change`, la fusion lève `MergeCancelled` (entre deux chapitres) dès que le
+    dossier est modifié, le fichier fusionné précédent restant alors en place.
+
+    Les entrées déjà compressées comme le veut `compression` sont recopiées sans recompression ;
+    les autres sont compressées par `compression_threads` threads (voir epub_writer.EpubWriter).
+    """
+    volume_folder = Path(volume_folder)
+    title_folder = Path(title_folder) if title_folder is not None else volume_folder
+    novel_folder = volume_folder.parent
+
+    is_cancelled = None
+    if cancel_on_change:
+        folder_mtime_ns = os.stat(volume_folder).st_mtime_ns
+        def is_cancelled(): return os.stat(volume_folder).st_mtime_ns != folder_mtime_ns
+
+    merge_manifest_path = manifest_path(volume_folder)
+    manifest = _load_manifest(merge_manifest_path)
+    chapters, ingested = _scan_chapters(
+        volume_folder, manifest["chapters"], full)
+
+    if len(chapters) == 0:
+        return None
+
+    ordered = sorted(chapters.items(),
+                     key=lambda item: order_key(item[1]["metadata"]))
+    title = resolve_title(title_folder, ordered[0][1]["metadata"])
+    output_path = novel_folder / f"{title}.epub"
+
+    previous_output = manifest["output"]
+    output_is_current = previous_output is not None and previous_output["name"] == output_path.name and \
+        {"name": output_path.name, **(_output_stat(output_path) or {})} == previous_output
+    compression = compression if compression is not None else CompressionPolicy()
+    # Nouvelle politique de compression : tout est réécrit, rien n'est recopié tel quel
+    recompress = previous_output is not None and _compression_changed(manifest, compression)
+    if output_is_current and not recompress and len(ingested) == 0 and \
+            list(manifest["chapters"].keys()) == [name for (name, _) in ordered]:
+        return output_path
+
+    merged_metadata = merge_metadata(
+        title, [entry["metadata"] for (_, entry) in ordered])
+
+    tmp_name = novel_folder / \
+        f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        start = time.perf_counter()
+        stats = _write_merged_archive(tmp_name, volume_folder, ordered, ingested,
+                                      output_path if output_is_current else None, merged_metadata, is_cancelled,
+                                      compression, compression_threads, recompress)
+        seconds = time.perf_counter() - start
+        os.replace(tmp_name, output_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except Exception:
+            pass
+        raise
+
+    _save_manifest(merge_manifest_path, {
+        "version": MANIFEST_VERSION,
+        "output": {"name": output_path.name, **_output_stat(output_path)},
+        "chapters": dict(ordered),
+        "compression": {"policy": str(compression), "threads": compression_threads, "seconds": seconds, "entries": stats},
+    })
+
+    return output_path
+
+
+def _rewrite_references(content: bytes, page: dict, new_hrefs: dict) -> bytes:
+    """Réécrit les `src`/`href` d'une page vers les nouveaux emplacements de ses ressources."""
+    page_dir = posixpath.dirname(page["original_href"])
+    new_page_dir = posixpath.dirname(page["href"])
+
+    def replace(match: re.Match) -> bytes:
+        value = match.group(3).decode("utf-8")
+        if ":" in value or value.startswith("#"):
+            return match.group(0)
+        (path, _, fragment) = value.partition("#")
+        resolved = posixpath.normpath(posixpath.join(page_dir, unquote(path)))
+        if resolved not in new_hrefs:
+            return match.group(0)
+        new_value = posixpath.relpath(new_hrefs[resolved], new_page_dir or ".")
+        if fragment:
+            new_value += "#" + fragment
+        return match.group(1) + match.group(2) + new_value.encode("utf-8") + match.group(2)
+
+    return _reference_regexp.sub(replace, content)
+
+
+def _write_merged_archive(filename: Path, volume_folder: Path, ordered: list, ingested: set,
+                          previous_output: Optional[Path], metadata: BookMetadata,
+                          is_cancelled: Optional[Callable[[], bool]] = None,
+                          compression: Optional[CompressionPolicy] = None, threads: int = 0,
+                          recompress: bool = False) -> dict:
+    """Écrit l'archive fusionnée chapitre par chapitre, sans garder leur contenu en mémoire.
+
+    Les chapitres inchangés sont recopiés depuis `previous_output`, les autres depuis leur archive ;
+    seules les pages réécrites (et les entrées compressées autrement) sont recompressées, ou toutes
+    les entrées avec `recompress`.
+    `is_cancelled` est consulté avant chaque chapitre. Renvoie les statistiques de compression.
+    """
+    previous_archive = zipfile.ZipFile(
+        previous_output) if previous_output is not None else None
+    try:
+        with EpubWriter(filename, compression, threads) as writer:
+            for (index, (node, entry)) in enumerate(ordered):
+                if is_cancelled is not None and is_cancelled():
+                    raise MergeCancelled(str(volume_folder))
+                from_chapter = previous_archive is None or node in ingested
+                chapter_archive = zipfile.ZipFile(
+                    volume_folder / node) if from_chapter or index == 0 else None
+                try:
+                    source = chapter_archive if from_chapter else previous_archive
+                    new_hrefs = {item["original_href"]: item["href"]
+                                 for item in entry["assets"]}
+                    for (item_index, item) in enumerate(entry["pages"] + entry["assets"]):
+                        is_page = item_index < len(entry["pages"])
+                        if writer.has(item["href"]):
+                            continue
+
+                        name = item["src"] if from_chapter else f"EPUB/{item['href']}"
+                        if is_page and from_chapter:
+                            writer.write(item["href"], _rewrite_references(
+                                source.read(name), item, new_hrefs))
+                        else:
+                            writer.copy(source, name, item["href"], raw=not recompress)
+                        writer.add_item(f"{entry['key']}-{item_index}",
+                                        item["href"], item["media_type"], in_spine=is_page)
+
+                    if index == 0 and entry["cover"] is not None:
+                        if not writer.has(entry["cover"]["href"]):
+                            writer.copy(chapter_archive, entry["cover"]["src"], entry["cover"]["href"], raw=not recompress)
+                        writer.set_cover(
+                            entry["cover"]["href"], entry["cover"]["media_type"])
+                finally:
+                    if chapter_archive is not None:
+                        chapter_archive.close()
+
+                if len(entry["pages"]) > 0:
+                    writer.add_toc_entry(
+                        entry["metadata"]["title"], entry["pages"][0]["href"])
+
+            writer.close(metadata)
+        return writer.stats
+    finally:
+        if previous_archive is not None:
+            previous_archive.close()
@@ -0,0 +1,339 @@
+import posixpath
+import shutil
+import struct
+import sys
+import time
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from jinja2 import Environment, FileSystemLoader
+
+epub_templates = Environment(loader=FileSystemLoader(
+    Path(__file__).parent / "templates" / "epub"), autoescape=True)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif"}
+TEXT_EXTENSIONS = {".xhtml", ".html", ".htm", ".css", ".opf", ".ncx", ".xml", ".svg", ".txt", ".js"}
+# Seules méthodes lues par tous les lecteurs EPUB
+_COMPRESS_TYPES = {"stored": zipfile.ZIP_STORED, "deflate": zipfile.ZIP_DEFLATED}
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# zipfile n'a pas d'API publique pour écrire une entrée déjà compressée (copie brute,
+# compression parallèle) : `_write_raw` s'appuie sur les attributs internes de ZipFile
+# (`fp`, `_lock`, `start_dir`, `filelist`, `NameToInfo`, `_didModify`) et sur
+# `ZipInfo.FileHeader`, vérifiés avec CPython 3.8 à 3.13. Sur une autre version, les entrées
+# sont décompressées et recompressées par l'API publique (ni copie brute ni threads).
+RAW_WRITE_VERSIONS = ((3, 8), (3, 13))
+_RAW_WRITE_ATTRIBUTES = ["fp", "_lock", "start_dir", "filelist", "NameToInfo", "_didModify"]
+# Niveau de compression d'un ZipInfo passé à ZipFile.open : attribut public depuis 3.13
+_COMPRESS_LEVEL_ATTRIBUTE = next((name for name in ["compress_level", "_compresslevel"]
+                                  if hasattr(zipfile.ZipInfo, name)), None)
+# En-tête local d'une entrée (APPNOTE.TXT, 4.3.7) : signature, ..., longueurs du nom et du champ extra
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def raw_write_supported(archive: zipfile.ZipFile) -> bool:
+    """Les entrées déjà compressées peuvent-elles être écrites telles quelles dans `archive` ?"""
+    return (RAW_WRITE_VERSIONS[0] <= sys.version_info[:2] <= RAW_WRITE_VERSIONS[1]
+            and all(hasattr(archive, name) for name in _RAW_WRITE_ATTRIBUTES)
+            and hasattr(zipfile.ZipInfo, "FileHeader"))
+
+
+class CompressionPolicy:
+    """Compression des entrées d'un EPUB selon leur type : `images`, `text` (XHTML, CSS, OPF...) et `other`.
+
+    Décrite par `type=méthode[:niveau]`, séparés par des virgules (par exemple
+    `images=stored,text=deflate:9`), avec `stored` ou `deflate` (niveau 0 à 9 de zlib).
+    Par défaut, les images, déjà compressées, sont stockées telles quelles et le reste est
+    compressé au niveau par défaut de zlib.
+    """
+
+    KINDS = ["images", "text", "other"]
+
+    def __init__(self, spec: str = ""):
+        self.methods: Dict[str, Tuple[int, Optional[int]]] = {
+            "images": (zipfile.ZIP_STORED, None),
+            "text": (zipfile.ZIP_DEFLATED, None),
+            "other": (zipfile.ZIP_DEFLATED, None),
+        }
+        for part in spec.split(","):
+            if part.strip() == "":
+                continue
+            (kind, _, method) = (value.strip() for value in part.partition("="))
+            (name, _, level) = (value.strip() for value in method.partition(":"))
+            if kind not in self.KINDS or name not in _COMPRESS_TYPES:
+                raise ValueError(f"Compression invalide : '{part.strip()}'")
+            if level != "" and (name != "deflate" or not level.isdigit() or int(level) > 9):
+                raise ValueError(f"Niveau de compression invalide : '{part.strip()}'")
+            self.methods[kind] = (_COMPRESS_TYPES[name], int(level) if level != "" else None)
+
+    def kind(self, name: str) -> str:
+        extension = posixpath.splitext(name)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            return "images"
+        if extension in TEXT_EXTENSIONS:
+            return "text"
+        return "other"
+
+    def method(self, name: str) -> Tuple[int, Optional[int]]:
+        """(méthode zipfile, niveau ou None) pour l'entrée `name`."""
+        return self.methods[self.kind(name)]
+
+    def __str__(self):
+        names = {compress_type: name for (name, compress_type) in _COMPRESS_TYPES.items()}
+        return ",".join(f"{kind}={names[compress_type]}{f':{level}' if level is not None else ''}"
+                        for (kind, (compress_type, level)) in self.methods.items())
+
+
+def _deflate(content: bytes, level: Optional[int]) -> Tuple[bytes, int, float]:
+    """Compresse `content` en deflate brut (données d'une entrée zip) : données, CRC, durée.
+
+    zlib relâche le GIL : plusieurs entrées sont compressées en parallèle par des threads.
+    """
+    start = time.perf_counter()
+    compressor = zlib.compressobj(level if level is not None else zlib.Z_DEFAULT_COMPRESSION,
+                                  zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(content) + compressor.flush()
+    return data, zlib.crc32(content), time.perf_counter() - start
+
+
+def _raw_chunks(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    """Données compressées de l'entrée `info` de `archive` (ouverte depuis un fichier), par blocs."""
+    with open(archive.filename, "rb") as f:
+        f.seek(info.header_offset)
+        header = f.read(_LOCAL_HEADER.size)
+        if len(header) != _LOCAL_HEADER.size or header[:4] != _LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"En-tête local invalide pour {info.filename}")
+        (*_, filename_length, extra_length) = _LOCAL_HEADER.unpack(header)
+        f.seek(filename_length + extra_length, 1)
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = f.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Entrée tronquée : {info.filename}")
+            remaining -= len(chunk)
+            yield chunk
+
+
+class EpubWriter:
+    """Écrit un EPUB directement dans l'archive zip, entrée par entrée.
+
+    Le contenu n'est jamais conservé en mémoire : seules les informations du manifeste,
+    de la spine et de la table des matières sont accumulées jusqu'à `close`.
+
+    La compression de chaque entrée suit `compression` (voir `CompressionPolicy`). Avec
+    `threads`, les entrées données en octets sont compressées en parallèle puis écrites dans
+    l'ordre (au plus `2 * threads` en attente). `stats` donne, par type d'entrée, le nombre
+    d'entrées, de copies brutes, les tailles et la durée de compression.
+
+    Copies brutes et threads ne sont utilisés que si `raw_write_supported` (version de Python).
+    """
+
+    def __init__(self, filename: Union[str, Path], compression: Optional[CompressionPolicy] = None, threads: int = 0):
+        self.archive = zipfile.ZipFile(filename, "w")
+        self.compression = compression if compression is not None else CompressionPolicy()
+        self.items: List[dict] = []
+        self.spine: List[dict] = []
+        self.pages: List[dict] = []
+        self.cover: Optional[dict] = None
+        self.stats = {kind: {"entries": 0, "copied": 0, "size": 0, "compressed_size": 0, "seconds": 0.0}
+                      for kind in CompressionPolicy.KINDS}
+        self._hrefs = set()
+        self._raw = raw_write_supported(self.archive)
+        if not self._raw and threads > 0:
+            print(f"Python {sys.version.split()[0]}: compression threads disabled, entries copied by recompression")
+        self._executor = (ThreadPoolExecutor(threads, thread_name_prefix="epub-deflate")
+                          if threads > 0 and self._raw else None)
+        self._max_pending = threads * 2
+        self._pending = deque()
+
+        self.archive.writestr("mimetype", "application/epub+zip",
+                              compress_type=zipfile.ZIP_STORED)
+        self._write_template("container.xml", "META-INF/container.xml")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        for (_, future) in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._shutdown()
+        self.archive.close()
+
+    def has(self, href: str) -> bool:
+        return href in self._hrefs
+
+    def write(self, href: str, content: Union[bytes, BinaryIO], compress_type: Optional[int] = None):
+        """Ajoute le fichier `EPUB/<href>` depuis des octets ou un flux (copié par blocs)."""
+        self._hrefs.add(href)
+        if isinstance(content, bytes):
+            self._write_entry(f"EPUB/{href}", content, compress_type)
+            return
+
+        with self.open(href, compress_type) as target:
+            shutil.copyfileobj(content, target, COPY_CHUNK_SIZE)
+
+    def copy(self, source: zipfile.ZipFile, name: str, href: str, raw: bool = True):
+        """Ajoute l'entrée `name` de `source` (archive ouverte depuis un fichier) en `EPUB/<href>`.
+
+        Si sa méthode est celle prévue pour `href` (deflate, quel que soit son niveau, ou stored),
+        les données compressées sont recopiées telles quelles, sans décompression ni recompression.
+        Avec `raw=False` (ou sans `raw_write_supported`), l'entrée est toujours recompressée.
+        """
+        info = source.getinfo(name)
+        (compress_type, _) = self.compression.method(href)
+        if not raw or not self._raw or info.compress_type != compress_type or info.flag_bits & 0x1:
+            if self._executor is not None and compress_type == zipfile.ZIP_DEFLATED:
+                self.write(href, source.read(name))
+            else:
+                with source.open(name) as content:
+                    self.write(href, content)
+            return
+
+        self._hrefs.add(href)
+        self._flush()
+        copied = zipfile.ZipInfo(f"EPUB/{href}", info.date_time)
+        copied.compress_type = info.compress_type
+        copied.external_attr = 0o600 << 16
+        (copied.CRC, copied.file_size, copied.compress_size) = (info.CRC, info.file_size, info.compress_size)
+        start = time.perf_counter()
+        self._write_raw(copied, _raw_chunks(source, info))
+        self._count(copied, time.perf_counter() - start, copied=True)
+
+    @contextmanager
+    def open(self, href: str, compress_type: Optional[int] = None) -> Iterator[BinaryIO]:
+        """Ouvre `EPUB/<href>` en écriture, pour un contenu reçu par morceaux.
+
+        Une seule entrée peut être ouverte à la fois.
+        """
+        self._hrefs.add(href)
+        self._flush()
+        info = zipfile.ZipInfo(f"EPUB/{href}", time.localtime()[:6])
+        (info.compress_type, level) = self._method(info.filename, compress_type)
+        if _COMPRESS_LEVEL_ATTRIBUTE is not None:
+            setattr(info, _COMPRESS_LEVEL_ATTRIBUTE, level)
+        start = time.perf_counter()
+        with self.archive.open(info, "w") as target:
+            yield target
+        self._count(info, time.perf_counter() - start)
+
+    def add_page(self, item_id: str, href: str, title: str, body: str, lang: str = "en", stylesheet: Optional[str] = None):
+        """Écrit une page XHTML autour de `body` (déjà en XHTML), l'ajoute à la spine et à la table des matières."""
+        self._write_template("page.xhtml", f"EPUB/{href}", title=title, body=body, lang=lang, stylesheet=stylesheet)
+        self._hrefs.add(href)
+        self.add_item(item_id, href, "application/xhtml+xml", in_spine=True)
+        self.add_toc_entry(title, href)
+
+    def add_item(self, item_id: str, href: str, media_type: str, in_spine: bool = False):
+        """Déclare un fichier déjà écrit dans le manifeste (et la spine pour une page)."""
+        item = {"id": item_id, "href": href, "media_type": media_type}
+        self.items.append(item)
+        if in_spine:
+            self.spine.append(item)
+
+    def add_toc_entry(self, title: str, href: str):
+        self.pages.append({"title": title, "href": href})
+
+    def set_cover(self, href: str, media_type: str):
+        """Désigne un fichier déjà écrit comme couverture (affichée en première page)."""
+        self.cover = {"href": href, "media_type": media_type}
+
+    def close(self, metadata: dict, cover_page: bool = True, visible_toc: bool = True):
+        """Écrit la page de couverture, la table des matières et l'OPF, puis ferme l'archive.
+
+        Sans `cover_page` ni `visible_toc`, la couverture et la table des matières restent
+        déclarées mais ne sont pas des pages de la spine (comme les EPUB de chapitres).
+        """
+        template_data = {
+            **metadata,
+            "cover_page": cover_page,
+            "visible_toc": visible_toc,
+            "uuid": uuid.uuid4(),
+            "date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "cover": self.cover,
+            "items": [item for item in self.items if self.cover is None or item["href"] != self.cover["href"]],
+            "spine": self.spine,
+            "pages": self.pages,
+        }
+        for template in ["cover.xhtml", "toc.xhtml", "toc.ncx", "package.opf"]:
+            if template == "cover.xhtml" and (self.cover is None or not cover_page):
+                continue
+            self._write_template(template, f"EPUB/{template}", **template_data)
+        self._flush()
+        self._shutdown()
+        self.archive.close()
+
+    def _write_template(self, template: str, name: str, **data):
+        self._write_entry(name, epub_templates.get_template(
+            template).render(**data).encode("utf-8"))
+
+    def _method(self, name: str, compress_type: Optional[int]) -> Tuple[int, Optional[int]]:
+        if compress_type is None:
+            return self.compression.method(name)
+        return compress_type, None
+
+    def _write_entry(self, name: str, content: bytes, compress_type: Optional[int] = None):
+        (compress_type, level) = self._method(name, compress_type)
+        if self._executor is not None and compress_type == zipfile.ZIP_DEFLATED:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            (info.compress_type, info.file_size) = (compress_type, len(content))
+            info.external_attr = 0o600 << 16
+            self._pending.append((info, self._executor.submit(_deflate, content, level)))
+            while len(self._pending) > self._max_pending:
+                self._write_pending()
+            return
+
+        self._flush()
+        start = time.perf_counter()
+        self.archive.writestr(name, content, compress_type=compress_type, compresslevel=level)
+        self._count(self.archive.getinfo(name), time.perf_counter() - start)
+
+    def _write_pending(self):
+        (info, future) = self._pending.popleft()
+        (data, info.CRC, seconds) = future.result()
+        info.compress_size = len(data)
+        self._write_raw(info, [data])
+        self._count(info, seconds)
+
+    def _flush(self):
+        """Écrit les entrées en cours de compression (avant toute autre écriture dans l'archive)."""
+        while len(self._pending) > 0:
+            self._write_pending()
+
+    def _write_raw(self, info: zipfile.ZipInfo, chunks: Iterable[bytes]):
+        """Écrit une entrée dont les données sont déjà compressées (CRC et tailles renseignés).
+
+        Attributs internes de zipfile : uniquement si `raw_write_supported` (voir `RAW_WRITE_VERSIONS`).
+        """
+        archive = self.archive
+        zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+        with archive._lock:
+            info.header_offset = archive.fp.tell()
+            archive.fp.write(info.FileHeader(zip64))
+            for chunk in chunks:
+                archive.fp.write(chunk)
+            archive.start_dir = archive.fp.tell()
+            archive.filelist.append(info)
+            archive.NameToInfo[info.filename] = info
+            archive._didModify = True
+
+    def _count(self, info: zipfile.ZipInfo, seconds: float, copied: bool = False):
+        stats = self.stats[self.compression.kind(info.filename)]
+        stats["entries"] += 1
+        stats["copied"] += 1 if copied else 0
+        stats["size"] += info.file_size
+        stats["compressed_size"] += info.compress_size
+        stats["seconds"] += seconds
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, FrozenSet, Optional
+
+LEDGER_NAME = ".fetch.json"
+LEDGER_VERSION = 1
+# Enregistrement sur disque au plus toutes les N entrées (et à la fin du téléchargement)
+SAVE_EVERY = 50
+
+
+def content_sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def classes_sha256(classes: FrozenSet[str]) -> str:
+    """Empreinte d'un ensemble de classes d'obfuscation, indépendante de leur ordre."""
+    return content_sha256("\n".join(sorted(classes)).encode("utf-8"))
+
+
+def conditional_headers(entry: Optional[dict]) -> dict:
+    """En-têtes d'une requête conditionnelle d'après les validateurs d'un téléchargement précédent."""
+    headers = {}
+    if entry is not None and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+class FetchLedger:
+    """Registre des chapitres téléchargés d'un volume (fichier `.fetch.json` du dossier).
+
+    Par URL de chapitre : fichier EPUB produit, validateurs HTTP (ETag, Last-Modified), empreinte
+    du HTML reçu, URL et empreinte des classes du CSS d'obfuscation, empreinte des images et du
+    HTML désobfusqué. Un nouveau téléchargement peut ainsi être conditionnel, et un chapitre
+    n'est reconstruit que si son contenu a réellement changé.
+    """
+
+    def __init__(self, folder: Path):
+        self.path = Path(folder) / LEDGER_NAME
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.chapters: Dict[str, dict] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                ledger = json.load(f)
+            if ledger.get("version") == LEDGER_VERSION:
+                self.chapters = ledger["chapters"]
+        except Exception:
+            pass
+
+    def get(self, chapter_url: str) -> Optional[dict]:
+        with self._lock:
+            return self.chapters.get(chapter_url)
+
+    def record(self, chapter_url: str, entry: dict):
+        with self._lock:
+            self.chapters[chapter_url] = {**entry, "checked_at": time.time()}
+            self._unsaved += 1
+            if self._unsaved < SAVE_EVERY:
+                return
+        self.save()
+
+    def save(self):
+        with self._lock:
+            if self._unsaved == 0:
+                return
+            tmp_path = self.path.with_name(
+                f"{LEDGER_NAME}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": LEDGER_VERSION, "chapters": self.chapters}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
@@ -0,0 +1,58 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class ConcurrencyLimiter:
+    """Limite le nombre de requêtes simultanées par hôte et par proxy, pour tous les dumps en cours."""
+
+    def __init__(self, per_host: int, per_proxy: int):
+        self.per_host = per_host
+        self.per_proxy = per_proxy
+        self._lock = threading.Lock()
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._proxy_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._in_use: Dict[Tuple[str, str], int] = {}
+
+    def _semaphore(self, semaphores: Dict[str, threading.BoundedSemaphore], key: str, limit: int) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = semaphores.get(key)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(limit)
+                semaphores[key] = semaphore
+            return semaphore
+
+    @contextmanager
+    def slot(self, url: str, proxy: Optional[str] = None):
+        """Réserve une place pour `url` (et `proxy` s'il est fourni) le temps du bloc `with`."""
+        host = urlsplit(url).netloc
+        host_semaphore = self._semaphore(
+            self._host_semaphores, host, self.per_host)
+        proxy_semaphore = self._semaphore(
+            self._proxy_semaphores, proxy, self.per_proxy) if proxy else None
+
+        # Toujours prendre le proxy avant l'hôte pour éviter les interblocages
+        if proxy_semaphore is not None:
+            proxy_semaphore.acquire()
+            self._count("proxy", proxy.rsplit("@", 1)[-1], 1)
+        try:
+            with host_semaphore:
+                self._count("host", host, 1)
+                try:
+                    yield
+                finally:
+                    self._count("host", host, -1)
+        finally:
+            if proxy_semaphore is not None:
+                self._count("proxy", proxy.rsplit("@", 1)[-1], -1)
+                proxy_semaphore.release()
+
+    def _count(self, kind: str, name: str, delta: int):
+        with self._lock:
+            self._in_use[(kind, name)] = self._in_use.get((kind, name), 0) + delta
+
+    def in_use(self) -> List[Tuple[Tuple[str, str], int]]:
+        """Places occupées par ("host" | "proxy", nom), sans les identifiants des proxies."""
+        with self._lock:
+            return list(self._in_use.items())
@@ -0,0 +1,251 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def proxy_config(proxy: Optional[str]) -> dict:
+    return {"http": f"http://{proxy}", "https": f"http://{proxy}"} if proxy else {}
+
+
+class _ProxyHealth:
+    def __init__(self):
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency: Optional[float] = None
+        self.cooldown_until = 0.0
+
+
+class ProxyRotation:
+    """Choisit le proxy de chaque requête d'après la santé observée des proxies.
+
+    Un proxy en échec est écarté pendant `cooldown` secondes (doublées à chaque échec consécutif,
+    jusqu'à `max_cooldown`) ; parmi les autres, on prend la plus faible latence moyenne pondérée
+    par le nombre de requêtes déjà en cours sur le proxy.
+    """
+
+    def __init__(self, proxies: Iterable[str] = (), cooldown: float = 30.0, max_cooldown: float = 600.0):
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._health: Dict[str, _ProxyHealth] = {}
+        self.set_proxies(proxies)
+
+    def __len__(self):
+        return len(self._health)
+
+    def set_proxies(self, proxies: Iterable[str]):
+        """Remplace la liste des proxies en conservant l'historique de ceux qui restent."""
+        with self._lock:
+            self._health = {proxy: self._health.get(proxy) or _ProxyHealth() for proxy in proxies}
+
+    def acquire(self, exclude: Iterable[str] = ()) -> Optional[str]:
+        """Proxy à utiliser pour la prochaine requête (None sans proxy), à rendre avec `release`."""
+        with self._lock:
+            candidates = [(proxy, health) for (proxy, health) in self._health.items()
+                          if proxy not in exclude] or list(self._health.items())
+            if len(candidates) == 0:
+                return None
+            now = time.monotonic()
+            available = [(proxy, health) for (proxy, health) in candidates
+                         if health.cooldown_until <= now]
+            if len(available) > 0:
+                (proxy, health) = min(available, key=lambda item: (
+                    item[1].latency or 0.1) * (1 + item[1].in_flight))
+            else:
+                # Tous en pause : le premier à en sortir
+                (proxy, health) = min(candidates, key=lambda item: item[1].cooldown_until)
+            health.in_flight += 1
+            return proxy
+
+    def release(self, proxy: Optional[str], latency: Optional[float]):
+        """Enregistre le résultat d'une requête : `latency` en secondes, ou None en cas d'échec."""
+        if proxy is None:
+            return
+        with self._lock:
+            health = self._health.get(proxy)
+            if health is None:
+                return
+            health.in_flight -= 1
+            self._observe(health, latency)
+
+    def record(self, proxy: str, latency: Optional[float]):
+        """Enregistre le résultat d'une vérification faite hors des requêtes (voir ProxyListRefresher)."""
+        with self._lock:
+            health = self._health.get(proxy)
+            if health is not None:
+                self._observe(health, latency)
+
+    def _observe(self, health: _ProxyHealth, latency: Optional[float]):
+        if latency is None:
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.cooldown_until = time.monotonic() + min(
+                self.max_cooldown, self.cooldown * 2 ** (health.consecutive_failures - 1))
+        else:
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.latency = latency if health.latency is None else 0.8 * health.latency + 0.2 * latency
+
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                # Les identifiants du proxy ne sont jamais exposés
+                "proxy": proxy.rsplit("@", 1)[-1],
+                "inFlight": health.in_flight,
+                "successes": health.successes,
+                "failures": health.failures,
+                "latency": round(health.latency, 3) if health.latency is not None else None,
+                "coolingDown": health.cooldown_until > now,
+            } for (proxy, health) in self._health.items()]
+
+
+class ProxyListRefresher:
+    """Charge la liste des proxies en arrière-plan, puis la recharge toutes les `interval` secondes.
+
+    Chaque liste chargée est vérifiée en parallèle avec `check(proxy)` (qui lève une exception
+    si le proxy est inutilisable) : la durée de la vérification initialise la latence du proxy
+    dans `rotation`, et un proxy en échec y est mis en pause. Tant que le premier chargement
+    n'a pas abouti, il est retenté toutes les `retry_interval` secondes.
+    """
+
+    def __init__(self, rotation: ProxyRotation, load: Callable[[], List[str]], interval: float = 900,
+                 check: Optional[Callable[[str], None]] = None, check_concurrency: int = 16,
+                 retry_interval: float = 60):
+        self.rotation = rotation
+        self.load = load
+        self.interval = interval
+        self.check = check
+        self.check_concurrency = check_concurrency
+        self.retry_interval = retry_interval
+        self.loaded_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # Positionné après la première tentative de chargement, réussie ou non
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="proxy-list-refresh", daemon=True)
+
+    def start(self) -> "ProxyListRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self):
+        proxies = self.load()
+        latencies = [None] * len(proxies)
+        if self.check is not None and len(proxies) > 0:
+            with ThreadPoolExecutor(max_workers=min(self.check_concurrency, len(proxies)),
+                                    thread_name_prefix="proxy-check") as executor:
+                latencies = list(executor.map(self._check, proxies))
+        self.rotation.set_proxies(proxies)
+        if self.check is not None:
+            for (proxy, latency) in zip(proxies, latencies):
+                self.rotation.record(proxy, latency)
+        self.loaded_at = time.time()
+
+    def _check(self, proxy: str) -> Optional[float]:
+        start = time.monotonic()
+        try:
+            self.check(proxy)
+        except Exception:
+            return None
+        return time.monotonic() - start
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as err:
+                # Le message (URL de l'API...) reste dans les logs : seul le type d'erreur est exposé
+                self.last_error = type(err).__name__
+                print(f"Could not fetch proxy list: {err}")
+            finally:
+                self.ready.set()
+            if self._stop.wait(self.interval if self.loaded_at is not None else self.retry_interval):
+                return
+
+    def stats(self) -> dict:
+        return {
+            "count": len(self.rotation),
+            "loadedAt": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.loaded_at)) if self.loaded_at is not None else None,
+            "lastError": self.last_error,
+        }
+
+
+class HttpPool:
+    """Sessions HTTP partagées avec keep-alive.
+
+    Chaque thread a sa propre `requests.Session` (non thread-safe), mais toutes montent les mêmes
+    adaptateurs : les connexions (directes ou via chaque proxy) sont réutilisées entre threads.
+    Les requêtes vers `retry_hosts` sont relancées avec un délai exponentiel sur erreur réseau,
+    429 ou 5xx.
+    """
+
+    def __init__(self, pool_size: int = 16, retries: int = 3, backoff_factor: float = 0.5,
+                 retry_hosts: Iterable[str] = (), headers: Optional[dict] = None):
+        self.headers = headers or {}
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET", "HEAD"], raise_on_status=False)
+        self._retry_adapters = {host: HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+                                for host in retry_hosts}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._failures = 0
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.max_redirects = 5
+            session.headers.update(self.headers)
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            for (host, adapter) in self._retry_adapters.items():
+                session.mount(f"https://{host}/", adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url: str, proxy: Optional[str] = None, **kwargs) -> requests.Response:
+        try:
+            response = self.session().get(url, proxies=proxy_config(proxy), **kwargs)
+        except Exception:
+            with self._lock:
+                self._requests += 1
+                self._failures += 1
+            raise
+        with self._lock:
+            self._requests += 1
+        return response
+
+    def stats(self) -> dict:
+        """Requêtes envoyées et connexions ouvertes : `reused` mesure l'efficacité du keep-alive."""
+        connections = 0
+        pool_requests = 0
+        for adapter in [self._adapter, *self._retry_adapters.values()]:
+            managers = [adapter.poolmanager, *list(adapter.proxy_manager.values())]
+            for manager in managers:
+                for key in manager.pools.keys():
+                    pool = manager.pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                        pool_requests += pool.num_requests
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "failures": self._failures,
+                "connections": connections,
+                "reused": max(0, pool_requests - connections),
+            }
@@ -0,0 +1,270 @@
+import json
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus, chaque processus exécute la file
+    fcntl = None
+
+_schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    run_at REAL NOT NULL,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_queued_key ON jobs(key) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS jobs_next ON jobs(status, run_at);
+CREATE TABLE IF NOT EXISTS job_secrets (
+    job_id INTEGER PRIMARY KEY,
+    secrets TEXT NOT NULL
+);
+"""
+
+
+class Job:
+    def __init__(self, row: sqlite3.Row):
+        self.id: int = row["id"]
+        self.key: str = row["key"]
+        self.kind: str = row["kind"]
+        self.payload: dict = json.loads(row["payload"])
+        self.priority: int = row["priority"]
+        self.status: str = row["status"]
+        self.run_at: float = row["run_at"]
+        self.progress_done: int = row["progress_done"]
+        self.progress_total: int = row["progress_total"]
+        self.error: Optional[str] = row["error"]
+        self.created_at: float = row["created_at"]
+        self.updated_at: float = row["updated_at"]
+        # Chargés seulement pour le worker qui exécute la tâche, jamais renvoyés par `to_json`
+        self.secrets: Optional[dict] = None
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "key": self.key,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": {"done": self.progress_done, "total": self.progress_total},
+            "error": self.error,
+            "runAt": str(datetime.fromtimestamp(self.run_at))[:19],
+            "createdAt": str(datetime.fromtimestamp(self.created_at))[:19],
+            "updatedAt": str(datetime.fromtimestamp(self.updated_at))[:19],
+        }
+
+
+class JobQueue:
+    """File de tâches persistée dans SQLite, traitée par un nombre fixe de threads.
+
+    - une seule tâche en attente par `key`, et jamais deux tâches de même `key` en parallèle ;
+    - les tâches de plus haute `priority` passent en premier, puis par date d'exécution ;
+    - `run_at` permet de différer une tâche (debounce) ;
+    - au démarrage, les tâches restées "running" (arrêt du serveur) sont remises en attente ;
+    - les `secrets` d'une tâche (jetons) sont gardés hors du payload, dans une table à part,
+      pour le worker qui l'exécute (quel que soit le processus, même après un redémarrage),
+      et supprimés dès qu'elle se termine ;
+    - plusieurs processus (workers du serveur web) peuvent partager la base : tous y ajoutent
+      des tâches, mais un seul, détenteur du verrou `<base>.lock`, les exécute. Les autres
+      attendent ce verrou et prennent le relais si ce processus s'arrête.
+    """
+
+    def __init__(self, db_path: Path, workers: int, handlers: Dict[str, Callable[["Job", Callable[[int, int], None]], None]],
+                 poll_interval: float = 2):
+        self.db_path = Path(db_path)
+        self.workers = workers
+        self.handlers = handlers
+        # Les tâches ajoutées par un autre processus ne réveillent pas les workers : relecture périodique
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._runner_lock = None
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Les secrets supprimés sont effacés du fichier, pas seulement marqués libres
+        self._db.execute("PRAGMA secure_delete=ON")
+        self._db.executescript(_schema)
+
+    def start(self):
+        if self.workers <= 0:
+            return
+        if self._acquire_runner_lock(blocking=False):
+            self._start_workers()
+        else:
+            threading.Thread(target=self._wait_runner_lock, name="job-runner-lock", daemon=True).start()
+
+    def _acquire_runner_lock(self, blocking: bool) -> bool:
+        if fcntl is None:
+            return True
+        lock_file = open(self.db_path.with_name(self.db_path.name + ".lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Gardé ouvert (et donc verrouillé) jusqu'à la fin du processus
+        self._runner_lock = lock_file
+        return True
+
+    def _wait_runner_lock(self):
+        self._acquire_runner_lock(blocking=True)
+        self._start_workers()
+
+    def _start_workers(self):
+        with self._lock:
+            now = time.time()
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (now,))
+            # Historique conservé une semaine
+            self._db.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND updated_at < ?", (now - 7 * 24 * 3600,))
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, kind: str, key: str, payload: dict, priority: int = 0, delay: float = 0, replace: bool = False,
+                max_delay: Optional[float] = None, secrets: Optional[dict] = None) -> Tuple[Job, bool]:
+        """Ajoute une tâche, sauf si une tâche active existe déjà pour `key`.
+
+        Avec `replace`, une tâche existante encore en attente reçoit le nouveau payload (et les
+        nouveaux `secrets`) et sa date d'exécution est repoussée (debounce), sans dépasser
+        `max_delay` secondes après sa création. Renvoie la tâche et `True` si elle a été créée.
+        """
+        now = time.time()
+        with self._lock, self._write_transaction():
+            queued = self._db.execute(
+                "SELECT * FROM jobs WHERE key = ? AND status = 'queued'", (key,)).fetchone()
+            if queued is not None and replace:
+                run_at = now + delay
+                if max_delay is not None:
+                    run_at = min(run_at, queued["created_at"] + max_delay)
+                self._db.execute("UPDATE jobs SET payload = ?, run_at = ?, priority = MAX(priority, ?), updated_at = ? WHERE id = ?",
+                                 (json.dumps(payload), run_at, priority, now, queued["id"]))
+                if secrets is not None:
+                    self._save_secrets(queued["id"], secrets)
+                self._wakeup.notify_all()
+                return self._get(queued["id"]), False
+
+            if not replace:
+                active = queued or self._db.execute(
+                    "SELECT * FROM jobs WHERE key = ? AND status = 'running'", (key,)).fetchone()
+                if active is not None:
+                    return Job(active), False
+
+            # Avec `replace`, une tâche déjà en cours n'empêche pas d'en planifier une nouvelle :
+            # elle ne démarrera qu'une fois la précédente terminée (voir `_claim`)
+            cursor = self._db.execute("INSERT INTO jobs (key, kind, payload, priority, run_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                      (key, kind, json.dumps(payload), priority, now + (delay if max_delay is None else min(delay, max_delay)), now, now))
+            if secrets is not None:
+                self._save_secrets(cursor.lastrowid, secrets)
+            self._wakeup.notify_all()
+            return self._get(cursor.lastrowid), True
+
+    def get(self, key: str) -> Optional[Job]:
+        """Dernière tâche connue pour `key`."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)).fetchone()
+        return Job(row) if row is not None else None
+
+    def list(self, limit: int = 100) -> List[Job]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs ORDER BY status IN ('queued', 'running') DESC, id DESC LIMIT ?", (limit,)).fetchall()
+        return [Job(row) for row in rows]
+
+    def counts(self) -> List[Tuple[str, str, int]]:
+        """Nombre de tâches par (kind, status), historique compris."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, status, COUNT(*) AS count FROM jobs GROUP BY kind, status").fetchall()
+        return [(row["kind"], row["status"], row["count"]) for row in rows]
+
+    def progress(self, job_id: int, done: int, total: int):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET progress_done = ?, progress_total = ?, updated_at = ? WHERE id = ?",
+                             (done, total, time.time(), job_id))
+
+    @contextmanager
+    def _write_transaction(self):
+        """Transaction SQLite verrouillée en écriture dès le début : sérialise aussi les autres processus."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _get(self, job_id: int) -> Job:
+        return Job(self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def _save_secrets(self, job_id: int, secrets: dict):
+        self._db.execute("INSERT OR REPLACE INTO job_secrets (job_id, secrets) VALUES (?, ?)",
+                         (job_id, json.dumps(secrets)))
+
+    def _load_secrets(self, job_id: int) -> Optional[dict]:
+        row = self._db.execute("SELECT secrets FROM job_secrets WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row["secrets"]) if row is not None else None
+
+    def _claim(self) -> Job:
+        """Attend et réserve la prochaine tâche exécutable."""
+        with self._lock:
+            while True:
+                now = time.time()
+                row = self._db.execute("SELECT * FROM jobs WHERE status = 'queued' AND run_at <= ? AND key NOT IN (SELECT key FROM jobs WHERE status = 'running') ORDER BY priority DESC, run_at, id LIMIT 1",
+                                       (now,)).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (now, row["id"]))
+                    job = self._get(row["id"])
+                    job.secrets = self._load_secrets(job.id)
+                    return job
+
+                # Les tâches déjà dues mais bloquées par une tâche en cours sont réveillées par `_finish`
+                next_row = self._db.execute(
+                    "SELECT MIN(run_at) AS run_at FROM jobs WHERE status = 'queued' AND run_at > ?", (now,)).fetchone()
+                timeout = next_row["run_at"] - now if next_row["run_at"] is not None else self.poll_interval
+                self._wakeup.wait(timeout=min(timeout, self.poll_interval))
+
+    def _finish(self, job: Job, error: Optional[str]):
+        with self._lock, self._write_transaction():
+            self._db.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                             ("failed" if error is not None else "done", error, time.time(), job.id))
+            self._db.execute("DELETE FROM job_secrets WHERE job_id = ?", (job.id,))
+            # Une tâche de même clé attendait peut-être la fin de celle-ci
+            self._wakeup.notify_all()
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            try:
+                self.handlers[job.kind](
+                    job, lambda done, total: self.progress(job.id, done, total))
+                self._finish(job, None)
+            except Exception as err:
+                print(f"Job {job.kind} {job.key} failed:", err)
+                traceback.print_exc()
+                self._finish(job, str(err))
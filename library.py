@@ -0,0 +1,256 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+_schema = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    source TEXT,
+    title TEXT NOT NULL,
+    series TEXT NOT NULL DEFAULT '',
+    series_number REAL NOT NULL DEFAULT 0,
+    authors TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    lang TEXT NOT NULL DEFAULT '',
+    subjects TEXT NOT NULL DEFAULT '',
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS books_catalog ON books(kind, series COLLATE NOCASE, series_number, title);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, series, authors, subjects, description,
+    content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS books_insert AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts(rowid, title, series, authors, subjects, description)
+    VALUES (new.id, new.title, new.series, new.authors, new.subjects, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS books_delete AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, series, authors, subjects, description)
+    VALUES ('delete', old.id, old.title, old.series, old.authors, old.subjects, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS books_update AFTER UPDATE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, series, authors, subjects, description)
+    VALUES ('delete', old.id, old.title, old.series, old.authors, old.subjects, old.description);
+    INSERT INTO books_fts(rowid, title, series, authors, subjects, description)
+    VALUES (new.id, new.title, new.series, new.authors, new.subjects, new.description);
+END;
+"""
+
+KINDS = ["volume", "chapter"]
+# Séparateur des auteurs et sujets dans leurs colonnes texte
+_LIST_SEPARATOR = "\n"
+_term_regexp = re.compile(r"\w+", re.UNICODE)
+
+
+class LibraryEntry:
+    def __init__(self, row: sqlite3.Row):
+        self.path: str = row["path"]
+        self.kind: str = row["kind"]
+        self.title: str = row["title"]
+        self.series: str = row["series"]
+        self.series_number: float = row["series_number"]
+        self.authors: List[str] = [author for author in row["authors"].split(_LIST_SEPARATOR) if author]
+        self.description: str = row["description"]
+        self.lang: str = row["lang"]
+        self.subjects: List[str] = [subject for subject in row["subjects"].split(_LIST_SEPARATOR) if subject]
+        self.size: int = row["size"]
+        self.mtime: float = row["mtime"]
+
+    @property
+    def updated(self) -> str:
+        """Date de modification au format RFC 3339 (OPDS)."""
+        return datetime.fromtimestamp(self.mtime, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def to_json(self) -> dict:
+        return {
+            "path": self.path,
+            "kind": self.kind,
+            "title": self.title,
+            "series": self.series,
+            "seriesNumber": self.series_number,
+            "authors": self.authors,
+            "description": self.description,
+            "lang": self.lang,
+            "subjects": self.subjects,
+            "size": self.size,
+            "updatedAt": str(datetime.fromtimestamp(self.mtime))[:19],
+        }
+
+
+def _fts_query(text: str) -> str:
+    """Requête FTS5 sûre : chaque mot du texte, comme préfixe, tous requis."""
+    return " ".join(f'"{term}"*' for term in _term_regexp.findall(text))
+
+
+class LibraryIndex:
+    """Index SQLite (FTS5) des EPUB de `root` : volumes fusionnés et chapitres.
+
+    Tenu à jour à chaque chapitre enregistré et à chaque fusion, il sert le catalogue et la
+    recherche sans ouvrir les EPUB ; `rebuild` le reconstruit pour une arborescence existante.
+    Les EPUB supprimés hors du serveur sont retirés de l'index dès qu'une page de résultats
+    les contient (et de toute l'arborescence par `rebuild`).
+    """
+
+    def __init__(self, root: Path, db_path: Path):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_schema)
+
+    def _relative(self, path: Path) -> str:
+        return Path(os.path.relpath(path, self.root)).as_posix()
+
+    def record(self, file_path: Path, metadata: dict, kind: str, source: Optional[Path] = None):
+        """Ajoute ou met à jour l'EPUB `file_path`, décrit par ses métadonnées mkepub.
+
+        `source` (dossier de chapitres d'un volume fusionné) remplace l'entrée d'une fusion
+        précédente du même dossier enregistrée sous un autre nom.
+        """
+        stat = Path(file_path).stat()
+        collections = metadata.get("collections") or []
+        try:
+            series_number = float(collections[0]["number"]) if len(collections) > 0 and "number" in collections[0] else 0
+        except (TypeError, ValueError):
+            series_number = 0
+        row = {
+            "path": self._relative(file_path),
+            "kind": kind,
+            "source": self._relative(source) if source is not None else None,
+            "title": metadata.get("title") or Path(file_path).stem,
+            "series": collections[0].get("name", "") if len(collections) > 0 else "",
+            "series_number": series_number,
+            "authors": _LIST_SEPARATOR.join(creator["name"] for creator in metadata.get("creators") or [] if creator.get("name")),
+            "description": metadata.get("description") or "",
+            "lang": metadata.get("lang") or "",
+            "subjects": _LIST_SEPARATOR.join(metadata.get("subjects") or []),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+        with self._lock:
+            if row["source"] is not None:
+                self._db.execute("DELETE FROM books WHERE source = ? AND path != ?", (row["source"], row["path"]))
+            self._db.execute(
+                "INSERT INTO books (path, kind, source, title, series, series_number, authors, description, lang, subjects, size, mtime) "
+                "VALUES (:path, :kind, :source, :title, :series, :series_number, :authors, :description, :lang, :subjects, :size, :mtime) "
+                "ON CONFLICT(path) DO UPDATE SET kind = excluded.kind, source = excluded.source, title = excluded.title, "
+                "series = excluded.series, series_number = excluded.series_number, authors = excluded.authors, "
+                "description = excluded.description, lang = excluded.lang, subjects = excluded.subjects, "
+                "size = excluded.size, mtime = excluded.mtime", row)
+
+    def remove(self, file_path: Path):
+        with self._lock:
+            self._db.execute("DELETE FROM books WHERE path = ?", (self._relative(file_path),))
+
+    def _existing(self, rows: List[sqlite3.Row], total: int) -> Tuple[List[LibraryEntry], int]:
+        """Entrées de `rows` dont l'EPUB existe encore, les autres étant retirées de l'index."""
+        entries = []
+        for row in rows:
+            file_path = self.root / row["path"]
+            if file_path.is_file():
+                entries.append(LibraryEntry(row))
+            else:
+                self.remove(file_path)
+                total -= 1
+        return entries, total
+
+    def catalog(self, kind: Optional[str] = None, series: Optional[str] = None,
+                offset: int = 0, limit: int = 50) -> Tuple[List[LibraryEntry], int]:
+        """Entrées triées par série, numéro puis titre, et leur nombre total."""
+        (where, params) = ([], [])
+        if kind is not None:
+            where.append("kind = ?")
+            params.append(kind)
+        if series is not None:
+            where.append("series = ?")
+            params.append(series)
+        condition = f"WHERE {' AND '.join(where)}" if len(where) > 0 else ""
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM books {condition}", params).fetchone()[0]
+            rows = self._db.execute(f"SELECT * FROM books {condition} ORDER BY series COLLATE NOCASE, series_number, title "
+                                    "LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+        return self._existing(rows, total)
+
+    def search(self, text: str, kind: Optional[str] = None, offset: int = 0, limit: int = 50) -> Tuple[List[LibraryEntry], int]:
+        """Recherche plein texte (titre, série, auteurs, sujets, description), par pertinence."""
+        query = _fts_query(text)
+        if query == "":
+            return [], 0
+        (condition, params) = ("AND books.kind = ?", [kind]) if kind is not None else ("", [])
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM books_fts JOIN books ON books.id = books_fts.rowid "
+                                     f"WHERE books_fts MATCH ? {condition}", [query] + params).fetchone()[0]
+            rows = self._db.execute(f"SELECT books.* FROM books_fts JOIN books ON books.id = books_fts.rowid "
+                                    f"WHERE books_fts MATCH ? {condition} ORDER BY bm25(books_fts), books.title "
+                                    "LIMIT ? OFFSET ?", [query] + params + [limit, offset]).fetchall()
+        return self._existing(rows, total)
+
+    def rebuild(self) -> int:
+        """Réindexe toute l'arborescence : volumes d'après les manifestes de fusion, chapitres
+        d'après l'index de leur dossier (ou leur OPF). Renvoie le nombre d'EPUB indexés."""
+        # Imports locaux : l'index seul (catalogue, recherche) ne dépend pas de mkepub
+        from chapter_index import CHAPTER_METADATA_KEYS, indexed_metadata, load_index
+        from epub_merge import merged_volume_metadata
+
+        volumes = {}
+        for manifest in self.root.rglob(".*.merge.json"):
+            volume_folder = manifest.parent / manifest.name[1:-len(".merge.json")]
+            merged = merged_volume_metadata(volume_folder)
+            if merged is not None and (manifest.parent / merged[0]).is_file():
+                volumes[manifest.parent / merged[0]] = (merged[1], volume_folder)
+
+        with self._lock:
+            self._db.execute("DELETE FROM books")
+        count = 0
+        for (folder, _, files) in os.walk(self.root):
+            folder = Path(folder)
+            if any(part.startswith(".") for part in folder.relative_to(self.root).parts):
+                continue
+            index = None
+            for name in files:
+                file = folder / name
+                if name.startswith(".") or not name.lower().endswith(".epub"):
+                    continue
+                try:
+                    if file in volumes:
+                        (metadata, volume_folder) = volumes[file]
+                        self.record(file, metadata, "volume", volume_folder)
+                    else:
+                        index = index if index is not None else load_index(folder)
+                        metadata = indexed_metadata(index, file, file.stat())
+                        if metadata is None:
+                            from mkepub import Book
+                            book = Book.read(file)
+                            metadata = {key: book.metadata[key] for key in CHAPTER_METADATA_KEYS if key in book.metadata}
+                        self.record(file, metadata, "chapter")
+                    count += 1
+                except Exception as err:
+                    print(f"Can't index {file}:", err)
+        return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reconstruit l'index de la bibliothèque (catalogue OPDS et recherche) de <directory_path>.")
+    parser.add_argument("directory_path")
+    # Même base par défaut que le serveur : hors de l'arborescence servie
+    parser.add_argument("-d", "--database", type=Path,
+                        default=os.environ.get("LIBRARY_DATABASE", Path(os.environ.get("DATA_FOLDER", "./data/")) / "library.sqlite3"),
+                        help="base SQLite de l'index (par défaut LIBRARY_DATABASE, sinon <DATA_FOLDER>/library.sqlite3)")
+    args = parser.parse_args()
+
+    root = Path(args.directory_path)
+    start = time.perf_counter()
+    count = LibraryIndex(root, args.database).rebuild()
+    print(f"{count} EPUB indexed in {time.perf_counter() - start:.2f}s")
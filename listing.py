@@ -0,0 +1,76 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, NamedTuple
+
+from natsort import natsorted
+
+
+class DirectoryEntry(NamedTuple):
+    name: str
+    is_dir: bool
+    size: int
+    mtime: float
+
+
+class DirectoryListing(NamedTuple):
+    entries: List[DirectoryEntry]
+    mtime_ns: int
+    etag: str
+
+
+class DirectoryListingCache:
+    """Listings de dossiers construits en une seule passe `os.scandir`, triés une fois.
+
+    Un listing est réutilisé tant que la date de modification du dossier ne change pas ;
+    `invalidate` permet aux écritures du serveur de forcer sa reconstruction.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._listings: "OrderedDict[str, DirectoryListing]" = OrderedDict()
+
+    def get(self, path: Path) -> DirectoryListing:
+        key = os.path.realpath(path)
+        mtime_ns = os.stat(key).st_mtime_ns
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None and listing.mtime_ns == mtime_ns:
+                self._listings.move_to_end(key)
+                return listing
+
+        listing = self._build(key, mtime_ns)
+        with self._lock:
+            self._listings[key] = listing
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_entries:
+                self._listings.popitem(last=False)
+        return listing
+
+    def invalidate(self, path: Path):
+        with self._lock:
+            self._listings.pop(os.path.realpath(path), None)
+
+    def _build(self, path: str, mtime_ns: int) -> DirectoryListing:
+        entries = []
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    # DirEntry.stat() met en cache le résultat : un seul appel système par entrée
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append(DirectoryEntry(
+                    entry.name, entry.is_dir(), stat.st_size, stat.st_mtime))
+
+        # Dossiers d'abord, puis par nom (ordre naturel inversé)
+        entries = natsorted(entries, key=lambda e: (
+            e.is_dir, e.name.lower()), reverse=True)
+        etag = hashlib.sha1("\0".join([path, str(mtime_ns)] + [
+            f"{e.name}:{e.size}:{e.mtime}" for e in entries]).encode("utf-8")).hexdigest()
+        return DirectoryListing(entries, mtime_ns, etag)
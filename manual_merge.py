@@ -1,73 +1,84 @@
-import os, re
-from typing import List
-from mkepub import Book, BookMetadata
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from epub_merge import is_up_to_date, merge_volume, merged_volume_stats
+from epub_writer import CompressionPolicy
 from pathlib import Path
+from typing import Optional, Tuple
 
 
-def merge_dir(dir_path: Path):
-    """Fonction appelée par le Timer pour lister le dossier et appeler le callback (si fourni)."""
-    dir_path = Path(dir_path)
-
-    try:
-        nodes = os.listdir(dir_path)
-    except Exception:
-        nodes = []
-
-    # nodes.sort(key=lambda a: int(re.findall(r"(?<=Chapitre )(\d+)", a)[0]) if re.findall(r"(?<=Chapitre )(\d+)", a) else 0)
-
-    files = list(map(lambda node: os.path.join(dir_path, node), nodes))
-
-    books : List[Book]= []
-    for file in files:
-        if os.path.isfile(file) and file.lower().endswith(".epub"):
-            book = Book.read(file)
-            books.append(book)
-    
-    books.sort(key=lambda book: book.metadata["collections"][0]["number"] if "collections" in book.metadata and len(book.metadata["collections"]) > 0 and "number" in book.metadata["collections"][0] else 0)
+def merge_dir(dir_path: Path, full: bool = True, compression: Optional[CompressionPolicy] = None,
+              threads: int = 0) -> Tuple[Optional[Path], float]:
+    """Fusionne les chapitres de `dir_path`, titre déduit du dossier parent.
 
-    root_folder = dir_path.parent
-    book_title = root_folder.name if root_folder.name not in ["Chapitres", "Volumes"] else books[0].metadata["collections"][0]["name"] if len(books) > 0 and "collections" in books[0].metadata and len(books[0].metadata["collections"]) > 0 else root_folder.parent.name
-
-    merged_metadata : BookMetadata = {
-        "title": book_title,
-        "collections": books[0].metadata["collections"] if len(books) > 0 and "collections" in books[0].metadata else [],
-        "creators": [dict(t) for t in list({ tuple(sorted(creator.items())) for book in books for creator in book.metadata["creators"] })],
-        "contributors": [dict(t) for t in list({ tuple(sorted(contributor.items())) for book in books for contributor in book.metadata["contributors"] })],
-        "description": "\n\n".join(set([book.metadata["description"] for book in books if "description" in book.metadata and book.metadata["description"] is not None])),
-        "lang": books[0].metadata["lang"] if len(books) > 0 and "lang" in books[0].metadata else "en",
-        "rights": books[0].metadata["rights"] if len(books) > 0 and "rights" in books[0].metadata else "",
-        "subjects": list(set([subject for book in books for subject in book.metadata.get("subjects", [])]))
-    }
+    Renvoie le fichier fusionné et la durée de la fusion en secondes.
+    """
+    dir_path = Path(dir_path)
 
-    if len(merged_metadata["collections"]) > 0 and "number" in merged_metadata["collections"][0]:
-        merged_metadata["collections"][0]["number"] = int(merged_metadata["collections"][0]["number"])
+    start = time.perf_counter()
+    filename = merge_volume(dir_path, title_folder=dir_path.parent, full=full,
+                            compression=compression, compression_threads=threads)
+    return filename, time.perf_counter() - start
 
-    novel_folder = os.path.realpath(os.path.join(dir_path, ".."))
 
-    merge_result = Book.merge(merged_metadata, *books)
+def format_compression(stats: Optional[dict]) -> str:
+    """Résumé des statistiques de compression d'une fusion, par type d'entrée."""
+    if stats is None:
+        return ""
+    kinds = [f"{kind} {entries['entries']} ({entries['copied']} copied) "
+             f"{entries['size'] / 2 ** 20:.1f}->{entries['compressed_size'] / 2 ** 20:.1f} MB {entries['seconds']:.2f}s"
+             for (kind, entries) in stats["entries"].items() if entries["entries"] > 0]
+    return f"write {stats['seconds']:.2f}s [{stats['policy']}, {stats['threads']} threads]: {', '.join(kinds)}"
 
-    merge_result.set_cover(books[0].get_cover())
 
-    filename = os.path.join(novel_folder, f"{merged_metadata['title']}.epub")
-    if os.path.exists(filename):
-        try:
-            os.unlink(filename)
-        except Exception:
-            pass
+def leaf_dirs(root: str):
+    for (dirpath, dirnames, _) in os.walk(root):
+        # Dossiers cachés (ancien cache d'images, données internes) : jamais des volumes
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        if len(dirnames) > 0: continue
+        yield Path(dirpath)
 
-    print(f"saving to {filename}")
-    merge_result.save(filename=os.path.join(novel_folder, f"{merged_metadata['title']}.epub"), with_visible_toc=True, with_cover_as_first_page=True)
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python manual_merge.py <directory_path>")
-        sys.exit(1)
-
-    dir_path = sys.argv[1]
+    parser = argparse.ArgumentParser(
+        description="Fusionne les chapitres de chaque dossier feuille de <directory_path>.")
+    parser.add_argument("directory_path")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="nombre de dossiers fusionnés en parallèle")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="liste les dossiers à refusionner sans rien écrire")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="refusionne tous les dossiers, même à jour, en relisant tous les chapitres")
+    parser.add_argument("-c", "--compression", type=CompressionPolicy, default=CompressionPolicy(),
+                        help="compression par type d'entrée, par exemple 'images=stored,text=deflate:9'")
+    parser.add_argument("-t", "--threads", type=int, default=0,
+                        help="threads de compression par fusion")
+    args = parser.parse_args()
+
+    dir_path = args.directory_path
     if dir_path.endswith(os.sep):
         dir_path = dir_path[:-1]
 
-    for (dirpath, dirnames, _) in os.walk(dir_path):
-        if len(dirnames) > 0: continue
-        merge_dir(dirpath)
+    folders = [folder for folder in leaf_dirs(dir_path)
+               if args.force or not is_up_to_date(folder, title_folder=folder.parent, compression=args.compression)]
+
+    if args.dry_run:
+        for folder in folders:
+            print(f"would merge {folder}")
+        print(f"{len(folders)} folder(s) to merge")
+        raise SystemExit(0)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+        futures = {executor.submit(merge_dir, folder, args.force, args.compression, args.threads): folder
+                   for folder in folders}
+        for future in as_completed(futures):
+            try:
+                (filename, duration) = future.result()
+                print(f"[{duration:.2f}s] {futures[future]} -> {filename}")
+                if filename is not None:
+                    print(f"    {format_compression(merged_volume_stats(futures[future]))}")
+            except Exception as err:
+                print(f"[failed] {futures[future]}: {err}")
+    print(f"{len(folders)} folder(s) merged in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,159 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for (name, value) in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if len(labels) > 0 else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def expose(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                    for (key, value) in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Valeur instantanée, fixée avec `set` ou lue au moment de l'exposition via `callback`.
+
+    `callback` renvoie une liste de (valeurs des labels, valeur).
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 callback: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.callback is not None:
+            try:
+                values = list(self.callback())
+            except Exception:
+                values = []
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for (key, value) in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Par labels : (compteurs par bucket, somme, nombre)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            (counts, total, count) = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for (index, bound) in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe la durée du bloc `with`, même s'il lève une exception."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for (key, (counts, total, count)) in self._values.items():
+                cumulative = 0
+                for (bound, bucket_count) in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _format_value(bound) + '"'
+                    samples.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+                samples.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+                samples.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return samples
+
+
+class Registry:
+    """Ensemble de métriques exposées au format texte de Prometheus (version 0.0.4)."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def expose(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.expose()) + "\n"
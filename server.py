@@ -1,26 +1,50 @@
+from __future__ import annotations
+
 import base64
 import binascii
-import io
+import hashlib
 import os
 import json
 import requests
-import threading
 import re
 import math
+import mimetypes
 import copy
-import random
+import functools
+import tempfile
+import time
 from werkzeug.utils import secure_filename
-from flask import Flask, request, send_from_directory, abort, send_file, render_template
+from flask import Flask, request, send_from_directory, abort, send_file, render_template, make_response, url_for
 from flask_cors import CORS
-from urllib.parse import quote, unquote
-from typing import List, Callable
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote, urlsplit
+from typing import TYPE_CHECKING, Dict, List, Callable, Optional, Tuple
 from datetime import datetime
-from mkepub import Book, BookMetadata, BookCollectionMetadata, ContributorMetadata
-from natsort import natsorted
 from dotenv import load_dotenv
-from PIL import Image
 from pathlib import Path
-from bs4 import BeautifulSoup
+from epub_merge import MergeCancelled, is_up_to_date, merge_volume, merged_volume_metadata, merged_volume_stats
+from epub_writer import CompressionPolicy
+from fetch_ledger import FetchLedger, classes_sha256, conditional_headers, content_sha256
+from chapter_index import record_chapter
+from fetch_limits import ConcurrencyLimiter
+from http_pool import HttpPool, ProxyListRefresher, ProxyRotation, proxy_config
+from metrics import SIZE_BUCKETS, Registry
+from css_cache import ObfuscationCssCache
+from workers import BoundedProcessPool
+from job_queue import Job, JobQueue
+from listing import DirectoryListingCache
+from library import KINDS, LibraryIndex
+from deobfuscation import deobfuscate_chapter, deobfuscate_chapter_soup, find_stylesheet_href, replace_image_src
+from asset_cache import AssetCache, convert_keeping_format, convert_to_png, generate_cover, image_extension
+from uploads import ChapterUpload, drain, iter_parts
+
+if TYPE_CHECKING:
+    # Types des métadonnées mkepub (annotations seulement)
+    from mkepub import BookMetadata, BookCollectionMetadata, ContributorMetadata
+
+# Lancé par `python server.py`, ce module est réimporté sous le nom `__mp_main__` par les
+# processus du pool : rien n'y est alors démarré (file de tâches, rafraîchissement des proxies)
+_pool_process = __name__ == "__mp_main__"
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path)
@@ -30,7 +54,15 @@ image_data_url_regexp = re.compile(
     r"^data:(image/[\w.+-]+)?;base64,(.*)$", re.IGNORECASE | re.DOTALL)
 
 EPUB_ROOT_FOLDER = Path(os.environ.get("EPUB_ROOT_FOLDER", "./results/"))
-locks = {}
+# Données internes du serveur (bases SQLite), hors de EPUB_ROOT_FOLDER qui est servi tel quel
+DATA_FOLDER = Path(os.environ.get("DATA_FOLDER", "./data/"))
+# "incremental" : seuls les chapitres nouveaux ou modifiés sont relus (voir epub_merge.py)
+# "full" : relecture de tous les chapitres à chaque fusion
+MERGE_MODE = os.environ.get("MERGE_MODE", "incremental")
+# Compression des entrées des EPUB par type (voir epub_writer.CompressionPolicy), par exemple
+# "images=stored,text=deflate:9", et threads de compression par fusion (0 : dans le thread de la fusion)
+EPUB_COMPRESSION = CompressionPolicy(os.environ.get("EPUB_COMPRESSION", ""))
+EPUB_COMPRESSION_THREADS = int(os.environ.get("EPUB_COMPRESSION_THREADS", 0))
 line_break_style = """
 p {
     margin: 13px 0;
@@ -74,21 +106,148 @@ object-fit: contain;
 }
 """
 
+# Délégation de l'envoi des fichiers au reverse proxy : X-Accel-Redirect (nginx, préfixe de la location interne)
+# ou X-Sendfile (Apache, lighttpd)
+X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX", None)
+USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE", "").lower() in ["1", "true", "yes"]
+mimetypes.add_type("application/epub+zip", ".epub")
+
+# Listings de dossiers mis en cache (invalidés à chaque écriture du serveur) et taille des pages
+listing_cache = DirectoryListingCache()
+LISTING_PAGE_SIZE = int(os.environ.get("LISTING_PAGE_SIZE", 500))
+
+# Index de la bibliothèque (catalogue OPDS / JSON et recherche), reconstruit avec `python library.py`
+LIBRARY_DATABASE = Path(os.environ.get("LIBRARY_DATABASE", DATA_FOLDER / "library.sqlite3"))
+CATALOG_PAGE_SIZE = int(os.environ.get("CATALOG_PAGE_SIZE", 50))
+library = LibraryIndex(EPUB_ROOT_FOLDER, LIBRARY_DATABASE)
+
+# File de tâches persistante (téléchargements de volumes et fusions)
+JOB_DATABASE = Path(os.environ.get("JOB_DATABASE", DATA_FOLDER / "jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 3))
+MERGE_JOB_PRIORITY = 10
+# Délai maximal (s) entre la première demande de fusion d'un dossier et son exécution,
+# même si des chapitres continuent d'arriver
+MERGE_MAX_WAIT = float(os.environ.get("MERGE_MAX_WAIT", 120))
+
+# Pool de processus pour la conversion des images, la désobfuscation et la fusion (0 = pas de pool)
+PROCESS_POOL_WORKERS = int(os.environ.get("PROCESS_POOL_WORKERS", os.cpu_count() or 1))
+PROCESS_POOL_QUEUE_SIZE = int(os.environ.get("PROCESS_POOL_QUEUE_SIZE", PROCESS_POOL_WORKERS * 4))
+process_pool = BoundedProcessPool(PROCESS_POOL_WORKERS, PROCESS_POOL_QUEUE_SIZE,
+                                  preload=["asset_cache", "deobfuscation", "epub_merge"])
+
+# Nombre de chapitres téléchargés en parallèle par volume, et limites globales par hôte / proxy
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", 8))
+FETCH_CONCURRENCY_PER_HOST = int(os.environ.get("FETCH_CONCURRENCY_PER_HOST", 8))
+FETCH_CONCURRENCY_PER_PROXY = int(os.environ.get("FETCH_CONCURRENCY_PER_PROXY", 4))
+fetch_limiter = ConcurrencyLimiter(FETCH_CONCURRENCY_PER_HOST, FETCH_CONCURRENCY_PER_PROXY)
+
+# Connexions HTTP partagées (keep-alive) et relances avec délai exponentiel vers le CDN des chapitres
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", max(FETCH_CONCURRENCY_PER_HOST, 10)))
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", 3))
+FETCH_RETRY_BACKOFF = float(os.environ.get("FETCH_RETRY_BACKOFF", 0.5))
+# Délai maximal (s) d'une requête sortante sans réponse, par tentative
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", 60))
+PROXY_COOLDOWN = float(os.environ.get("PROXY_COOLDOWN", 30))
+http_pool = HttpPool(HTTP_POOL_SIZE, FETCH_RETRIES, FETCH_RETRY_BACKOFF, retry_hosts=["cdn.world-novel.fr"], headers={
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/112.0",
+    "Origin": "https://world-novel.fr",
+    "Referer": "https://world-novel.fr/",
+})
+
+CSS_CACHE_SIZE = int(os.environ.get("CSS_CACHE_SIZE", 256))
+CSS_CACHE_TTL = float(os.environ.get("CSS_CACHE_TTL", 3600))
+CSS_CACHE_FILE = os.environ.get("CSS_CACHE_FILE", None)
+css_cache = ObfuscationCssCache(CSS_CACHE_SIZE, CSS_CACHE_TTL, Path(CSS_CACHE_FILE) if CSS_CACHE_FILE else None)
+
+# Cache disque des couvertures et images déjà converties en PNG (voir asset_cache.py)
+ASSET_CACHE_FOLDER = Path(os.environ.get("ASSET_CACHE_FOLDER", DATA_FOLDER / "assets"))
+ASSET_CACHE_MAX_BYTES = int(os.environ.get("ASSET_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+asset_cache = AssetCache(ASSET_CACHE_FOLDER, ASSET_CACHE_MAX_BYTES)
+# Police TrueType des couvertures générées pour les envois sans couverture
+COVER_FONT = os.environ.get("COVER_FONT", "DejaVuSans.ttf")
+
+# "resource" : images des chapitres stockées comme ressources EPUB, "inline" : data URL base64
+CHAPTER_IMAGE_MODE = os.environ.get("CHAPTER_IMAGE_MODE", "resource")
+# "png" : conversion systématique en PNG, "original" : PNG/JPEG/GIF conservés, autres formats en JPEG
+CHAPTER_IMAGE_FORMAT = os.environ.get("CHAPTER_IMAGE_FORMAT", "png")
+# Taille maximale d'une requête (413 au-delà) et des parties d'un envoi lues en mémoire (HTML, JSON)
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 64 * 1024 * 1024))
+MAX_UPLOAD_PART_SIZE = int(os.environ.get("MAX_UPLOAD_PART_SIZE", 16 * 1024 * 1024))
+
+# Mode ASGI (asgi.py, dont le nombre de processus est WEB_WORKERS) : threads exécutant les vues Flask par processus
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", 16))
+
+# Point d'accès des chapitres obfusqués (remplaçable, par exemple par le CDN local des benchmarks)
+CHAPTER_CDN_URL = os.environ.get("CHAPTER_CDN_URL", "https://cdn.world-novel.fr/chapitres/?userId=dEVJy3lAr5O3r3AQ0JSjraRMXvC3")
+# "stream" : filtre en un passage sur le tokenizer HTML, "soup" : ancien arbre BeautifulSoup
+DEOBFUSCATION_ENGINE = os.environ.get("DEOBFUSCATION_ENGINE", "stream")
+
 PROXY_API_URL = os.environ.get("PROXY_API_URL", None)
 PROXY_API_AUTHORIZATION = os.environ.get("PROXY_API_AUTHORIZATION", None)
-proxy_list = []
-try:
-    if PROXY_API_URL is not None:
-        proxy_list_api_call = response = requests.get( PROXY_API_URL, headers={"Authorization": PROXY_API_AUTHORIZATION}).json()
-        if proxy_list_api_call is None or proxy_list_api_call["count"] < 1:
-            raise Exception("No proxies available")
-        else:
-            proxy_list = list(map(lambda proxy: f"{proxy['username']}:{proxy['password']}@{proxy['proxy_address']}:{proxy['port']}", response.get("results", [])))
-            print(f"Using {len(proxy_list)} prox{'ies' if len(proxy_list) > 1 else 'y'}")
-    else:
-        print("No proxy API URL provided, proceeding without proxies.")
-except Exception as e:
-    print(f"Could not fetch proxy list: {e}")
+# Liste des proxies chargée en arrière-plan au démarrage, puis rechargée toutes les PROXY_REFRESH_INTERVAL secondes
+PROXY_REFRESH_INTERVAL = float(os.environ.get("PROXY_REFRESH_INTERVAL", 900))
+# URL de vérification de chaque proxy (HEAD) à chaque chargement ("" : pas de vérification)
+PROXY_CHECK_URL = os.environ.get("PROXY_CHECK_URL", "https://world-novel.fr/")
+PROXY_CHECK_TIMEOUT = float(os.environ.get("PROXY_CHECK_TIMEOUT", 10))
+# Attente maximale (s) de la liste des proxies par un téléchargement lancé juste après le démarrage
+PROXY_STARTUP_WAIT = float(os.environ.get("PROXY_STARTUP_WAIT", 30))
+proxy_rotation = ProxyRotation([], PROXY_COOLDOWN)
+
+
+def _load_proxy_list() -> List[str]:
+    response = requests.get(PROXY_API_URL, headers={"Authorization": PROXY_API_AUTHORIZATION}, timeout=30).json()
+    if response is None or response["count"] < 1:
+        raise Exception("No proxies available")
+    proxy_list = list(map(lambda proxy: f"{proxy['username']}:{proxy['password']}@{proxy['proxy_address']}:{proxy['port']}", response.get("results", [])))
+    print(f"Using {len(proxy_list)} prox{'ies' if len(proxy_list) > 1 else 'y'}")
+    return proxy_list
+
+
+def _check_proxy(proxy: str):
+    response = http_pool.session().head(PROXY_CHECK_URL, proxies=proxy_config(proxy), timeout=PROXY_CHECK_TIMEOUT)
+    if response.status_code == 407 or response.status_code >= 500:
+        raise Exception(f"Proxy check returned {response.status_code}")
+
+
+proxy_refresher = None
+if PROXY_API_URL is not None and not _pool_process:
+    proxy_refresher = ProxyListRefresher(proxy_rotation, _load_proxy_list, PROXY_REFRESH_INTERVAL,
+                                         check=_check_proxy if PROXY_CHECK_URL else None).start()
+elif PROXY_API_URL is None and not _pool_process:
+    print("No proxy API URL provided, proceeding without proxies.")
+
+# Métriques exposées sur /metrics (format texte Prometheus)
+metrics = Registry()
+fetch_seconds = metrics.histogram(
+    "epub_fetch_seconds", "Durée des requêtes HTTP sortantes (relances comprises)", ["host", "proxy"])
+fetch_errors = metrics.counter(
+    "epub_fetch_errors_total", "Requêtes HTTP sortantes en échec (erreur réseau, 407, 429 ou 5xx)", ["host", "proxy"])
+deobfuscation_seconds = metrics.histogram(
+    "epub_deobfuscation_seconds", "Durée de désobfuscation d'un chapitre, attente du pool de processus comprise", ["engine"])
+image_conversion_seconds = metrics.histogram(
+    "epub_image_conversion_seconds", "Durée de conversion d'une image, attente du pool de processus comprise", ["format"])
+epub_save_seconds = metrics.histogram(
+    "epub_save_seconds", "Durée d'écriture d'un EPUB de chapitre", ["source"])
+merge_seconds = metrics.histogram(
+    "epub_merge_seconds", "Durée des fusions de volume", ["result"])
+merge_output_bytes = metrics.histogram(
+    "epub_merge_output_bytes", "Taille des EPUB de volume fusionnés", buckets=SIZE_BUCKETS)
+merge_compression_seconds = metrics.histogram(
+    "epub_merge_compression_seconds", "Durée cumulée de compression (ou de copie brute) des entrées d'une fusion", ["kind"])
+merge_entries = metrics.counter(
+    "epub_merge_entries_total", "Entrées écrites par les fusions : recopiées sans recompression ou réécrites", ["kind", "result"])
+chapter_refreshes = metrics.counter(
+    "epub_dump_chapters_total", "Chapitres traités par les téléchargements de volume : nouveaux, modifiés ou inchangés", ["result"])
+merge_requests = metrics.counter(
+    "epub_merge_requests_total", "Demandes de fusion : nouvelle tâche, ou regroupée avec une tâche en attente", ["result"])
+metrics.gauge("epub_jobs", "Tâches de la file par type et statut", ["kind", "status"],
+              callback=lambda: [((kind, status), count) for (kind, status, count) in job_queue.counts()])
+metrics.gauge("epub_fetch_slots_in_use", "Places de téléchargement occupées, par hôte et par proxy", ["kind", "name"],
+              callback=lambda: fetch_limiter.in_use())
+metrics.gauge("epub_process_pool_in_flight", "Tâches soumises au pool de processus et non terminées",
+              callback=lambda: [((), process_pool.in_flight)])
+metrics.gauge("epub_http_pool", "Requêtes, échecs, connexions ouvertes et réutilisées du pool HTTP", ["stat"],
+              callback=lambda: [((stat,), value) for (stat, value) in http_pool.stats().items()])
 
 
 class NovelMetadata:
@@ -135,194 +294,364 @@ def decode_data_url_to_bytes(data_url: str) -> bytes:
         raise ValueError(f"Contenu base64 invalide: {e}")
 
 
-_debounce_lock = threading.Lock()
-_debounce_timers: dict = {}
+def debounce_execution(dir_path: Path, delay: float = 5.0):
+    """Planifie la fusion du dossier `dir_path` après `delay` secondes d'inactivité.
 
-
-def debounce_execution(dir_path: Path, callback: Callable[[list], None], delay: float = 5.0):
-    """Planifie une lecture (listing) du dossier `dir_path` après `delay` secondes d'inactivité.
-
-    Si la fonction est rappelée avant la fin du délai, l'exécution est repoussée (debounce).
-    `callback` est optionnel et reçoit la liste des fichiers au moment de l'exécution.
+    Si la fonction est rappelée avant la fin du délai, l'exécution est repoussée (debounce),
+    au plus tard `MERGE_MAX_WAIT` secondes après la première demande. Les demandes sont
+    regroupées en une seule tâche de `job_queue` par dossier : deux fusions d'un même dossier
+    ne tournent jamais en parallèle, et la tâche survit à un redémarrage du serveur.
     """
 
     resolved_path = dir_path.resolve()
-    with _debounce_lock:
-        existing = _debounce_timers.get(resolved_path)
-        if existing is not None:
-            try:
-                existing.cancel()
-            except Exception:
-                pass
-
-        timer = threading.Timer(
-            interval=delay, function=callback, args=[dir_path])
-        timer.daemon = True
-        _debounce_timers[resolved_path] = timer
-        timer.start()
+    (_, created) = job_queue.enqueue("merge", f"merge:{resolved_path}", {"folder": str(resolved_path)},
+                      priority=MERGE_JOB_PRIORITY, delay=delay, replace=True, max_delay=MERGE_MAX_WAIT)
+    merge_requests.inc(result="scheduled" if created else "coalesced")
 
 
-def _run_book_merging(volume_folder: Path):
-    """Fonction appelée par le Timer pour lister le dossier et appeler le callback (si fourni)."""
+def _run_book_merging(volume_folder: Path, cancel_on_change: bool = False):
+    """Fusionne les chapitres de `volume_folder` en un EPUB de volume (voir epub_merge.merge_volume)."""
+    start = time.perf_counter()
     try:
-        nodes = os.listdir(volume_folder)
+        output_path = process_pool.run(merge_volume, volume_folder, full=MERGE_MODE == "full",
+                                       cancel_on_change=cancel_on_change, compression=EPUB_COMPRESSION,
+                                       compression_threads=EPUB_COMPRESSION_THREADS)
+    except MergeCancelled:
+        merge_seconds.observe(time.perf_counter() - start, result="cancelled")
+        raise
     except Exception:
-        nodes = []
-
-    files = list(map(lambda node: volume_folder / node, nodes))
-
-    books: List[Book] = []
-    for file in files:
-        if file.is_file() and file.name.lower().endswith(".epub"):
-            book = Book.read(file)
-            books.append(book)
-
-    books.sort(key=lambda book: book.metadata["collections"][0]["number"] if "collections" in book.metadata and len(
-        book.metadata["collections"]) > 0 and "number" in book.metadata["collections"][0] else 0)
-
-    book_title = volume_folder.name if volume_folder.name not in ["Chapitres", "Volumes"] else books[0].metadata["collections"][0]["name"] if len(
-        books) > 0 and "collections" in books[0].metadata and len(books[0].metadata["collections"]) > 0 else volume_folder.parent.name
-
-    merged_metadata: BookMetadata = {
-        "title": book_title,
-        "collections": books[0].metadata["collections"] if len(books) > 0 and "collections" in books[0].metadata else [],
-        "creators": [dict(t) for t in list({tuple(sorted(creator.items())) for book in books for creator in book.metadata["creators"]})],
-        "contributors": [dict(t) for t in list({tuple(sorted(contributor.items())) for book in books for contributor in book.metadata["contributors"]})],
-        "description": "\n\n".join(set([book.metadata["description"] for book in books if "description" in book.metadata and book.metadata["description"] is not None])),
-        "lang": books[0].metadata["lang"] if len(books) > 0 and "lang" in books[0].metadata else "en",
-        "rights": books[0].metadata["rights"] if len(books) > 0 and "rights" in books[0].metadata else "",
-        "subjects": list(set([subject for book in books for subject in book.metadata.get("subjects", [])]))
-    }
+        merge_seconds.observe(time.perf_counter() - start, result="failed")
+        raise
+    merge_seconds.observe(time.perf_counter() - start, result="done")
+    if output_path is not None:
+        merge_output_bytes.observe(output_path.stat().st_size)
+        _observe_merge_compression(volume_folder)
+        try:
+            merged = merged_volume_metadata(volume_folder)
+            if merged is not None:
+                library.record(output_path, merged[1], "volume", source=volume_folder)
+        except Exception as err:
+            print(f"Could not index {output_path} in the library:", err)
+    listing_cache.invalidate(volume_folder.parent)
+
+
+def _observe_merge_compression(volume_folder: Path):
+    stats = merged_volume_stats(volume_folder)
+    if stats is None:
+        return
+    for (kind, entries) in stats["entries"].items():
+        if entries["entries"] == 0:
+            continue
+        merge_compression_seconds.observe(entries["seconds"], kind=kind)
+        merge_entries.inc(entries["copied"], kind=kind, result="copied")
+        merge_entries.inc(entries["entries"] - entries["copied"], kind=kind, result="rewritten")
+
 
-    if len(merged_metadata["collections"]) > 0 and "number" in merged_metadata["collections"][0]:
-        merged_metadata["collections"][0]["number"] = int(
-            merged_metadata["collections"][0]["number"])
+def _record_chapter(file_path: Path, metadata: dict):
+    """Enregistre un chapitre sauvegardé dans l'index de son dossier (fusion) et dans la bibliothèque."""
+    record_chapter(file_path, metadata)
+    try:
+        library.record(file_path, metadata, "chapter")
+    except Exception as err:
+        print(f"Could not index {file_path} in the library:", err)
 
-    novel_folder = volume_folder.parent
 
-    merge_result = Book.merge(merged_metadata, *books)
+def _converter(convert: Callable[[bytes], bytes], image_format: str) -> Callable[[bytes], bytes]:
+    """Conversion d'image exécutée dans le pool de processus et chronométrée."""
+    def run(data: bytes) -> bytes:
+        with image_conversion_seconds.time(format=image_format):
+            return process_pool.run(convert, data)
+    return run
 
-    merge_result.set_cover(books[0].get_cover())
 
-    filename = novel_folder / f"{merged_metadata['title']}.epub"
-    if os.path.exists(filename):
+def _fetch_response(url: str, firebase_app_check_token: str = None, **kwargs) -> requests.Response:
+    """GET via le pool HTTP partagé et le proxy en meilleure santé.
+
+    Sur erreur réseau (relances du pool épuisées), la requête est retentée une fois par un autre proxy.
+    """
+    if firebase_app_check_token is not None:
+        kwargs["headers"] = {**kwargs.get("headers", {}), "X-Firebase-AppCheck": firebase_app_check_token}
+    kwargs.setdefault("timeout", FETCH_TIMEOUT)
+    if proxy_refresher is not None:
+        # Juste après le démarrage : pas de requête directe tant que la liste des proxies est attendue
+        proxy_refresher.ready.wait(PROXY_STARTUP_WAIT)
+    host = urlsplit(url).netloc
+    tried = []
+    while True:
+        proxy = proxy_rotation.acquire(exclude=tried)
+        proxy_label = proxy.rsplit("@", 1)[-1] if proxy else "direct"
         try:
-            os.unlink(filename)
-        except Exception:
-            pass
+            with fetch_limiter.slot(url, proxy):
+                started = time.monotonic()
+                try:
+                    response = http_pool.get(url, proxy, **kwargs)
+                finally:
+                    fetch_seconds.observe(time.monotonic() - started, host=host, proxy=proxy_label)
+        except requests.exceptions.RequestException:
+            fetch_errors.inc(host=host, proxy=proxy_label)
+            proxy_rotation.release(proxy, None)
+            tried.append(proxy)
+            if proxy is None or len(tried) >= min(2, len(proxy_rotation)):
+                raise
+            continue
+        failed = response.status_code in [407, 429] or response.status_code >= 500
+        if failed:
+            fetch_errors.inc(host=host, proxy=proxy_label)
+        proxy_rotation.release(proxy, None if failed else time.monotonic() - started)
+        return response
+
+
+def _fetch(url: str, firebase_app_check_token: str = None, **kwargs) -> bytes:
+    return _fetch_response(url, firebase_app_check_token, **kwargs).content
+
+
+def _fetch_asset(url: str, headers: dict, firebase_app_check_token: str = None) -> Tuple[Optional[bytes], dict]:
+    """Image pour le cache d'images (requête conditionnelle d'après `headers`) : contenu, ou None
+    si elle n'a pas changé (304), et validateurs HTTP."""
+    response = _fetch_response(url, firebase_app_check_token, headers=headers)
+    if response.status_code == 304:
+        return None, {}
+    return response.content, {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
 
-    merge_result.save(filename=os.path.join(
-        novel_folder, f"{merged_metadata['title']}.epub"), with_visible_toc=True, with_cover_as_first_page=True)
+def _chapter_image(src: str, firebase_app_check_token: str, revalidate: bool = False) -> bytes:
+    """Image d'un chapitre, convertie selon CHAPTER_IMAGE_FORMAT (via le cache d'images)."""
+    fetch = functools.partial(_fetch_asset, firebase_app_check_token=firebase_app_check_token)
+    if CHAPTER_IMAGE_FORMAT == "original":
+        return asset_cache.get("original", _converter(convert_keeping_format, "original"),
+                               url=src, fetch=fetch, revalidate=revalidate)
+    return asset_cache.get("png", _converter(convert_to_png, "png"), url=src, fetch=fetch, revalidate=revalidate)
 
 
-def dumpEpubFromVolumeMetadata(novelName: str, volumeName: str, metadata: NovelMetadata, target_folder: Path, firebase_app_check_token: str = ""):
-    global locks
+def _fetch_chapter(chapter_url: str, firebase_app_check_token: str,
+                   previous: Optional[dict] = None) -> Tuple[Optional[str], Dict[str, bytes], dict]:
+    """Télécharge un chapitre, son CSS et ses images.
+
+    Renvoie le HTML désobfusqué, les images à ajouter au chapitre (vide en mode "inline") et
+    l'entrée du registre de téléchargement (voir fetch_ledger.py). Avec `previous`, entrée d'un
+    téléchargement précédent, la requête est conditionnelle, les images sont revérifiées (requêtes
+    conditionnelles du cache d'images) et le HTML renvoyé vaut None si le chapitre n'a pas changé
+    (304 ou même HTML reçu avec le même CSS et les mêmes images, ou même HTML désobfusqué).
+    """
+    url = f"{CHAPTER_CDN_URL}&path={chapter_url}"
+    response = _fetch_response(url, firebase_app_check_token, headers=conditional_headers(previous))
+    if previous is not None and (response.status_code == 304 or content_sha256(response.content) == previous["sha256"]):
+        validators = {"etag": response.headers.get("ETag") or previous.get("etag"),
+                      "last_modified": response.headers.get("Last-Modified") or previous.get("last_modified")}
+        obfuscation_css = css_cache.get(previous["css"]["url"], lambda headers: _fetch_response(
+            previous["css"]["url"], firebase_app_check_token, headers=headers))
+        images_unchanged = all(content_sha256(_chapter_image(src, firebase_app_check_token, revalidate=True)) == image_sha256
+                               for (src, image_sha256) in previous.get("images", {}).items())
+        if classes_sha256(obfuscation_css.classes) == previous["css"]["classes_sha256"] and images_unchanged:
+            return None, {}, {**previous, **validators}
+        # Nouveau CSS d'obfuscation ou image modifiée : le HTML doit être relu en entier
+        if response.status_code == 304:
+            response = _fetch_response(url, firebase_app_check_token)
+    chapter_obfuscated_html = response.content.decode()
+
+    css_url = find_stylesheet_href(chapter_obfuscated_html)
+    if css_url is None:
+        raise Exception(
+            f"Impossible de trouver le lien CSS dans le HTML pour {chapter_url}")
+
+    obfuscation_css = css_cache.get(css_url, lambda headers: _fetch_response(
+        css_url, firebase_app_check_token, headers=headers))
+
+    if len(obfuscation_css.classes) == 0:
+        raise Exception(
+            f"Impossible de trouver les classes d'obfuscation dans le CSS pour {unquote(chapter_url)}")
+
+    with deobfuscation_seconds.time(engine=DEOBFUSCATION_ENGINE):
+        if DEOBFUSCATION_ENGINE == "soup":
+            (cleaned_chapter_html, image_sources) = process_pool.run(
+                deobfuscate_chapter_soup, chapter_obfuscated_html, obfuscation_css.selector)
+        else:
+            (cleaned_chapter_html, image_sources) = process_pool.run(
+                deobfuscate_chapter, chapter_obfuscated_html, obfuscation_css.classes)
+
+    images = {}
+    image_hashes = {}
+    for src in image_sources:
+        if re.match(url_turbo_regex, src):
+            im_data = _chapter_image(src, firebase_app_check_token, revalidate=previous is not None)
+            im_extension = image_extension(im_data)
+
+            if CHAPTER_IMAGE_MODE == "inline":
+                b64_encoded_im = base64.b64encode(im_data).decode("utf-8")
+                new_src = f"data:image/{im_extension};base64,{b64_encoded_im}"
+            else:
+                im_name = f"{hashlib.sha256(im_data).hexdigest()[:32]}.{im_extension}"
+                images[im_name] = im_data
+                new_src = f"images/{im_name}"
+            cleaned_chapter_html = replace_image_src(cleaned_chapter_html, src, new_src)
+            image_hashes[src] = content_sha256(im_data)
+
+    entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": content_sha256(response.content),
+        "css": {"url": css_url, "classes_sha256": classes_sha256(obfuscation_css.classes)},
+        "images": image_hashes,
+        # Les noms des images dépendent de leur contenu : cette empreinte couvre aussi les images
+        "content_sha256": content_sha256(cleaned_chapter_html.encode("utf-8")),
+    }
+    if previous is not None and entry["content_sha256"] == previous.get("content_sha256"):
+        return None, {}, entry
+    return cleaned_chapter_html, images, entry
+
+
+def dumpEpubFromVolumeMetadata(novelName: str, volumeName: str, metadata: NovelMetadata, target_folder: Path, firebase_app_check_token: str = "",
+                               chapter_count: int = None, progress: Callable[[int, int], None] = None, refresh: bool = False):
+    """Télécharge les chapitres du volume et les enregistre en EPUB dans `target_folder`.
+
+    Avec `refresh`, les chapitres déjà enregistrés sont revérifiés par requête conditionnelle
+    (registre `.fetch.json` du dossier) et seuls ceux dont le contenu a changé sont reconstruits.
+    La fusion n'est planifiée que si un chapitre a été écrit (ou si le volume n'est pas à jour).
+    """
+    ledger = FetchLedger(target_folder)
+    chapters_written = 0
     try:
         series_zfill = {}
-        thread_session = requests.Session()
-        thread_session.proxies = random.choice(proxy_list) if len(proxy_list) > 0 else {}
-        thread_session.max_redirects = 5
-        thread_session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/112.0",
-            "Origin": "https://world-novel.fr",
-            "Referer": "https://world-novel.fr/",
-            "X-Firebase-AppCheck": firebase_app_check_token
-        })
         for collection in metadata["collections"]:
             series_zfill[collection["name"]] = int(
-                len(str(len(metadata["chapters"]))))
+                len(str(chapter_count if chapter_count is not None else len(metadata["chapters"]))))
 
+        # Convert cover to PNG as not all EPUB readers support other formats like WEBP even though EPUB standard allows it
         cover_content = None
         if re.match(url_turbo_regex, metadata["cover"]):
-            cover_content = thread_session.get(metadata["cover"]).content
+            cover_content = asset_cache.get("png", _converter(convert_to_png, "png"), url=metadata["cover"], revalidate=refresh,
+                                            fetch=functools.partial(_fetch_asset, firebase_app_check_token=firebase_app_check_token))
         elif re.match(image_data_url_regexp, metadata["cover"]):
-            cover_content = decode_data_url_to_bytes(metadata["cover"])
-
-        # Convert cover to PNG as not all EPUB readers support other formats like WEBP even though EPUB standard allows it
-        if cover_content is not None:
-            cover_bytes = io.BytesIO(cover_content)
-            im = Image.open(cover_bytes)
-            new_cover = io.BytesIO()
-            im.convert("RGB").save(new_cover, format="PNG")
-            cover_content = new_cover.getvalue()
-
-        root_url = f"https://cdn.world-novel.fr/chapitres/?userId=dEVJy3lAr5O3r3AQ0JSjraRMXvC3"
-
-        for (chapter_index, chapter_url) in enumerate(metadata["chapters"]):
-            chapter_metadata = copy.deepcopy(metadata)
-            chapter_metadata.pop("chapters", None)
-            chapter_metadata.pop("volumeName", None)
-            chapter_metadata["title"] = unquote(
-                chapter_url.split("/")[-1]).strip()
-
-            chapter_obfuscated_html = thread_session.get(f"{root_url}&path={chapter_url}", timeout=60).content.decode()
-
-            soup = BeautifulSoup(chapter_obfuscated_html, "html.parser")
-            html_link_node = soup.find("link", {"rel": "stylesheet"})
-            if not html_link_node or "href" not in html_link_node.attrs:
-                raise Exception(
-                    f"Impossible de trouver le lien CSS dans le HTML pour {chapter_url}")
-            css_url = html_link_node["href"]
-
-            css_content = thread_session.get(css_url).content.decode()
-            obfuscating_classes = re.findall(
-                r'(?<=\.).{8}(?={.+;})', css_content)
-            obfuscating_classes_selector = list(
-                map(lambda c: f"span[class='{c}']", obfuscating_classes))
-
-            if len(obfuscating_classes_selector) == 0:
-                raise Exception(
-                    f"Impossible de trouver les classes d'obfuscation dans le CSS pour {unquote(chapter_url)}")
-
-            for s in soup.select(",".join(obfuscating_classes_selector)):
-                s.decompose()
-
-            for img in soup.find_all("img"):
-                src = img.get("src")
-                if src and re.match(url_turbo_regex, src):
-                    im_data = thread_session.get(src).content
-                    im_bytes = io.BytesIO(im_data)
-                    im = Image.open(im_bytes)
-                    im.verify()
-
-                    png_im = io.BytesIO()
-                    im.convert("RGB").save(png_im, format="PNG")
-                    b64_encoded_im = base64.b64encode(
-                        png_im.getvalue()).decode("utf-8")
-                    dataURL_im = f"data:image/png;base64,{b64_encoded_im}"
-                    img.attrs['src'] = dataURL_im
-
-            deobfuscated_html = soup.select_one("div").decode_contents()
-            cleaned_chapter_html = re.sub(
-                r'<span class=".{8}">(.+?)<\/span>', r'\g<1>', deobfuscated_html)
-
-            chapter_number = int(re.findall(r"(?<=Chapitre )(\d+)", chapter_metadata["title"])[0]) if re.findall(r"(?<=Chapitre )(\d+)", chapter_metadata["title"]) else 0
-            for collection in chapter_metadata["collections"]:
-                collection_index = str(chapter_number).zfill(series_zfill[collection["name"]])
-                collection["number"] = f"{collection['number']}.{collection_index}"
-
-            epubChapter = Book(**chapter_metadata)
-            epubChapter.set_cover(cover_content)
-            epubChapter.add_stylesheet(data=line_break_style)
-            epubChapter.add_page(
-                chapter_metadata["title"], cleaned_chapter_html)
-            file_path = target_folder / f"{chapter_metadata['title']}.epub"
-            if os.path.exists(file_path) is False:
-                epubChapter.save(filename=file_path.resolve(
-                ), with_visible_toc=False, with_cover_as_first_page=False)
+            cover_content = asset_cache.get(
+                "png", _converter(convert_to_png, "png"), data=decode_data_url_to_bytes(metadata["cover"]))
+
+        # Les chapitres sont téléchargés et désobfusqués en parallèle (fenêtre bornée),
+        # puis écrits dans l'ordre par ce thread.
+        chapters = list(metadata["chapters"])
+        chapters_done = 0
+        pending = []
+        with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix=f"fetch-{volumeName}") as executor:
+            try:
+                while len(chapters) > 0 or len(pending) > 0:
+                    while len(chapters) > 0 and len(pending) < FETCH_CONCURRENCY * 2:
+                        chapter_url = chapters.pop(0)
+                        previous = ledger.get(chapter_url) if refresh and _is_chapter_saved(target_folder, chapter_url) else None
+                        pending.append((chapter_url, executor.submit(
+                            _fetch_chapter, chapter_url, firebase_app_check_token, previous)))
+
+                    (chapter_url, future) = pending.pop(0)
+                    (cleaned_chapter_html, chapter_images, ledger_entry) = future.result()
+                    chapter_title = unquote(chapter_url.split("/")[-1]).strip()
+                    ledger_entry["file"] = f"{chapter_title}.epub"
+
+                    if cleaned_chapter_html is None:
+                        chapter_refreshes.inc(result="unchanged")
+                        ledger.record(chapter_url, ledger_entry)
+                        chapters_done += 1
+                        if progress is not None:
+                            progress(chapters_done, len(metadata["chapters"]))
+                        continue
+
+                    chapter_metadata = copy.deepcopy(metadata)
+                    chapter_metadata.pop("chapters", None)
+                    chapter_metadata.pop("volumeName", None)
+                    chapter_metadata["title"] = chapter_title
+
+                    chapter_number = int(re.findall(r"(?<=Chapitre )(\d+)", chapter_metadata["title"])[0]) if re.findall(r"(?<=Chapitre )(\d+)", chapter_metadata["title"]) else 0
+                    for collection in chapter_metadata["collections"]:
+                        collection_index = str(chapter_number).zfill(series_zfill[collection["name"]])
+                        collection["number"] = f"{collection['number']}.{collection_index}"
+
+                    file_path = target_folder / f"{chapter_metadata['title']}.epub"
+                    exists = os.path.exists(file_path)
+                    if refresh or not exists:
+                        # Écrit dans un fichier caché puis renommé : un chapitre remplacé n'est jamais lu à moitié écrit
+                        upload = ChapterUpload(file_path, EPUB_COMPRESSION)
+                        try:
+                            with epub_save_seconds.time(source="dump"):
+                                for (image_name, image_content) in chapter_images.items():
+                                    upload.add_image(image_name, image_content)
+                                upload.commit(chapter_metadata, cleaned_chapter_html, cover_content, line_break_style)
+                        finally:
+                            upload.discard()
+                        _record_chapter(file_path, chapter_metadata)
+                        listing_cache.invalidate(target_folder)
+                        chapter_refreshes.inc(result="changed" if exists else "new")
+                        chapters_written += 1
+                    ledger.record(chapter_url, ledger_entry)
+
+                    chapters_done += 1
+                    if progress is not None:
+                        progress(chapters_done, len(metadata["chapters"]))
+            except BaseException:
+                for (_, future) in pending:
+                    future.cancel()
+                raise
         print("Finished downloading volume:", novelName, volumeName)
-        _run_book_merging(target_folder)
+        # Avant de planifier la fusion : écrire `.fetch.json` pendant celle-ci modifierait le dossier
+        # et l'annulerait (cancel_on_change)
+        ledger.save()
+        if chapters_written > 0 or not is_up_to_date(target_folder, compression=EPUB_COMPRESSION):
+            debounce_execution(target_folder, 0)
     except Exception as err:
         print(f"An exception occured while dumping {novelName} / {volumeName}", err)
+        raise
     finally:
-        print("Releasing lock for:", novelName, volumeName)
-        locks.pop(f"{novelName}/{volumeName}", None)
+        ledger.save()
+
+
+def _is_chapter_saved(target_folder: Path, chapter_url: str) -> bool:
+    return (target_folder / f"{unquote(chapter_url.split('/')[-1]).strip()}.epub").exists()
+
+
+def _run_dump_job(job: Job, progress: Callable[[int, int], None]):
+    target_folder = EPUB_ROOT_FOLDER / job.payload["novel"] / job.payload["volume"]
+    metadata = job.payload["metadata"]
+    chapter_count = len(metadata["chapters"])
+
+    refresh = job.payload.get("refresh", False)
+
+    # Reprise après redémarrage : les chapitres déjà sauvegardés ne sont pas retéléchargés
+    # (en mode `refresh`, ils sont revérifiés par requête conditionnelle)
+    if not refresh:
+        metadata["chapters"] = [chapter for chapter in metadata["chapters"]
+                                if not _is_chapter_saved(target_folder, chapter)]
+    # Jeton App Check de la demande, gardé hors du payload (voir JobQueue) : sans lui, les
+    # téléchargements échoueraient un par un
+    if job.secrets is None:
+        raise Exception("App Check token missing, request the dump again")
+    os.makedirs(target_folder, exist_ok=True)
+    dumpEpubFromVolumeMetadata(job.payload["novel"], job.payload["volume"], metadata, target_folder,
+                               job.secrets["firebase_app_check_token"], chapter_count, progress, refresh)
+
+
+def _run_merge_job(job: Job, progress: Callable[[int, int], None]):
+    volume_folder = Path(job.payload["folder"])
+    # Une fusion lancée par l'échéance `MERGE_MAX_WAIT` va jusqu'au bout : sinon un flux continu
+    # de chapitres l'annulerait indéfiniment
+    cancel_on_change = job.run_at - job.created_at < MERGE_MAX_WAIT
+    try:
+        _run_book_merging(volume_folder, cancel_on_change)
+    except MergeCancelled:
+        print(f"Merge of {volume_folder} cancelled: new chapters arrived")
+        debounce_execution(volume_folder)
+
+
+job_queue = JobQueue(JOB_DATABASE, JOB_WORKERS, {
+    "dump": _run_dump_job,
+    "merge": _run_merge_job,
+})
+if not _pool_process:
+    job_queue.start()
 
 # ------------------------------------------
 
 
 app = Flask(__name__)
 CORS(app)
+# X-Sendfile (Apache, lighttpd) : le serveur web envoie le fichier à la place du worker Flask
+app.config["USE_X_SENDFILE"] = USE_X_SENDFILE
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_SIZE
 
 
 @app.route('/favicon.ico')
@@ -333,9 +662,16 @@ def favicon():
 @app.route('/', methods=["GET", "HEAD"], defaults={'req_path': ''})
 @app.route('/<path:req_path>')
 def dir_listing(req_path: str):
+    # Fichiers et dossiers cachés (bases, manifestes de fusion, index, registres, caches) : jamais servis.
+    # `req_path` est déjà décodé par Flask : le décoder une seconde fois laisserait passer `%252F...`
+    if any(part.startswith(".") for part in req_path.split("/")):
+        return abort(404)
 
-    # Joining the base and the requested path
-    abs_path = os.path.join(EPUB_ROOT_FOLDER, unquote(req_path))
+    # Joining the base and the requested path, which must stay inside the base (absolute paths, symlinks)
+    root = EPUB_ROOT_FOLDER.resolve()
+    abs_path = (root / req_path).resolve()
+    if not abs_path.is_relative_to(root):
+        return abort(404)
 
     # Return 404 if path doesn't exist
     if not os.path.exists(abs_path):
@@ -343,10 +679,16 @@ def dir_listing(req_path: str):
 
     # Check if path is a file and serve
     if os.path.isfile(abs_path):
-        if request.method == "GET":
-            return send_file(abs_path)
-        else:
-            return "", 302
+        if X_ACCEL_REDIRECT_PREFIX:
+            # Le reverse proxy sert lui-même le fichier (sendfile, Range, ETag) depuis sa location interne
+            relative_path = abs_path.relative_to(root).as_posix()
+            response = make_response("", 200)
+            response.headers["X-Accel-Redirect"] = f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(relative_path)}"
+            response.headers["Content-Type"] = mimetypes.guess_type(abs_path)[0] or "application/octet-stream"
+            return response
+
+        # HEAD comme GET (sans corps) : Content-Length, Last-Modified, ETag ; Range et requêtes conditionnelles gérés par Werkzeug
+        return send_file(abs_path, conditional=True, etag=True, last_modified=os.path.getmtime(abs_path))
 
     if request.method != "GET":
         return "", 405
@@ -355,50 +697,29 @@ def dir_listing(req_path: str):
     previous_dir = "/".join(req_path.split("/")[:-1])
 
     # Show directory contents
-    files = list(map(lambda node: {
-        "name": node,
-        "path": f"{actual_dir}/{node}",
-        "isDir": os.path.isdir(os.path.join(abs_path, node)),
-        "size": convert_size(os.path.getsize(os.path.join(abs_path, node))),
-        "mdate": str(datetime.fromtimestamp(os.path.getmtime(os.path.join(abs_path, node))))[:19]
-    }, os.listdir(abs_path)))
+    listing = listing_cache.get(Path(abs_path))
 
-    return render_template('index.html', previous_dir=previous_dir, actual_dir=req_path, files=natsorted(files, key=lambda f: f["name"]))
-
-
-@app.post('/')
-def buildEpub():
-    files = list(request.files.values())
+    per_page = max(request.args.get("per_page", LISTING_PAGE_SIZE, type=int), 1)
+    page_count = max(math.ceil(len(listing.entries) / per_page), 1)
+    page = min(max(request.args.get("page", 1, type=int), 1), page_count)
 
-    htmlFiles = list(filter(lambda f: f.filename == "chapter.html", files))
-    jsonFiles = list(filter(lambda f: f.filename == "metadata.json", files))
-    images = list(filter(lambda f: f.filename.endswith(".png"), files))
+    files = list(map(lambda entry: {
+        "name": entry.name,
+        "path": f"{actual_dir}/{entry.name}",
+        "isDir": entry.is_dir,
+        "size": convert_size(entry.size),
+        "mdate": str(datetime.fromtimestamp(entry.mtime))[:19]
+    }, listing.entries[(page - 1) * per_page:page * per_page]))
 
-    if len(htmlFiles) != 1 or len(jsonFiles) != 1:
-        return "Can't process files without exactly one 'chapter.html' and one 'metadata.json'", 422
+    response = make_response(render_template('index.html', previous_dir=previous_dir, actual_dir=req_path, files=files,
+                                             page=page, page_count=page_count, per_page=per_page))
+    response.set_etag(f"{listing.etag}-{page}-{per_page}")
+    return response.make_conditional(request)
 
-    chapterContentFile = htmlFiles[0]
-    metadataFile = jsonFiles[0]
 
-    if chapterContentFile.content_type != "text/html":
-        return abort(406)
-
-    if metadataFile.content_type != "application/json":
-        return abort(406)
-
-    chapterContentFileStream = chapterContentFile.stream
-    chapterContent = chapterContentFileStream.read().decode()
-    chapterContentFileStream.close()
-
-    metadataFileStream = metadataFile.stream
-    metadataContent = metadataFileStream.read()
-    metadataFileStream.close()
-
-    try:
-        metadata: BookMetadata = json.loads(metadataContent)
-    except:
-        return abort(406)
 
+def _chapter_target(metadata: BookMetadata) -> Tuple[Path, Path]:
+    """Dossier (créé au besoin) et chemin de l'EPUB d'un chapitre d'après ses métadonnées."""
     target_folder = EPUB_ROOT_FOLDER
     if 'collections' in metadata and len(metadata['collections']) > 0:
         target_folder = target_folder / \
@@ -408,74 +729,243 @@ def buildEpub():
         target_folder = target_folder / secure_filename(metadata['volumeName'])
 
     os.makedirs(target_folder, exist_ok=True)
-    file_path = target_folder / f"{metadata['title']}.epub"
+    return target_folder, target_folder / f"{metadata['title']}.epub"
 
-    if file_path.exists():
-        return "", 208  # Already Reported
 
-    if len(metadata["collections"]) > 0:
-        for collection in metadata["collections"]:
-            chapter_number = int(re.findall(r"(?<=Chapitre )(\d+)", metadata["title"])[
-                                 0]) if re.findall(r"(?<=Chapitre )(\d+)", metadata["title"]) else 0
-            collection_index = str(chapter_number).zfill(5)
-            book_index = str(collection["number"]).split(".")[0]
-            collection["number"] = f"{book_index}.{collection_index}"
-
-    epubVolume = Book(**metadata)
-
-    cover_content = None
-    if re.match(url_turbo_regex, metadata["cover"]):
-        cover_content = requests.get(metadata["cover"]).content
-    elif re.match(image_data_url_regexp, metadata["cover"]):
-        cover_content = decode_data_url_to_bytes(metadata["cover"])
-
-    if cover_content is not None:
-        cover_bytes = io.BytesIO(cover_content)
-        im = Image.open(cover_bytes)
-        im.verify()
-
-        new_cover = io.BytesIO()
-        im.convert("RGB").save(new_cover, format="PNG")
-        epubVolume.set_cover(new_cover.getvalue())
-    else:
-        epubVolume.generate_cover()
+def _number_collections(metadata: BookMetadata):
+    """Numérote le chapitre dans ses collections (`<tome>.<chapitre>`), pour l'ordre de lecture."""
+    for collection in metadata.get("collections") or []:
+        chapter_number = int(re.findall(r"(?<=Chapitre )(\d+)", metadata["title"])[
+                             0]) if re.findall(r"(?<=Chapitre )(\d+)", metadata["title"]) else 0
+        collection_index = str(chapter_number).zfill(5)
+        book_index = str(collection["number"]).split(".")[0]
+        collection["number"] = f"{book_index}.{collection_index}"
+
+
+@functools.lru_cache(maxsize=32)
+def _generated_cover(title: str, subtitle: str) -> bytes:
+    return generate_cover(title, subtitle, COVER_FONT)
+
+
+def _upload_cover(metadata: BookMetadata) -> bytes:
+    """Couverture PNG d'un envoi (URL ou data URL), ou générée d'après la série et le volume."""
+    cover = metadata.get("cover") or ""
+    if re.match(url_turbo_regex, cover):
+        return asset_cache.get("png", _converter(convert_to_png, "png"), url=cover, fetch=_fetch_asset)
+    elif re.match(image_data_url_regexp, cover):
+        return asset_cache.get(
+            "png", _converter(convert_to_png, "png"), data=decode_data_url_to_bytes(cover))
+    collections = metadata.get("collections") or []
+    title = collections[0]["name"] if len(collections) > 0 and collections[0].get("name") else metadata["title"]
+    return _generated_cover(title, metadata.get("volumeName") or "")
+
 
-    epubVolume.add_page(metadata["title"], chapterContent)
-    for imageFile in images:
-        imageFileStream = imageFile.stream
-        imageContent = imageFileStream.read()
-        imageFileStream.close()
-        epubVolume.add_image(imageFile.filename, imageContent)
+def _chapters_saved(target_folders):
+    """Après un envoi : une invalidation du listing et une fusion planifiée par dossier."""
+    for target_folder in target_folders:
+        listing_cache.invalidate(target_folder)
 
-    epubVolume.save(filename=file_path.resolve(),
-                    with_visible_toc=False, with_cover_as_first_page=False)
+        # Planifie un listing debounced pour n'exécuter la lecture du dossier qu'une seule fois
+        try:
+            debounce_execution(target_folder, 6)
+        except Exception:
+            pass
+
+@app.post('/')
+def buildEpub():
+    """Reçoit un chapitre (`chapter.html`, `metadata.json` et des images `.png`) en multipart.
 
-    # Planifie un listing debounced pour n'exécuter la lecture du dossier qu'une seule fois
+    Le corps est lu au fil de l'eau : dès que les métadonnées sont connues, un chapitre déjà
+    présent est signalé (208) sans lire le reste, et les images sont écrites directement dans
+    l'EPUB (ou mises de côté sur disque si elles arrivent avant les métadonnées).
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype != "multipart/form-data" or not boundary:
+        return abort(400)
+
+    metadata: BookMetadata = None
+    chapter_content = None
+    file_counts = {"chapter.html": 0, "metadata.json": 0}
+    early_images: List[Tuple[str, tempfile.SpooledTemporaryFile]] = []
+    target_folder = file_path = upload = None
     try:
-        debounce_execution(target_folder, _run_book_merging, 6)
-    except Exception:
-        pass
+        for part in iter_parts(request.stream, boundary.encode("latin-1")):
+            content_type = (part.content_type or "").split(";")[0].strip()
+            if part.filename in file_counts:
+                file_counts[part.filename] += 1
+                if file_counts[part.filename] > 1:
+                    return "Can't process files without exactly one 'chapter.html' and one 'metadata.json'", 422
+
+            if part.filename == "chapter.html":
+                if content_type != "text/html":
+                    return abort(406)
+                chapter_content = part.read(MAX_UPLOAD_PART_SIZE).decode()
+
+            elif part.filename == "metadata.json":
+                if content_type != "application/json":
+                    return abort(406)
+                try:
+                    metadata = json.loads(part.read(MAX_UPLOAD_PART_SIZE))
+                except ValueError:
+                    return abort(406)
+
+                (target_folder, file_path) = _chapter_target(metadata)
+                if file_path.exists():
+                    drain(request.stream)
+                    return "", 208  # Already Reported
+
+                upload = ChapterUpload(file_path, EPUB_COMPRESSION)
+                for (image_name, image_file) in early_images:
+                    image_file.seek(0)
+                    upload.add_image(image_name, image_file)
+                    image_file.close()
+                early_images = []
+
+            elif part.filename is not None and part.filename.endswith(".png"):
+                if upload is not None:
+                    upload.add_image(part.filename, part)
+                else:
+                    image_file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+                    part.copy_to(image_file)
+                    early_images.append((os.path.basename(part.filename), image_file))
+
+        if file_counts["chapter.html"] != 1 or file_counts["metadata.json"] != 1:
+            return "Can't process files without exactly one 'chapter.html' and one 'metadata.json'", 422
+
+        _number_collections(metadata)
+        cover_content = _upload_cover(metadata)
+        with epub_save_seconds.time(source="upload"):
+            upload.commit(metadata, chapter_content, cover_content)
+    finally:
+        for (_, image_file) in early_images:
+            image_file.close()
+        if upload is not None:
+            upload.discard()
+
+    _record_chapter(file_path, metadata)
+    _chapters_saved([target_folder])
 
     return "", 202
 
 
+@app.post('/_batch')
+def buildEpubBatch():
+    """Reçoit plusieurs chapitres d'un même envoi en un seul multipart, lu au fil de l'eau.
+
+    `metadata.json` vient en premier et porte les métadonnées communes (sans `title`) ;
+    chaque chapitre est ensuite une partie `<titre>.html`, suivie de ses images `.png`.
+    La couverture n'est convertie qu'une fois et chaque dossier touché n'est invalidé et
+    planifié qu'une fois, à la fin. Les chapitres déjà présents sont ignorés sans être lus.
+
+    Le script utilisateur n'envoie pas de lots (le serveur télécharge lui-même les chapitres
+    d'un volume, voir `requestNovelDump`) : ce point d'entrée sert aux clients qui postent des
+    chapitres déjà récupérés, par exemple :
+
+        curl -F 'metadata=@metadata.json;type=application/json' \\
+             -F 'chapter=@Chapitre 1.html;type=text/html' -F 'image=@1-0.png;type=image/png' \\
+             -F 'chapter=@Chapitre 2.html;type=text/html' http://127.0.0.1:5000/_batch
+
+    Le nom des champs n'est pas lu, seul le nom de fichier de chaque partie compte. Réponse
+    `{"saved": [...], "skipped": [...]}`, en 202 si au moins un chapitre a été enregistré,
+    208 sinon ; 413 si une partie dépasse `MAX_UPLOAD_PART_SIZE`.
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype != "multipart/form-data" or not boundary:
+        return abort(400)
+
+    shared_metadata: BookMetadata = None
+    cover = {}
+    saved: List[str] = []
+    skipped: List[str] = []
+    target_folders: Dict[Path, None] = {}
+    current = {"upload": None, "metadata": None, "content": None}
+
+    def commit_current():
+        upload = current["upload"]
+        if upload is None:
+            return
+        if "content" not in cover:
+            cover["content"] = _upload_cover(shared_metadata)
+        with epub_save_seconds.time(source="batch"):
+            upload.commit(current["metadata"], current["content"], cover["content"])
+        _record_chapter(upload.file_path, current["metadata"])
+        saved.append(current["metadata"]["title"])
+        current["upload"] = None
+
+    try:
+        for part in iter_parts(request.stream, boundary.encode("latin-1")):
+            content_type = (part.content_type or "").split(";")[0].strip()
+            if shared_metadata is None:
+                if part.filename != "metadata.json":
+                    return "'metadata.json' must be the first part of a batch", 422
+                if content_type != "application/json":
+                    return abort(406)
+                try:
+                    shared_metadata = json.loads(part.read(MAX_UPLOAD_PART_SIZE))
+                except ValueError:
+                    return abort(406)
+                continue
+
+            if part.filename is not None and part.filename.endswith(".html"):
+                if content_type != "text/html":
+                    return abort(406)
+                commit_current()
+                title = part.filename[:-len(".html")]
+                if title == "" or os.path.basename(title) != title:
+                    return f"Invalid chapter title '{title}'", 422
+
+                metadata = {**copy.deepcopy(shared_metadata), "title": title}
+                (target_folder, file_path) = _chapter_target(metadata)
+                if file_path.exists():
+                    skipped.append(title)
+                    continue
+                _number_collections(metadata)
+                current.update(upload=ChapterUpload(file_path, EPUB_COMPRESSION), metadata=metadata,
+                               content=part.read(MAX_UPLOAD_PART_SIZE).decode())
+                target_folders[target_folder] = None
+
+            elif part.filename is not None and part.filename.endswith(".png"):
+                # Les images d'un chapitre ignoré sont ignorées avec lui
+                if current["upload"] is not None:
+                    current["upload"].add_image(part.filename, part)
+                elif len(saved) + len(skipped) == 0:
+                    return "Images must follow the chapter they belong to", 422
+
+        if shared_metadata is None:
+            return "Can't process a batch without 'metadata.json'", 422
+        commit_current()
+    finally:
+        if current["upload"] is not None:
+            current["upload"].discard()
+        _chapters_saved(target_folders)
+
+    return {"saved": saved, "skipped": skipped}, 202 if len(saved) > 0 else 208
+
+
 @app.post('/<path:novel_name>/<path:volume_name>')
 def requestNovelDump(novel_name: str, volume_name: str):
-    global locks
+    """Planifie le téléchargement des chapitres manquants d'un volume.
+
+    Avec `?refresh=1`, les chapitres déjà présents sont aussi revérifiés (requêtes
+    conditionnelles) et reconstruits s'ils ont changé : la réponse est alors 202 même si
+    aucun chapitre ne manque.
+    """
     metadata: DumpRequestMetadata = request.get_json(force=True)
 
     if not metadata:
         return abort(406)
 
-    if f"{novel_name}/{volume_name}" in locks:
-        return "", 423  # Processing
-    else:
-        locks[f"{novel_name}/{volume_name}"] = True
+    job_key = f"{novel_name}/{volume_name}"
+    active_job = job_queue.get(job_key)
+    if active_job is not None and active_job.status in ("queued", "running"):
+        return active_job.to_json(), 423  # Processing
 
     target_folder = EPUB_ROOT_FOLDER / novel_name / volume_name
 
     os.makedirs(target_folder, exist_ok=True)
 
+    refresh = request.args.get("refresh", "").lower() in ["1", "true", "yes"]
+    chapters_list: List[str] = []
     missing_chapters_list: List[str] = []
     for chapter in metadata["chapters"]:
         exploded_chapter = chapter.split("/")
@@ -484,30 +974,132 @@ def requestNovelDump(novel_name: str, volume_name: str):
             r'\/|(?<=[^.])\.{2}(?=[^.])|\.{4,}', '', exploded_chapter[-1])
 
         file_path = target_folder / f"{exploded_chapter[-1].strip()}.epub"
-        if file_path.exists():
-            continue
-        else:
-            exploded_chapter[-1] = quote(exploded_chapter[-1])
+        saved = file_path.exists()
+        exploded_chapter[-1] = quote(exploded_chapter[-1])
+        chapters_list.append("/".join(exploded_chapter))
+        if saved is False:
             missing_chapters_list.append("/".join(exploded_chapter))
 
     status = 500
-    if (len(missing_chapters_list) == 0):
+    if refresh:
+        status = 202  # Accepted
+    elif (len(missing_chapters_list) == 0):
         return missing_chapters_list, 208  # Already Reported
     elif len(missing_chapters_list) == len(metadata["chapters"]):
         status = 202  # Accepted
     else:
         status = 206  # Partial Content
 
-    metadata["chapters"] = missing_chapters_list
-
-    firebase_app_check_token = request.headers.get("X-Firebase-AppCheck", "")
+    # En mode `refresh`, les chapitres présents sont revérifiés, dans l'ordre du volume
+    metadata["chapters"] = chapters_list if refresh else missing_chapters_list
 
-    threading.Thread(target=dumpEpubFromVolumeMetadata, args=(
-        novel_name, volume_name, metadata, target_folder, firebase_app_check_token)).start()
+    (job, created) = job_queue.enqueue("dump", job_key, {
+        "novel": novel_name,
+        "volume": volume_name,
+        "metadata": metadata,
+        "refresh": refresh,
+    }, priority=request.args.get("priority", 0, type=int),
+        secrets={"firebase_app_check_token": request.headers.get("X-Firebase-AppCheck", "")})
+    if not created:
+        return job.to_json(), 423  # Processing
 
     return missing_chapters_list, status
 
 
+@app.get('/_jobs')
+def listJobs():
+    return [job.to_json() for job in job_queue.list()]
+
+
+@app.get('/_jobs/<path:job_key>')
+def jobStatus(job_key: str):
+    job = job_queue.get(job_key)
+    if job is None:
+        return abort(404)
+    return job.to_json()
+
+
+def _catalog_page() -> Tuple[int, int]:
+    per_page = min(max(request.args.get("per_page", CATALOG_PAGE_SIZE, type=int), 1), 500)
+    page = max(request.args.get("page", 1, type=int), 1)
+    return page, per_page
+
+
+def _catalog_kind(default=None):
+    kind = request.args.get("kind", default)
+    if kind not in KINDS + [None]:
+        return abort(400)
+    return kind
+
+
+def _catalog_json(entries, total: int, page: int, per_page: int) -> dict:
+    return {"entries": [entry.to_json() for entry in entries], "total": total, "page": page, "perPage": per_page}
+
+
+@app.get('/_library')
+def libraryCatalog():
+    (page, per_page) = _catalog_page()
+    (entries, total) = library.catalog(_catalog_kind(), request.args.get("series"), (page - 1) * per_page, per_page)
+    return _catalog_json(entries, total, page, per_page)
+
+
+@app.get('/_library/search')
+def librarySearch():
+    (page, per_page) = _catalog_page()
+    (entries, total) = library.search(request.args.get("q", ""), _catalog_kind(), (page - 1) * per_page, per_page)
+    return _catalog_json(entries, total, page, per_page)
+
+
+def _opds_feed(title: str, entries, total: int, page: int, per_page: int, endpoint: str, **args):
+    """Flux d'acquisition OPDS 1.2 paginé (liens `next` / `previous` vers `endpoint`)."""
+    links = {"self": url_for(endpoint, page=page, per_page=per_page, **args)}
+    if page > 1:
+        links["previous"] = url_for(endpoint, page=page - 1, per_page=per_page, **args)
+    if page * per_page < total:
+        links["next"] = url_for(endpoint, page=page + 1, per_page=per_page, **args)
+    feed = render_template("opds/feed.xml", title=title, feed_id=links["self"], entries=entries, links=links,
+                           total=total, start_index=(page - 1) * per_page + 1, per_page=per_page,
+                           updated=max([entry.updated for entry in entries], default=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+                           quote=quote)
+    return feed, 200, {"Content-Type": "application/atom+xml;profile=opds-catalog;kind=acquisition; charset=utf-8"}
+
+
+@app.get('/_opds')
+def opdsCatalog():
+    (page, per_page) = _catalog_page()
+    kind = _catalog_kind("volume")
+    series = request.args.get("series")
+    (entries, total) = library.catalog(kind, series, (page - 1) * per_page, per_page)
+    args = {"kind": kind, **({"series": series} if series is not None else {})}
+    return _opds_feed(series or ("Volumes" if kind == "volume" else "Chapitres"), entries, total, page, per_page, "opdsCatalog", **args)
+
+
+@app.get('/_opds/search')
+def opdsSearch():
+    (page, per_page) = _catalog_page()
+    query = request.args.get("q", "")
+    kind = _catalog_kind()
+    (entries, total) = library.search(query, kind, (page - 1) * per_page, per_page)
+    args = {"q": query, **({"kind": kind} if kind is not None else {})}
+    return _opds_feed(f"Recherche : {query}", entries, total, page, per_page, "opdsSearch", **args)
+
+
+@app.get('/_opds/opensearch.xml')
+def opdsOpenSearch():
+    return render_template("opds/opensearch.xml"), 200, {"Content-Type": "application/opensearchdescription+xml; charset=utf-8"}
+
+
+@app.get('/metrics')
+def exposeMetrics():
+    return metrics.expose(), 200, {"Content-Type": metrics.content_type}
+
+
+@app.get('/_http')
+def httpStatus():
+    return {"connections": http_pool.stats(), "proxies": proxy_rotation.stats(),
+            "proxyList": proxy_refresher.stats() if proxy_refresher is not None else None}
+
+
 if __name__ == "__main__":
     PORT = os.environ.get("PORT", 5000)
     app.run(port=PORT)
@@ -0,0 +1,30 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+# Modules à la racine du dépôt, et fixtures synthétiques partagées avec les benchmarks
+root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root))
+sys.path.insert(0, str(root / "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """Module `server` importé avec ses dossiers dans un répertoire temporaire, sans file de tâches
+    ni pool de processus, et des limites d'envoi réduites."""
+    folder = tmp_path_factory.mktemp("server")
+    with pytest.MonkeyPatch.context() as patch:
+        for (name, value) in {"EPUB_ROOT_FOLDER": folder / "results", "DATA_FOLDER": folder / "data", "JOB_WORKERS": 0,
+                              "PROCESS_POOL_WORKERS": 0, "CSS_CACHE_FILE": "", "MAX_UPLOAD_SIZE": 4096,
+                              "MAX_UPLOAD_PART_SIZE": 1024}.items():
+            patch.setenv(name, str(value))
+        sys.modules.pop("server", None)
+        yield importlib.import_module("server")
+    sys.modules.pop("server", None)
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
@@ -0,0 +1,40 @@
+from asset_cache import AssetCache
+
+
+def test_size_is_computed_on_first_add(tmp_path):
+    cache = AssetCache(tmp_path, max_bytes=10_000)
+    cache.get("png", bytes.upper, data=b"a" * 3000)
+    assert cache._size == 3000
+
+    # Cache existant : aucun parcours au démarrage, seulement au premier ajout
+    cache = AssetCache(tmp_path, max_bytes=10_000)
+    assert cache._size is None
+    assert cache.get("png", bytes.upper, data=b"a" * 3000) == b"A" * 3000
+    assert cache._size is None
+    cache.get("png", bytes.upper, data=b"b" * 4000)
+    assert cache._size == 7000
+
+
+def test_eviction(tmp_path):
+    cache = AssetCache(tmp_path, max_bytes=10_000)
+    for letter in b"abcd":
+        cache.get("png", bytes.upper, data=bytes([letter]) * 4000)
+    assert cache._size <= 9000
+    assert cache._size == sum(file.stat().st_size for file in (tmp_path / "objects").glob("*/*"))
+
+
+def test_revalidation(tmp_path):
+    cache = AssetCache(tmp_path, max_bytes=10_000)
+    requests = []
+
+    def fetch(url, headers):
+        requests.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return None, {"etag": '"v1"'}
+        return b"image", {"etag": '"v1"'}
+
+    assert cache.get("png", bytes.upper, url="https://cdn/1.png", fetch=fetch) == b"IMAGE"
+    assert cache.get("png", bytes.upper, url="https://cdn/1.png", fetch=fetch) == b"IMAGE"
+    assert len(requests) == 1
+    assert cache.get("png", bytes.upper, url="https://cdn/1.png", fetch=fetch, revalidate=True) == b"IMAGE"
+    assert requests[-1].get("If-None-Match") == '"v1"'
@@ -0,0 +1,64 @@
+import pytest
+
+from css_cache import ObfuscationCss, parse_obfuscating_classes
+from deobfuscation import deobfuscate_chapter, deobfuscate_chapter_soup, find_stylesheet_href, replace_image_src
+from fixtures import chapter_html, class_names, obfuscation_css
+
+CLASSES = frozenset(["OOOOOOOO", "PPPPPPPP"])
+
+
+def both_engines(html: str, classes=CLASSES):
+    return deobfuscate_chapter(html, classes), deobfuscate_chapter_soup(html, ObfuscationCss(classes).selector)
+
+
+@pytest.mark.parametrize("body, expected", [
+    ('a <span class="OOOOOOOO">x</span> b', "a  b"),
+    ('a <span class="AAAAAAAA">x</span> b', "a x b"),
+    # Spans imbriqués, vides ou sur plusieurs lignes
+    ('a <span class="AAAAAAAA"><span class="BBBBBBBB">x</span></span> b', "a x b"),
+    ('a <span class="OOOOOOOO"><span class="BBBBBBBB">x</span></span> b', "a  b"),
+    ('a <span class="AAAAAAAA">y<span class="OOOOOOOO">x</span>z</span> b', "a yz b"),
+    ('a <span class="OOOOOOOO"><span class="PPPPPPPP">x</span>w</span> b', "a  b"),
+    ('a <span class="AAAAAAAA"></span> b <span class="BBBBBBBB">c</span>', "a  b c"),
+    ('a <span class="OOOOOOOO"></span> b', "a  b"),
+    ('a <span class="OOOOOOOO" style="x">hidden</span> b', "a  b"),
+    ('a <span id="i" class="PPPPPPPP"><em>hidden</em></span> b', "a  b"),
+    ('<span class="AAAAAAAA">x\ny</span>', "x\ny"),
+    ('<span class="AAAAAAAA"><em>x</em></span>', "<em>x</em>"),
+    # Autres spans conservés
+    ('<span class="short">x</span>', '<span class="short">x</span>'),
+    ('<span class="AAAAAAAA" id="i">x</span>', '<span class="AAAAAAAA" id="i">x</span>'),
+    # Réparation et sérialisation comme BeautifulSoup
+    ("a<em>b", "a<em>b</em>"),
+    ('&amp; &lt; "q"', '&amp; &lt; "q"'),
+    ('<img src="a&amp;b.png" alt="x">', '<img alt="x" src="a&amp;b.png"/>'),
+])
+def test_engines_agree(body, expected):
+    html = f'<html><body><div class="chapter"><p>{body}</p></div><div>suite</div></body></html>'
+    (stream, soup) = both_engines(html)
+    assert stream == soup
+    assert stream[0] == f"<p>{expected}</p>"
+
+
+def test_engines_agree_on_synthetic_chapters():
+    obfuscating = class_names(50, seed=1)
+    decoys = class_names(10, seed=2)
+    classes = parse_obfuscating_classes(obfuscation_css(obfuscating))
+    assert classes == frozenset(obfuscating)
+    for number in range(5):
+        html = chapter_html(number, obfuscating, decoys, paragraphs=20, image_urls=[f"images/{number}.png"])
+        (stream, soup) = both_engines(html, classes)
+        assert stream == soup
+        assert stream[1] == [f"images/{number}.png"]
+        assert not any(f'class="{name}"' in stream[0] for name in obfuscating + decoys)
+
+
+def test_find_stylesheet_href():
+    html = '<link rel="icon" href="x.ico"><LINK href="/css/a.css?v=1&amp;t=2" rel="preload stylesheet">'
+    assert find_stylesheet_href(html) == "/css/a.css?v=1&t=2"
+    assert find_stylesheet_href("<p>sans feuille de style</p>") is None
+
+
+def test_replace_image_src():
+    (html, sources) = deobfuscate_chapter('<div><img src="a&amp;b.png"></div>', CLASSES)
+    assert replace_image_src(html, sources[0], "images/1.png") == '<img src="images/1.png"/>'
@@ -0,0 +1,95 @@
+import zipfile
+
+import pytest
+
+from chapter_index import record_chapter
+from epub_merge import is_up_to_date, merge_volume, merged_volume_stats
+from epub_writer import CompressionPolicy
+from uploads import ChapterUpload
+
+
+@pytest.fixture
+def volume_folder(tmp_path):
+    folder = tmp_path / "Série" / "Volume 1"
+    folder.mkdir(parents=True)
+    for number in [1, 2, 3]:
+        write_chapter(folder, number)
+    return folder
+
+
+def write_chapter(volume_folder, number: int, text: str = "texte"):
+    metadata = {"title": f"Chapitre {number}", "lang": "fr", "creators": [{"name": "Auteur", "role": "aut"}],
+                "collections": [{"name": "Série", "number": f"1.{number}", "type": "series"}]}
+    file_path = volume_folder / f"Chapitre {number}.epub"
+    upload = ChapterUpload(file_path)
+    upload.add_image(f"{number}.png", b"\x89PNG" + bytes([number]) * 3000)
+    upload.commit(metadata, f'<p>{text} {number}</p><p><img src="images/{number}.png"/></p>', b"\x89PNG couverture")
+    record_chapter(file_path, metadata)
+
+
+def pages(output):
+    """Contenu des pages de chapitre de l'archive fusionnée, par nom d'entrée."""
+    with zipfile.ZipFile(output) as archive:
+        return {name: archive.read(name) for name in archive.namelist()
+                if name.startswith("EPUB/chapters/") and name.endswith(".xhtml")}
+
+
+def copied(volume_folder, kind: str) -> int:
+    return merged_volume_stats(volume_folder)["entries"][kind]["copied"]
+
+
+def test_first_merge(volume_folder):
+    output = merge_volume(volume_folder)
+    assert output == volume_folder.parent / "Volume 1.epub"
+    with zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+    assert len(pages(output)) == 3
+    # Pages réécrites (liens vers les images), images et couverture recopiées telles quelles
+    assert (copied(volume_folder, "text"), copied(volume_folder, "images")) == (0, 4)
+    assert is_up_to_date(volume_folder, compression=CompressionPolicy())
+
+
+def test_unchanged_pages_are_reused(volume_folder):
+    output = merge_volume(volume_folder)
+    before = pages(output)
+    mtime_ns = output.stat().st_mtime_ns
+
+    assert merge_volume(volume_folder) == output
+    assert output.stat().st_mtime_ns == mtime_ns
+
+    write_chapter(volume_folder, 4)
+    assert not is_up_to_date(volume_folder)
+    merge_volume(volume_folder)
+    after = pages(output)
+    assert len(after) == 4
+    assert {name: after[name] for name in before} == before
+    assert (copied(volume_folder, "text"), copied(volume_folder, "images")) == (3, 5)
+
+
+def test_changed_chapter_is_rebuilt(volume_folder):
+    output = merge_volume(volume_folder)
+    before = pages(output)
+
+    write_chapter(volume_folder, 2, text="corrigé")
+    merge_volume(volume_folder)
+    after = pages(output)
+    assert after.keys() == before.keys()
+    changed = [name for name in after if after[name] != before[name]]
+    assert len(changed) == 1
+    assert "corrigé 2" in after[changed[0]].decode()
+    assert copied(volume_folder, "text") == 2
+
+
+def test_compression_change_rebuilds(volume_folder):
+    merge_volume(volume_folder)
+    compression = CompressionPolicy("images=deflate:9,text=deflate:9")
+    assert not is_up_to_date(volume_folder, compression=compression)
+
+    output = merge_volume(volume_folder, compression=compression)
+    stats = merged_volume_stats(volume_folder)
+    assert stats["policy"] == str(compression)
+    assert all(entries["copied"] == 0 for entries in stats["entries"].values())
+    with zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        assert {info.compress_type for info in archive.infolist() if info.filename != "mimetype"} == {zipfile.ZIP_DEFLATED}
+    assert is_up_to_date(volume_folder, compression=compression)
@@ -0,0 +1,100 @@
+import zipfile
+
+import pytest
+
+import epub_writer
+from epub_writer import CompressionPolicy, EpubWriter
+
+METADATA = {"title": "Chapitre", "lang": "fr", "creators": [], "collections": []}
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("", {"images": (zipfile.ZIP_STORED, None), "text": (zipfile.ZIP_DEFLATED, None),
+          "other": (zipfile.ZIP_DEFLATED, None)}),
+    ("images=deflate:1, text=deflate:9", {"images": (zipfile.ZIP_DEFLATED, 1), "text": (zipfile.ZIP_DEFLATED, 9),
+                                          "other": (zipfile.ZIP_DEFLATED, None)}),
+    ("other=stored,", {"images": (zipfile.ZIP_STORED, None), "text": (zipfile.ZIP_DEFLATED, None),
+                       "other": (zipfile.ZIP_STORED, None)}),
+])
+def test_policy_parsing(spec, expected):
+    assert CompressionPolicy(spec).methods == expected
+
+
+@pytest.mark.parametrize("spec", ["images", "fonts=stored", "text=bzip2", "images=stored:1", "text=deflate:10",
+                                  "text=deflate:-1", "text=deflate:fast"])
+def test_policy_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        CompressionPolicy(spec)
+
+
+def test_policy_round_trip():
+    policy = CompressionPolicy("images=deflate:3,text=stored")
+    assert str(policy) == "images=deflate:3,text=stored,other=deflate"
+    assert CompressionPolicy(str(policy)).methods == policy.methods
+
+
+@pytest.mark.parametrize("name, kind", [("EPUB/images/1.PNG", "images"), ("EPUB/page1.xhtml", "text"),
+                                        ("EPUB/css/style.css", "text"), ("mimetype", "other"), ("font.ttf", "other")])
+def test_policy_kind(name, kind):
+    assert CompressionPolicy().kind(name) == kind
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.epub"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("EPUB/page1.xhtml", "<p>texte</p>" * 5000, compress_type=zipfile.ZIP_DEFLATED,
+                         compresslevel=1)
+        archive.writestr("EPUB/images/1.png", bytes(range(256)) * 64, compress_type=zipfile.ZIP_STORED)
+    with zipfile.ZipFile(path) as archive:
+        yield archive
+
+
+@pytest.mark.parametrize("threads", [0, 2])
+def test_copy_keeps_compressed_data(tmp_path, source, threads):
+    output = tmp_path / "output.epub"
+    writer = EpubWriter(output, CompressionPolicy("text=deflate:9"), threads=threads)
+    writer.copy(source, "EPUB/page1.xhtml", "page1.xhtml")
+    writer.copy(source, "EPUB/images/1.png", "images/1.png")
+    writer.write("css/style.css", b"p { margin: 0; }" * 100)
+    writer.close(METADATA)
+
+    assert writer.stats["text"]["copied"] == 1
+    assert writer.stats["images"]["copied"] == 1
+    with zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        for name in ["page1.xhtml", "images/1.png"]:
+            (copied, original) = (archive.getinfo(f"EPUB/{name}"), source.getinfo(f"EPUB/{name}"))
+            # Données recopiées telles quelles : le niveau 1 de la source est conservé
+            assert (copied.CRC, copied.compress_size, copied.compress_type) == (
+                original.CRC, original.compress_size, original.compress_type)
+            assert archive.read(f"EPUB/{name}") == source.read(f"EPUB/{name}")
+
+
+def test_copy_recompresses_on_method_change_or_without_raw(tmp_path, source):
+    output = tmp_path / "output.epub"
+    writer = EpubWriter(output, CompressionPolicy("images=deflate,text=deflate:9"))
+    writer.copy(source, "EPUB/page1.xhtml", "page1.xhtml", raw=False)
+    writer.copy(source, "EPUB/images/1.png", "images/1.png")
+    writer.close(METADATA)
+
+    assert writer.stats["text"]["copied"] == 0
+    assert writer.stats["images"]["copied"] == 0
+    with zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        assert archive.getinfo("EPUB/images/1.png").compress_type == zipfile.ZIP_DEFLATED
+        assert archive.getinfo("EPUB/page1.xhtml").compress_size < source.getinfo("EPUB/page1.xhtml").compress_size
+        assert archive.read("EPUB/page1.xhtml") == source.read("EPUB/page1.xhtml")
+
+
+def test_copy_falls_back_without_raw_write(tmp_path, source, monkeypatch):
+    monkeypatch.setattr(epub_writer, "RAW_WRITE_VERSIONS", ((2, 0), (2, 7)))
+    output = tmp_path / "output.epub"
+    writer = EpubWriter(output, threads=2)
+    writer.copy(source, "EPUB/page1.xhtml", "page1.xhtml")
+    writer.close(METADATA)
+
+    assert writer.stats["text"]["copied"] == 0
+    with zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        assert archive.read("EPUB/page1.xhtml") == source.read("EPUB/page1.xhtml")
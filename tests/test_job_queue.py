@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.sqlite3", workers=0, handlers={})
+
+
+def test_enqueue_without_replace_keeps_the_queued_job(queue):
+    (job, created) = queue.enqueue("merge", "Série/Volume 1", {"n": 1}, delay=60)
+    (same, created_again) = queue.enqueue("merge", "Série/Volume 1", {"n": 2}, delay=60)
+    assert (created, created_again) == (True, False)
+    assert (same.id, same.payload, same.run_at) == (job.id, {"n": 1}, job.run_at)
+
+
+def test_replace_debounces(queue):
+    (job, _) = queue.enqueue("merge", "Série/Volume 1", {"n": 1}, delay=10, replace=True)
+    time.sleep(0.01)
+    (debounced, created) = queue.enqueue("merge", "Série/Volume 1", {"n": 2}, priority=5, delay=10, replace=True)
+    assert not created
+    assert debounced.id == job.id
+    assert debounced.payload == {"n": 2}
+    assert debounced.priority == 5
+    assert debounced.run_at > job.run_at
+    assert [other.id for other in queue.list()] == [job.id]
+
+
+def test_max_delay_caps_debounce(queue):
+    (job, _) = queue.enqueue("merge", "Série/Volume 1", {}, delay=10, replace=True, max_delay=30)
+    assert job.run_at == pytest.approx(job.created_at + 10)
+    (debounced, _) = queue.enqueue("merge", "Série/Volume 1", {}, delay=60, replace=True, max_delay=30)
+    assert debounced.run_at == pytest.approx(job.created_at + 30)
+
+    (other, _) = queue.enqueue("merge", "Série/Volume 2", {}, delay=60, replace=True, max_delay=30)
+    assert other.run_at == pytest.approx(other.created_at + 30)
+
+
+def test_keys_are_independent(queue):
+    queue.enqueue("merge", "Série/Volume 1", {}, delay=10, replace=True)
+    (job, created) = queue.enqueue("merge", "Série/Volume 2", {}, delay=10, replace=True)
+    assert created
+    assert len(queue.list()) == 2
+
+
+def test_coalesced_jobs_run_once_with_the_last_payload(tmp_path):
+    runs = []
+    done = threading.Event()
+
+    def merge(job, progress):
+        runs.append(job.payload)
+        done.set()
+
+    queue = JobQueue(tmp_path / "jobs.sqlite3", workers=1, handlers={"merge": merge}, poll_interval=0.05)
+    queue.start()
+    for n in range(5):
+        queue.enqueue("merge", "Série/Volume 1", {"n": n}, delay=0.3, replace=True, max_delay=2)
+    assert done.wait(timeout=5)
+    time.sleep(0.1)
+    assert runs == [{"n": 4}]
+    assert queue.get("Série/Volume 1").status == "done"
+
+
+def test_replace_while_running_schedules_after(tmp_path):
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def merge(job, progress):
+        runs.append(job.payload)
+        started.set()
+        release.wait(timeout=5)
+
+    queue = JobQueue(tmp_path / "jobs.sqlite3", workers=2, handlers={"merge": merge}, poll_interval=0.05)
+    queue.start()
+    queue.enqueue("merge", "Série/Volume 1", {"n": 1}, replace=True)
+    assert started.wait(timeout=5)
+    (job, created) = queue.enqueue("merge", "Série/Volume 1", {"n": 2}, replace=True)
+    assert created
+    # Même clé : le second worker attend la fin de la tâche en cours
+    time.sleep(0.2)
+    assert runs == [{"n": 1}]
+    release.set()
+    deadline = time.time() + 5
+    while queue.get("Série/Volume 1").status != "done" or len(runs) < 2:
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert runs == [{"n": 1}, {"n": 2}]
+
+
+def test_secrets_are_kept_apart_and_deleted(tmp_path):
+    db_path = tmp_path / "jobs.sqlite3"
+    queue = JobQueue(db_path, workers=0, handlers={})
+    (job, _) = queue.enqueue("dump", "Série/Volume 1", {"n": 1}, secrets={"token": "jeton-secret"})
+    assert job.secrets is None
+    assert "jeton-secret" not in repr(job.payload) + repr(job.to_json())
+    queue._db.close()
+
+    # Reprise après redémarrage, par un autre processus que celui qui a ajouté la tâche
+    secrets = []
+    done = threading.Event()
+
+    def dump(job, progress):
+        secrets.append(job.secrets)
+        done.set()
+
+    queue = JobQueue(db_path, workers=1, handlers={"dump": dump}, poll_interval=0.05)
+    queue.start()
+    assert done.wait(timeout=5)
+    deadline = time.time() + 5
+    while queue.get("Série/Volume 1").status != "done":
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert secrets == [{"token": "jeton-secret"}]
+    assert queue._db.execute("SELECT COUNT(*) FROM job_secrets").fetchone()[0] == 0
+    queue._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    assert b"jeton-secret" not in db_path.read_bytes()
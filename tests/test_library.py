@@ -0,0 +1,45 @@
+import pytest
+
+from chapter_index import record_chapter
+from library import LibraryIndex
+
+
+def metadata(number: int) -> dict:
+    return {"title": f"Chapitre {number}", "lang": "fr", "creators": [{"name": "Auteur", "role": "aut"}],
+            "collections": [{"name": "Épées et magie", "number": f"1.{number}", "type": "series"}]}
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "results"
+    volume = root / "Épées et magie" / "Volume 1"
+    volume.mkdir(parents=True)
+    library = LibraryIndex(root, tmp_path / "data" / "library.sqlite3")
+    for number in [1, 2, 3]:
+        file_path = volume / f"Chapitre {number}.epub"
+        file_path.write_bytes(b"epub")
+        record_chapter(file_path, metadata(number))
+        library.record(file_path, metadata(number), "chapter")
+    return library
+
+
+def test_catalog_and_search(library):
+    (entries, total) = library.catalog("chapter")
+    assert total == 3
+    assert [entry.title for entry in entries] == ["Chapitre 1", "Chapitre 2", "Chapitre 3"]
+    (entries, total) = library.search("epees chap", "chapter")
+    assert total == 3
+    assert library.search("volume", "volume") == ([], 0)
+
+
+def test_deleted_files_are_dropped(library):
+    (library.root / "Épées et magie" / "Volume 1" / "Chapitre 2.epub").unlink()
+    (entries, total) = library.search("magie")
+    assert (total, len(entries)) == (2, 2)
+    (entries, total) = library.catalog()
+    assert [entry.title for entry in entries] == ["Chapitre 1", "Chapitre 3"]
+    assert total == 2
+
+    (library.root / "Épées et magie" / "Volume 1" / "Chapitre 3.epub").unlink()
+    assert library.rebuild() == 1
+    assert [entry.title for entry in library.catalog()[0]] == ["Chapitre 1"]
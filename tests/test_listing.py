@@ -0,0 +1,34 @@
+import os
+from urllib.parse import quote
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def files(server, tmp_path_factory):
+    volume = server.EPUB_ROOT_FOLDER / "Série" / "Volume 1"
+    volume.mkdir(parents=True, exist_ok=True)
+    (volume / "Chapitre 1.epub").write_bytes(b"epub")
+    (volume / ".Volume 1.merge.json").write_text("{}")
+    outside = tmp_path_factory.mktemp("outside") / "secret.txt"
+    outside.write_text("secret")
+    os.symlink(outside, server.EPUB_ROOT_FOLDER / "Série" / "lien.txt")
+    return outside
+
+
+def test_serves_files_and_folders(client, files):
+    assert client.get("/Série/Volume 1/Chapitre 1.epub").data == b"epub"
+    assert client.get("/Série/Volume 1").status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/Série/Volume 1/.Volume 1.merge.json", "/Série/%2EVolume 1.merge.json",
+                                  "/Série/Volume 1/%2E%2E/%2E%2E/%2E%2E/etc/hostname"])
+def test_hidden_paths(client, files, path):
+    assert client.get(path).status_code == 404
+
+
+def test_paths_outside_the_root(client, files):
+    # Flask décode `%252F` en `%2F` : le chemin ne doit pas être décodé une seconde fois
+    assert client.get("/" + quote(quote(str(files), safe=""), safe="")).status_code == 404
+    assert client.get("/" + quote(str(files)).replace("/", "%2F")).status_code == 404
+    assert client.get("/Série/lien.txt").status_code == 404
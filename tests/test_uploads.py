@@ -0,0 +1,114 @@
+import io
+import json
+import zipfile
+
+import pytest
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+from uploads import ChapterUpload, iter_parts
+
+BOUNDARY = b"----chapitre"
+
+
+def multipart(*parts) -> bytes:
+    """Corps multipart/form-data : `parts` de (nom, nom de fichier, type, contenu)."""
+    body = b""
+    for (name, filename, content_type, content) in parts:
+        body += (b"--" + BOUNDARY + b"\r\n"
+                 + f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode()
+                 + f"Content-Type: {content_type}\r\n\r\n".encode() + content + b"\r\n")
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+
+def test_parts_are_read_in_chunks():
+    body = multipart(("metadata", "metadata.json", "application/json", b'{"title": "Chapitre 1"}'),
+                     ("image", "1.png", "image/png", b"\x89PNG" * 1000),
+                     ("chapter", "chapter.html", "text/html", b"<p>texte</p>"))
+    parts = []
+    for part in iter_parts(io.BytesIO(body), BOUNDARY, chunk_size=64):
+        # L'image n'est pas lue : elle est ignorée au passage à la partie suivante
+        parts.append((part.filename, part.content_type, part.read(1024) if part.filename != "1.png" else None))
+    assert parts == [("metadata.json", "application/json", b'{"title": "Chapitre 1"}'),
+                     ("1.png", "image/png", None),
+                     ("chapter.html", "text/html", b"<p>texte</p>")]
+
+
+def test_part_read_limit():
+    body = multipart(("chapter", "chapter.html", "text/html", b"x" * 1000))
+    part = next(iter_parts(io.BytesIO(body), BOUNDARY, chunk_size=64))
+    with pytest.raises(RequestEntityTooLarge) as error:
+        part.read(999)
+    assert error.value.code == 413
+
+    part = next(iter_parts(io.BytesIO(body), BOUNDARY, chunk_size=64))
+    assert part.read(1000) == b"x" * 1000
+
+
+def test_part_copy_limit():
+    body = multipart(("image", "1.png", "image/png", b"x" * 1000))
+    part = next(iter_parts(io.BytesIO(body), BOUNDARY, chunk_size=64))
+    with pytest.raises(RequestEntityTooLarge):
+        part.copy_to(io.BytesIO(), limit=500)
+
+    part = next(iter_parts(io.BytesIO(body), BOUNDARY, chunk_size=64))
+    target = io.BytesIO()
+    assert part.copy_to(target) == 1000
+    assert target.getvalue() == b"x" * 1000
+
+
+def test_truncated_body():
+    body = multipart(("chapter", "chapter.html", "text/html", b"x" * 1000))[:-200]
+    with pytest.raises(BadRequest):
+        for part in iter_parts(io.BytesIO(body), BOUNDARY, chunk_size=64):
+            part.read(2000)
+
+
+def test_chapter_upload(tmp_path):
+    file_path = tmp_path / "Chapitre 1.epub"
+    upload = ChapterUpload(file_path)
+    upload.add_image("../1.png", b"\x89PNG")
+    upload.add_image("1.png", b"ignored")
+    upload.commit({"title": "Chapitre 1", "creators": [], "collections": []}, "<p>texte</p>", b"\x89PNG")
+    assert [path.name for path in tmp_path.iterdir()] == ["Chapitre 1.epub"]
+    with zipfile.ZipFile(file_path) as archive:
+        assert archive.read("EPUB/images/1.png") == b"\x89PNG"
+        assert "<p>texte</p>" in archive.read("EPUB/page1.xhtml").decode()
+
+    upload = ChapterUpload(tmp_path / "Chapitre 2.epub")
+    upload.add_image("1.png", b"\x89PNG")
+    upload.discard()
+    assert [path.name for path in tmp_path.iterdir()] == ["Chapitre 1.epub"]
+
+
+def post_chapter(client, *parts):
+    return client.post("/", data=multipart(*parts),
+                       content_type=f"multipart/form-data; boundary={BOUNDARY.decode()}")
+
+
+METADATA = json.dumps({"title": "Chapitre 1", "creators": [{"name": "Auteur", "role": "aut"}], "lang": "fr",
+                       "collections": [{"name": "Série", "number": "1.1", "type": "series"}]}).encode()
+
+
+def test_build_epub_part_too_large(client):
+    response = post_chapter(client, ("metadata", "metadata.json", "application/json", METADATA),
+                            ("chapter", "chapter.html", "text/html", b"x" * 2000))
+    assert response.status_code == 413
+
+
+def test_build_epub_request_too_large(client):
+    response = post_chapter(client, ("metadata", "metadata.json", "application/json", METADATA),
+                            ("image", "1.png", "image/png", b"x" * 5000))
+    assert response.status_code == 413
+
+
+def test_build_epub(client, server):
+    metadata = json.dumps({**json.loads(METADATA), "title": "Chapitre 2"}).encode()
+    parts = [("image", "1.png", "image/png", b"\x89PNG image"),
+             ("metadata", "metadata.json", "application/json", metadata),
+             ("chapter", "chapter.html", "text/html", b'<p>texte</p><img src="images/1.png"/>')]
+    assert post_chapter(client, *parts).status_code == 202
+    (file_path,) = server.EPUB_ROOT_FOLDER.glob("**/Chapitre 2.epub")
+    with zipfile.ZipFile(file_path) as archive:
+        assert archive.read("EPUB/images/1.png") == b"\x89PNG image"
+        assert "covers/cover.png" in [name[len("EPUB/"):] for name in archive.namelist()]
+    assert post_chapter(client, *parts).status_code == 208
@@ -0,0 +1,26 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from workers import BoundedProcessPool
+
+
+def test_inline_without_workers():
+    pool = BoundedProcessPool(0, 1)
+    assert pool.run(abs, -3) == 3
+    with pytest.raises(ZeroDivisionError):
+        pool.run(divmod, 1, 0)
+
+
+def test_broken_pool_is_replaced():
+    pool = BoundedProcessPool(1, 2)
+    try:
+        assert pool.run(abs, -2) == 2
+        # La tâche tue son processus à chaque essai : l'erreur remonte, mais le pool est remplacé
+        with pytest.raises(BrokenProcessPool):
+            pool.run(os._exit, 1)
+        assert pool.run(abs, -3) == 3
+        assert pool.in_flight == 0
+    finally:
+        pool.shutdown()
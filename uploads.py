@@ -0,0 +1,147 @@
+import mimetypes
+import os
+import posixpath
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, List, Optional, Union
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from epub_writer import CompressionPolicy, EpubWriter
+
+
+class UploadPart:
+    """Partie d'un corps multipart, dont le contenu est lu par morceaux avec `chunks()`."""
+
+    def __init__(self, name: str, filename: Optional[str], content_type: Optional[str], chunks: Callable[[], Iterator[bytes]]):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.chunks = chunks
+
+    def read(self, limit: int) -> bytes:
+        """Contenu complet de la partie, refusé (413) au-delà de `limit` octets."""
+        content = bytearray()
+        for chunk in self.chunks():
+            content += chunk
+            if len(content) > limit:
+                raise RequestEntityTooLarge(f"'{self.filename or self.name}' dépasse {limit} octets")
+        return bytes(content)
+
+    def copy_to(self, target: BinaryIO, limit: Optional[int] = None) -> int:
+        size = 0
+        for chunk in self.chunks():
+            size += len(chunk)
+            if limit is not None and size > limit:
+                raise RequestEntityTooLarge(f"'{self.filename or self.name}' dépasse {limit} octets")
+            target.write(chunk)
+        return size
+
+
+def _events(stream: BinaryIO, boundary: bytes, chunk_size: int):
+    decoder = MultipartDecoder(boundary)
+    while True:
+        try:
+            event = decoder.next_event()
+        except ValueError as err:
+            raise BadRequest(f"Corps multipart invalide : {err}")
+        if isinstance(event, NeedData):
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk if chunk else None)
+            continue
+        yield event
+        if isinstance(event, Epilogue):
+            return
+
+
+def iter_parts(stream: BinaryIO, boundary: bytes, chunk_size: int = 64 * 1024) -> Iterator[UploadPart]:
+    """Parcourt un corps multipart/form-data au fil de sa lecture, sans le mettre en mémoire.
+
+    Le contenu d'une partie doit être lu (ou non) avant de passer à la suivante : ce qui
+    n'a pas été lu est ignoré.
+    """
+    events = _events(stream, boundary, chunk_size)
+    for event in events:
+        if isinstance(event, Epilogue):
+            return
+        if not isinstance(event, (Field, File)):
+            continue
+
+        state = {"done": False}
+
+        def chunks() -> Iterator[bytes]:
+            if state["done"]:
+                return
+            for data in events:
+                if not isinstance(data, Data):
+                    raise BadRequest("Corps multipart invalide")
+                if data.data:
+                    yield data.data
+                if not data.more_data:
+                    state["done"] = True
+                    return
+
+        yield UploadPart(event.name, event.filename if isinstance(event, File) else None,
+                         event.headers.get("Content-Type"), chunks)
+        for _ in chunks():
+            pass
+
+
+def drain(stream: BinaryIO, chunk_size: int = 64 * 1024):
+    """Lit et jette le reste du corps de la requête (sans le garder en mémoire)."""
+    while stream.read(chunk_size):
+        pass
+
+
+class ChapterUpload:
+    """EPUB de chapitre écrit au fil d'un envoi, dans un fichier caché renommé par `commit`.
+
+    Un envoi interrompu (ou `discard`) ne laisse donc jamais de chapitre incomplet.
+    """
+
+    def __init__(self, file_path: Path, compression: Optional[CompressionPolicy] = None):
+        self.file_path = Path(file_path)
+        self.tmp_path = self.file_path.with_name(
+            f".{self.file_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self.writer: Optional[EpubWriter] = EpubWriter(self.tmp_path, compression)
+        self.image_hrefs: List[str] = []
+
+    def add_image(self, filename: str, source: Union[UploadPart, BinaryIO, bytes]):
+        """Ajoute l'image `images/<filename>`, copiée par morceaux depuis une partie ou un fichier."""
+        href = f"images/{os.path.basename(filename)}"
+        if self.writer.has(href):
+            return
+        if isinstance(source, UploadPart):
+            with self.writer.open(href) as target:
+                source.copy_to(target)
+        else:
+            self.writer.write(href, source)
+        self.image_hrefs.append(href)
+
+    def commit(self, metadata: dict, chapter_content: str, cover_content: Optional[bytes], stylesheet: Optional[str] = None):
+        """Termine l'EPUB (couverture, feuille de style, page, OPF) et le met à sa place définitive."""
+        lang = metadata.get("lang") or "en"
+        if cover_content is not None:
+            self.writer.write("covers/cover.png", cover_content)
+            self.writer.set_cover("covers/cover.png", "image/png")
+        if stylesheet is not None:
+            self.writer.write("css/style.css", stylesheet.encode("utf-8"))
+            self.writer.add_item("style", "css/style.css", "text/css")
+        self.writer.add_page("page-1", "page1.xhtml", metadata["title"], chapter_content, lang,
+                             stylesheet="css/style.css" if stylesheet is not None else None)
+        for href in self.image_hrefs:
+            self.writer.add_item(f"image-{posixpath.basename(href)}", href,
+                                 mimetypes.guess_type(href)[0] or "image/png")
+        self.writer.close({**metadata, "lang": lang}, cover_page=False, visible_toc=False)
+        self.writer = None
+        os.replace(self.tmp_path, self.file_path)
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.archive.close()
+            self.writer = None
+            try:
+                os.unlink(self.tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,97 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Optional
+
+
+class BoundedProcessPool:
+    """Pool de processus pour le travail CPU (images, désobfuscation, fusion).
+
+    Au plus `queue_size` tâches sont en attente ou en cours : au-delà, `submit` bloque
+    l'appelant (back-pressure) au lieu d'empiler du travail sans limite. Avec `workers=0`,
+    les tâches sont exécutées directement dans le thread appelant.
+
+    Les processus ne sont pas créés par fork du serveur (qui a déjà des threads, des
+    connexions SQLite...) mais depuis un serveur de fork ("forkserver", "spawn" à défaut),
+    qui importe une fois les modules `preload`. Un pool cassé par la mort d'un processus
+    est remplacé au prochain appel.
+    """
+
+    def __init__(self, workers: int, queue_size: int, preload: Iterable[str] = ()):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._preload = list(preload)
+        self.in_flight = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Création paresseuse : pas de processus au moment de l'import du serveur
+        with self._lock:
+            if self._executor is None:
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload(self._preload)
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """Abandonne un pool cassé : le prochain appel en crée un nouveau."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        print("Process pool broken (a worker died), starting a new one")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if self.workers <= 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+
+        self._slots.acquire()
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                self._discard(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_flight += 1
+        future.add_done_callback(lambda done: self._release(done, executor))
+        return future
+
+    def _release(self, future: Future, executor: ProcessPoolExecutor):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._discard(executor)
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Exécute `fn` dans le pool et attend son résultat.
+
+        Si le pool casse pendant la tâche, elle est relancée une fois dans un nouveau pool.
+        """
+        try:
+            return self.submit(fn, *args, **kwargs).result()
+        except BrokenProcessPool:
+            return self.submit(fn, *args, **kwargs).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None